@@ -1,8 +1,9 @@
-from .engine import PivotSettings, find_pivot_level
+from .engine import PivotSettings, find_pivot_level, required_bars
 
 __all__ = [
     "PivotSettings",
     "find_pivot_level",
+    "required_bars",
 ]
 
 
@@ -24,6 +24,11 @@ class PivotSettings:
     min_gap_percent: float = 0.008
 
 
+def required_bars(settings: PivotSettings) -> int:
+    """Bars find_pivot_level actually reads: the scan window from the end of the series."""
+    return int(settings.max_lookback_bars)
+
+
 def _find_last_pivot_high(df: pd.DataFrame, k: int) -> Optional[int]:
     if df is None or df.empty:
         return None
@@ -77,7 +82,7 @@ def find_pivot_level(
         return None
     k = int(max(1, settings.left_right_window))
     k_op = int(max(1, getattr(settings, "opposite_window", 5)))
-    use_df = df.iloc[-min(len(df), settings.max_lookback_bars):].copy()
+    use_df = df.iloc[-min(len(df), required_bars(settings)):].copy()
 
     if side == "short":
         # collect pivot highs from most recent backwards
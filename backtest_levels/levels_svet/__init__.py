@@ -3,13 +3,14 @@ from .api import (
 	analyze_attack_defense_for_zone,
 	pick_best_zone,
 )
-from .config import Settings
+from .config import Settings, required_bars
 
 __all__ = [
 	"find_level_zones_with_quality",
 	"analyze_attack_defense_for_zone",
 	"pick_best_zone",
 	"Settings",
+	"required_bars",
 ]
 
 
@@ -18,6 +18,8 @@ def pick_best_zone(df: pd.DataFrame, zones: List[Dict[str, Any]]) -> Dict[str, A
 
 
 def find_level_zones_with_quality(df: pd.DataFrame, side: str, settings: Settings = Settings()) -> List[Dict[str, Any]]:
+	if settings.lookback_bars is not None:
+		df = df.tail(settings.lookback_bars)
 	zones = find_level_zones(df, side, settings)
 	res: List[Dict[str, Any]] = []
 	for z in zones:
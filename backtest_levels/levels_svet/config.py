@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -10,6 +11,14 @@ class Settings:
 	zone_half_atr: float = 0.5
 	# Окно последних свечей для оценки атаки
 	attack_window: int = 5
+	# Окно истории для поиска зон. Свинги ищутся по всей переданной истории, поэтому
+	# по умолчанию (None) история не обрезается — результаты бэктеста как в исходном движке
+	lookback_bars: Optional[int] = None
+
+
+def required_bars(settings: Settings = Settings()) -> Optional[int]:
+	"""Сколько последних баров читает find_level_zones_with_quality (None — всю историю)."""
+	return settings.lookback_bars
 
 
 
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from typing import List, Tuple
+import numpy as np
 import pandas as pd
 from .atr import atr_sma
 from .config import Settings
@@ -15,22 +16,25 @@ class LevelZone:
 	strength_positional: bool  # прошла ли свеча позиционный фильтр
 
 
+def _strict_swings(values, find_min: bool) -> List[float]:
+	# Строгий экстремум относительно двух баров с каждой стороны (сравнения со сдвигами массива)
+	x = np.asarray(values, dtype=float)
+	n = len(x)
+	if n < 5:
+		return []
+	mid = x[2:n - 2]
+	mask = np.ones(n - 4, dtype=bool)
+	for lo, hi in ((0, n - 4), (1, n - 3), (3, n - 1), (4, n)):
+		mask &= (mid < x[lo:hi]) if find_min else (mid > x[lo:hi])
+	return mid[mask].tolist()
+
+
 def _swing_lows(df: pd.DataFrame) -> List[float]:
-	vals: List[float] = []
-	low = df["low"].values
-	for i in range(2, len(low) - 2):
-		if low[i] < low[i-2] and low[i] < low[i-1] and low[i] < low[i+1] and low[i] < low[i+2]:
-			vals.append(float(low[i]))
-	return vals
+	return _strict_swings(df["low"].values, find_min=True)
 
 
 def _swing_highs(df: pd.DataFrame) -> List[float]:
-	vals: List[float] = []
-	high = df["high"].values
-	for i in range(2, len(high) - 2):
-		if high[i] > high[i-2] and high[i] > high[i-1] and high[i] > high[i+1] and high[i] > high[i+2]:
-			vals.append(float(high[i]))
-	return vals
+	return _strict_swings(df["high"].values, find_min=False)
 
 
 def find_level_zones(df: pd.DataFrame, side: str, settings: Settings = Settings()) -> List[LevelZone]:
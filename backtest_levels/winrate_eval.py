@@ -122,7 +122,8 @@ async def eval_symbol(symbol: str, months: List[str]) -> Dict[str, Any]:
 				"close": float(x.close),
 				"volume": float(x.volume),
 			} for _, x in df.iterrows()]
-		c30_list = to_list(c30)
+		# Пивоты/VWAP читают только прошлые и текущие сутки — не больше 96 баров 30m
+		c30_list = to_list(c30.tail(96))
 		day = dt.date(); prev_day = day - timedelta(days=1)
 		c30_today = [r for r in c30_list if datetime.fromisoformat(r["t"]).date() == day]
 		vwap_val = session_vwap(c30_today) if c30_today else None
@@ -0,0 +1,10 @@
+"""
+Микробенчмарки сервиса intraday-levels-taapi.
+
+Замеры времени не входят в tests/ (pre-commit гоняет pytest, а на нагруженной машине
+отношения времён нестабильны) — здесь они только печатаются. Запуск из корня репозитория:
+
+    PYTHONPATH=intraday-levels-taapi python -m benchmarks.<имя>
+
+Эталонные циклические реализации берутся из tests/ — там же проверяется совпадение результатов.
+"""
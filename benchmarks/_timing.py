@@ -0,0 +1,12 @@
+import time
+from typing import Callable
+
+
+def best(fn: Callable[[], object], repeat: int = 5, clock: Callable[[], float] = time.perf_counter) -> float:
+    """Лучшее из repeat измерений fn, в секундах."""
+    times = []
+    for _ in range(repeat):
+        t0 = clock()
+        fn()
+        times.append(clock() - t0)
+    return min(times)
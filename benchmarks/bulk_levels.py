@@ -0,0 +1,18 @@
+"""Сила уровней на 3000 уровнях: подсчёт по одному уровню против векторного."""
+import numpy as np
+
+from app.services.taapi_bulk import level_strengths
+
+from benchmarks._timing import best
+from tests.test_bulk_levels import _series
+
+
+def main() -> None:
+    c = _series(3000, 1)
+    vec_s = best(lambda: level_strengths(c.high, np.arange(len(c))), repeat=3)
+    loop_s = best(lambda: [np.count_nonzero(np.abs(c.high - p) <= p * 0.001) for p in c.high], repeat=3)
+    print(f"level strength, 3000 levels: per-level {loop_s * 1e3:.1f} ms, vectorized {vec_s * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Задержка event loop при расчётах уровней: inline против пула потоков."""
+import asyncio
+import time
+
+from app.services.executor import ComputeExecutor
+from app.services.levels import compute_candidates
+
+from tests.test_executor import _candles
+
+
+def _level_job(repeat=40):
+    """CPU-нагрузка уровня запроса: многократный compute_candidates без ATR (много кандидатов)."""
+    c5, c15, c30, c1h = (_candles(600, 300_000, 1), _candles(400, 900_000, 2),
+                         _candles(400, 1_800_000, 3), _candles(200, 3_600_000, 4))
+    session = {"pivots_daily": {}, "PDH": None, "PDL": None, "vwap_session": None}
+    out = None
+    for _ in range(repeat):
+        out = compute_candidates(c5, c15, c30, c1h, None, session, 1e-6, {"atr": 0.0}, "long", True)
+    return len(out)
+
+
+async def _max_loop_lag(executor, jobs=4):
+    """Максимальная задержка тика event loop, пока jobs расчётов идут через executor."""
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - t0 - 0.005)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.02)
+    await asyncio.gather(*(executor.run(_level_job) for _ in range(jobs)))
+    done.set()
+    await tick
+    return max(lags)
+
+
+def main() -> None:
+    inline, threads = ComputeExecutor("inline"), ComputeExecutor("thread", workers=2)
+    try:
+        before = asyncio.run(_max_loop_lag(inline))
+        after = asyncio.run(_max_loop_lag(threads))
+    finally:
+        threads.shutdown()
+    print(f"max event-loop lag: inline {before * 1000:.1f} ms, thread pool {after * 1000:.1f} ms "
+          f"(one job {inline.get_stats()['avg_compute_ms']:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Ответ bulk на 500 символов: jsonable_encoder против быстрой сериализации и потока NDJSON."""
+import json
+import time
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+
+from app.models import APIResponse
+from app.services.fast_json import api_payload, candles_payload, dumps
+
+from tests.test_fast_json import _candles
+
+
+def _measure(fn):
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    # 20 свечей — максимум одного bulk construct'а TAAPI
+    data = {f"S{i}USDT": {tf: _candles(20, i * 2 + k) for k, tf in enumerate(("1h", "4h"))} for i in range(500)}
+
+    def default_path():
+        # Как FastAPI отдаёт APIResponse: jsonable_encoder по всему ответу, затем json.dumps
+        body = APIResponse(success=True, data={"data": {
+            sym: {tf: c.to_records() for tf, c in by_tf.items()} for sym, by_tf in data.items()}})
+        return json.dumps(jsonable_encoder(body), ensure_ascii=False).encode("utf-8")
+
+    def fast_path():
+        return dumps(api_payload(True, {"data": {
+            sym: {tf: candles_payload(c) for tf, c in by_tf.items()} for sym, by_tf in data.items()}}))
+
+    def streamed(fmt):
+        def run():
+            size = 0
+            for sym, by_tf in data.items():
+                for tf, c in by_tf.items():
+                    size += len(dumps({"symbol": sym, "interval": tf, "candles": candles_payload(c, fmt)}) + b"\n")
+            return size
+        return run
+
+    rows = [("default (jsonable_encoder)", default_path), ("fast json", fast_path),
+            ("ndjson stream, records", streamed("records")), ("ndjson stream, columnar", streamed("columnar"))]
+    print("500 symbols x 2 TF x 20 candles:")
+    for name, fn in rows:
+        elapsed, peak = _measure(fn)
+        print(f"  {name:28s} {elapsed * 1e3:8.1f} ms  peak {peak / 2**20:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""Набор индикаторов пакета для всего списка символов (2000 баров 30m на символ)."""
+import time
+
+import numpy as np
+
+from app.config import SYMBOLS
+from app.services.candles import Candles
+from app.services.indicators import pack_indicators
+
+from tests.test_indicators import _series
+
+
+def main() -> None:
+    h, l, c, v = _series(n=2000)
+    candles = Candles.from_arrays(np.arange(2000) * 1_800_000, c, h, l, c, v)
+    pack_indicators(candles)
+    started = time.perf_counter()
+    for _ in SYMBOLS:
+        pack_indicators(candles)
+    elapsed = time.perf_counter() - started
+    per_symbol_ms = elapsed / len(SYMBOLS) * 1000
+    print(f"pack_indicators: {len(SYMBOLS)} symbols in {elapsed:.3f}s ({per_symbol_ms:.2f} ms/symbol)")
+
+
+if __name__ == "__main__":
+    main()
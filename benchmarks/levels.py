@@ -0,0 +1,23 @@
+"""CPU на запрос поиска уровней в зависимости от числа кандидатов: циклы против массивов."""
+import time
+
+from app.services.levels import compute_candidates
+
+from benchmarks._timing import best
+from tests.test_levels import _inputs, _ref_compute_candidates
+
+
+def main() -> None:
+    print("candidates  loop ms  arrays ms")
+    for n5 in (300, 1200, 4800):
+        c5, c15, c30, c1h, session, ind = _inputs(7, n5)
+        # Маленький тик и нулевой ATR — много кластеров-кандидатов
+        args = (c5, c15, c30, c1h, None, session, 1e-6, {**ind, "atr": 0.0}, "long", True)
+        n_cand = len(compute_candidates(*args))
+        ref_s = best(lambda: _ref_compute_candidates(*args), repeat=3, clock=time.process_time)
+        new_s = best(lambda: compute_candidates(*args), repeat=3, clock=time.process_time)
+        print(f"{n_cand:10d}  {ref_s * 1e3:7.2f}  {new_s * 1e3:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
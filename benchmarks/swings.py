@@ -0,0 +1,17 @@
+"""Поиск свингов на 2000 барах: прежний цикл против векторной версии."""
+from app.services.swings import find_swings
+
+from benchmarks._timing import best
+from tests.test_swings import _loop_swing_points, _series
+
+
+def main() -> None:
+    c = _series(2000, 42, decimals=2)
+    hs, ls = c.high.tolist(), c.low.tolist()
+    loop_s = best(lambda: _loop_swing_points(hs, ls, 5, 5))
+    vec_s = best(lambda: find_swings(c, 5, 5))
+    print(f"swing detection, 2000 bars, w=5: loop {loop_s * 1e3:.2f} ms, vectorized {vec_s * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
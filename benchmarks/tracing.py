@@ -0,0 +1,19 @@
+"""Стоимость одного спана трассировки запроса."""
+import time
+
+from app.services.tracing import request_trace, span, tracer
+
+
+def main(n: int = 20000) -> None:
+    with request_trace("overhead"):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            with span("x"):
+                pass
+        elapsed = time.perf_counter() - t0
+    tracer.reset()
+    print(f"span overhead: {elapsed / n * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,13 @@ except Exception:
 
 load_dotenv()
 
+# Общий регулятор запросов к TAAPI/Binance из сервиса intraday-levels-taapi (на процесс);
+# пакет `app` сервиса — в PYTHONPATH (см. start_trading_system.sh, docker-compose.yml)
+try:
+    from app.services.rate_governor import governor as rate_governor
+except Exception:  # сервис не установлен рядом — работаем без регулятора
+    rate_governor = None
+
 TAAPI_KEY = os.getenv("TAAPI_KEY", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
@@ -103,10 +110,15 @@ async def _get_with_retry(url: str, params: Dict[str, Any], timeout: float = 10.
     backoff = 0.5
     for attempt in range(3):
         try:
+            bucket = await rate_governor.acquire("GET", url, params=params) if rate_governor else None
             async with httpx.AsyncClient(timeout=timeout) as client:
                 r = await client.get(url, params=params)
+                if rate_governor:
+                    rate_governor.observe(bucket, r)
                 if r.status_code == 200:
                     return r.json()
+                if r.status_code == 429 and bucket is not None:
+                    continue
         except Exception:
             pass
         await asyncio.sleep(backoff + random.random() * 0.25)
@@ -8,6 +8,18 @@ import json
 import httpx
 import logging
 
+# Общий регулятор запросов к TAAPI/Binance из сервиса intraday-levels-taapi (на процесс);
+# пакет `app` сервиса — в PYTHONPATH (см. start_trading_system.sh, docker-compose.yml)
+try:
+    from app.services.rate_governor import governor as rate_governor
+except Exception:  # сервис не установлен рядом — работаем без регулятора
+    rate_governor = None
+try:
+    from app.services.candles import Candles
+    from app.services.indicators import taapi_value as local_indicator
+except Exception:
+    local_indicator = None
+
 # === CONFIG ===
 TAAPI_KEY = os.getenv("TAAPI_KEY", "")
 TAAPI_BASE = "https://api.taapi.io"
@@ -34,6 +46,13 @@ _TAAPI_TTL_SEC = int(os.getenv("TAAPI_CACHE_TTL", "300"))  # 5 minutes default
 _cache_hits = 0
 _cache_misses = 0
 
+# INDICATORS_SOURCE=local: индикаторы считаются по свечам Binance Futures (одна загрузка
+# свечей на символ/ТФ вместо отдельного запроса к TAAPI на каждый индикатор)
+INDICATORS_SOURCE = os.getenv("INDICATORS_SOURCE", "taapi")
+_KLINES_TTL_SEC = int(os.getenv("LOCAL_KLINES_TTL", "60"))
+_KLINES_LIMIT = 499  # weight 2 у /fapi/v1/klines, хватает для EMA200
+_KLINES_CACHE: dict[tuple[str, str], tuple[float, asyncio.Task]] = {}
+
 def _rough_rr(direction: str, entry: float | None, sl: float | None, tp: float | None) -> float | None:
     try:
         if None in (entry, sl, tp):
@@ -97,9 +116,14 @@ def compute_fallback_score(llm_payload: dict) -> int:
 async def _aget_json(client: httpx.AsyncClient, url: str, params: dict, retries: int = RETRIES) -> dict | None:
     for i in range(retries):
         try:
+            bucket = await rate_governor.acquire("GET", url, params=params) if rate_governor else None
             r = await client.get(url, params=params)
+            if rate_governor:
+                rate_governor.observe(bucket, r)
             if r.status_code == 429:
-                await asyncio.sleep(0.7 * (2**i) + random.random())
+                # при регуляторе паузу по Retry-After выдержит следующий acquire
+                if bucket is None:
+                    await asyncio.sleep(0.7 * (2**i) + random.random())
                 continue
             if r.status_code >= 500:
                 await asyncio.sleep(0.5 * (2**i) + random.random())
@@ -208,8 +232,9 @@ async def taapi_get(
     """Fetch TAAPI indicator with simple TTL cache.
     If use_cache_only=True, return cached value or None (no network).
     """
+    local = INDICATORS_SOURCE == "local" and local_indicator is not None
     secret = _get_taapi_key()
-    if not secret:
+    if not secret and not local:
         return None
     params = {"secret": secret, "exchange": TAAPI_EXCHANGE, "symbol": symbol_slash, "interval": interval}
     if extra:
@@ -229,7 +254,9 @@ async def taapi_get(
     except Exception:
         pass
 
-    data = await _aget_json(client, f"{TAAPI_BASE}/{ind}", params)
+    data = await _local_taapi(client, ind, symbol_slash, interval, extra) if local else None
+    if data is None and secret:
+        data = await _aget_json(client, f"{TAAPI_BASE}/{ind}", params)
     try:
         _TAAPI_CACHE[key] = {"ts": time.time(), "data": data}
         if (_cache_hits + _cache_misses) % 50 == 0:
@@ -238,6 +265,38 @@ async def taapi_get(
         pass
     return data
 
+async def _binance_candles(client: httpx.AsyncClient, symbol_usdt: str, interval: str) -> "Candles | None":
+    """Свечи Binance Futures; одновременные запросы одного символа/ТФ ждут одну загрузку."""
+    key = (symbol_usdt, interval)
+    now = time.time()
+    rec = _KLINES_CACHE.get(key)
+    if rec is None or now - rec[0] >= _KLINES_TTL_SEC:
+        async def load():
+            rows = await _aget_json(client, f"{BINANCE_FUT}/fapi/v1/klines",
+                                    {"symbol": symbol_usdt, "interval": interval, "limit": _KLINES_LIMIT})
+            return Candles.from_binance_klines(rows) if isinstance(rows, list) and rows else None
+        rec = (now, asyncio.ensure_future(load()))
+        _KLINES_CACHE[key] = rec
+    try:
+        candles = await asyncio.shield(rec[1])
+    except Exception:
+        candles = None
+    if candles is None:
+        _KLINES_CACHE.pop(key, None)
+    return candles
+
+async def _local_taapi(client: httpx.AsyncClient, ind: str, symbol_slash: str, interval: str,
+                       extra: dict | None) -> dict | None:
+    """Ответ в формате TAAPI, посчитанный локально; None — посчитать не удалось."""
+    candles = await _binance_candles(client, symbol_slash.replace("/", ""), interval)
+    if candles is None:
+        return None
+    try:
+        return local_indicator(ind, candles, extra)
+    except Exception as e:
+        logger.warning("[LOCAL_IND] %s %s %s failed: %s", ind, symbol_slash, interval, e)
+        return None
+
 async def fetch_taapi_bundle(symbol_usdt: str, skip_heavy_tf: bool = False) -> dict:
     # параллельные запросы (4h/12h)
     base = symbol_usdt.upper()
@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения из текущего каталога и из intraday-levels-taapi/.env
@@ -14,6 +15,9 @@ except Exception:
 # Taapi.io API
 TAAPI_KEY = os.getenv("TAAPI_KEY")
 TAAPI_BASE_URL = "https://api.taapi.io"
+# Лимиты bulk-запроса по тарифу: индикаторов в одном construct и construct'ов в одном POST /bulk
+TAAPI_BULK_MAX_INDICATORS = int(os.getenv("TAAPI_BULK_MAX_INDICATORS", "20"))
+TAAPI_BULK_MAX_CONSTRUCTS = int(os.getenv("TAAPI_BULK_MAX_CONSTRUCTS", "1"))
 
 # Настройки символов и таймфреймов
 SYMBOLS = os.getenv("SYMBOLS", "1000000BOBUSDT,1000000MOGUSDT,1000BONKUSDT,1000CATUSDT,1000CHEEMSUSDT,1000FLOKIUSDT,1000LUNCUSDT,1000PEPEUSDT,1000RATSUSDT,1000SATSUSDT,1000SHIBUSDT,1000WHYUSDT,1000XUSDT,1000XECUSDT,1INCHUSDT,1MBABYDOGEUSDT,AUSDT,A2ZUSDT,AAVEUSDT,ACAUSDT,ACEUSDT,ACHUSDT,ACMUSDT,ACTUSDT,ACXUSDT,ADAUSDT,ADXUSDT,AEROUSDT,AEURUSDT,AEVOUSDT,AGLDUSDT,AGTUSDT,AIUSDT,AI16ZUSDT,AINUSDT,AIOUSDT,AIOTUSDT,AIXBTUSDT,AKTUSDT,ALCHUSDT,ALCXUSDT,ALGOUSDT,ALICEUSDT,ALLUSDT,ALPINEUSDT,ALTUSDT,AMPUSDT,ANIMEUSDT,ANKRUSDT,APEUSDT,API3USDT,APTUSDT,ARUSDT,ARBUSDT,ARCUSDT,ARDRUSDT,ARIAUSDT,ARKUSDT,ARKMUSDT,ARPAUSDT,ASRUSDT,ASTRUSDT,ATAUSDT,ATHUSDT,ATMUSDT,ATOMUSDT,AUCTIONUSDT,AVAUSDT,AVAAIUSDT,AVAXUSDT,AVNTUSDT,AWEUSDT,AXLUSDT,AXSUSDT,BUSDT,B2USDT,B3USDT,BABYUSDT,BAKEUSDT,BANUSDT,BANANAUSDT,BANANAS31USDT,BANDUSDT,BANKUSDT,BARUSDT,BASUSDT,BATUSDT,BBUSDT,BCHUSDT,BDXNUSDT,BEAMXUSDT,BELUSDT,BERAUSDT,BFUSDUSDT,BICOUSDT,BIDUSDT,BIFIUSDT,BIGTIMEUSDT,BIOUSDT,BLURUSDT,BMTUSDT,BNBUSDT,BNSOLUSDT,BNTUSDT,BOMEUSDT,BONKUSDT,BRUSDT,BRETTUSDT,BROCCOLI714USDT,BROCCOLIF3BUSDT,BSVUSDT,BTCUSDT,BTCDOMUSDT,BTRUSDT,BULLAUSDT,CUSDT,C98USDT,CAKEUSDT,CARVUSDT,CATIUSDT,CELOUSDT,CELRUSDT,CETUSUSDT,CFXUSDT,CGPTUSDT,CHESSUSDT,CHILLGUYUSDT,CHRUSDT,CHZUSDT,CITYUSDT,CKBUSDT,COMPUSDT,COOKIEUSDT,COSUSDT,COTIUSDT,COWUSDT,CROSSUSDT,CRVUSDT,CTKUSDT,CTSIUSDT,CUDISUSDT,CYBERUSDT,DUSDT,DAMUSDT,DASHUSDT,DATAUSDT,DCRUSDT,DEEPUSDT,DEGENUSDT,DEGOUSDT,DENTUSDT,DEXEUSDT,DFUSDT,DIAUSDT,DMCUSDT,DODOXUSDT,DOGEUSDT,DOGSUSDT,DOLOUSDT,DOODUSDT,DOTUSDT,DRIFTUSDT,DUSKUSDT,DYDXUSDT,DYMUSDT,EDUUSDT,EGLDUSDT,EIGENUSDT,ENAUSDT,ENJUSDT,ENSUSDT,EPICUSDT,EPTUSDT,ERAUSDT,ESPORTSUSDT,ETCUSDT,ETHUSDT,ETHFIUSDT,ETHWUSDT,EURIUSDT,FUSDT,FARMUSDT,FARTCOINUSDT,FDUSDUSDT,FETUSDT,FHEUSDT,FIDAUSDT,FILUSDT,FIOUSDT,FISUSDT,FLMUSDT,FLOCKUSDT,FLOKIUSDT,FLOWUSDT,FLUXUSDT,FORMUSDT,FORTHUSDT,FUNUSDT,FXSUSDT,GUSDT,GALAUSDT,GASUSDT,GHSTUSDT,GLMUSDT,GMTUSDT,GMXUSDT,GNOUSDT,GNSUSDT,GOATUSDT,GPSUSDT,GRASSUSDT,GRIFFAINUSDT,GRTUSDT,GTCUSDT,GUNUSDT,HUSDT,HAEDALUSDT,HBARUSDT,HEIUSDT,HEMIUSDT,HFTUSDT,HIFIUSDT,HIGHUSDT,HIPPOUSDT,HIVEUSDT,HMSTRUSDT,HOLOUSDT,HOMEUSDT,HOOKUSDT,HOTUSDT,HUMAUSDT,HYPEUSDT,HYPERUSDT,ICNTUSDT,ICPUSDT,ICXUSDT,IDUSDT,IDOLUSDT,ILVUSDT,IMXUSDT,INUSDT,INITUSDT,INJUSDT,IOUSDT,IOSTUSDT,IOTAUSDT,IOTXUSDT,IPUSDT,IQUSDT,JASMYUSDT,JELLYJELLYUSDT,JOEUSDT,JSTUSDT,JTOUSDT,JUPUSDT,JUVUSDT,KAIUSDT,KAITOUSDT,KASUSDT,KAVAUSDT,KDAUSDT,KERNELUSDT,KMNOUSDT,KNCUSDT,KOMAUSDT,KSMUSDT,LAUSDT,LAYERUSDT,LAZIOUSDT,LDOUSDT,LINEAUSDT,LINKUSDT,LISTAUSDT,LPTUSDT,LQTYUSDT,LRCUSDT,LSKUSDT,LTCUSDT,LUMIAUSDT,LUNA2USDT,LUNCUSDT,MUSDT,MAGICUSDT,MANAUSDT,MANTAUSDT,MASKUSDT,MAVUSDT,MAVIAUSDT,MBLUSDT,MBOXUSDT,MEUSDT,MELANIAUSDT,MEMEUSDT,MEMEFIUSDT,MERLUSDT,METISUSDT,MEWUSDT,MILKUSDT,MINAUSDT,MITOUSDT,MKRUSDT,MLNUSDT,MOCAUSDT,MOODENGUSDT,MORPHOUSDT,MOVEUSDT,MOVRUSDT,MTLUSDT,MUBARAKUSDT,MYROUSDT,MYXUSDT,NAORISUSDT,NEARUSDT,NEIROUSDT,NEIROETHUSDT,NEOUSDT,NEWTUSDT,NEXOUSDT,NFPUSDT,NILUSDT,NKNUSDT,NMRUSDT,NOTUSDT,NTRNUSDT,NXPCUSDT,OBOLUSDT,OGUSDT,OGNUSDT,OLUSDT,OMUSDT,OMNIUSDT,ONDOUSDT,ONEUSDT,ONGUSDT,ONTUSDT,OPUSDT,OPENUSDT,ORBSUSDT,ORCAUSDT,ORDIUSDT,OSMOUSDT,OXTUSDT,PARTIUSDT,PAXGUSDT,PENDLEUSDT,PENGUUSDT,PEOPLEUSDT,PEPEUSDT,PERPUSDT,PHAUSDT,PHBUSDT,PIPPINUSDT,PIVXUSDT,PIXELUSDT,PLAYUSDT,PLUMEUSDT,PNUTUSDT,POLUSDT,POLYXUSDT,PONDUSDT,PONKEUSDT,POPCATUSDT,PORT3USDT,PORTALUSDT,PORTOUSDT,POWRUSDT,PROMUSDT,PROMPTUSDT,PROVEUSDT,PSGUSDT,PTBUSDT,PUFFERUSDT,PUMPUSDT,PUMPBTCUSDT,PUNDIXUSDT,PYRUSDT,PYTHUSDT,QUSDT,QUSDT,QKCUSDT,QNTUSDT,QTUMUSDT,QUICKUSDT,RAREUSDT,RAYSOLUSDT,RDNTUSDT,REDUSDT,REIUSDT,RENDERUSDT,REQUSDT,RESOLVUSDT,REZUSDT,RIFUSDT,RLCUSDT,RONINUSDT,ROSEUSDT,RPLUSDT,RSRUSDT,RUNEUSDT,RVNUSDT,SUSDT,SAFEUSDT,SAGAUSDT,SAHARAUSDT,SANDUSDT,SANTOSUSDT,SAPIENUSDT,SCRUSDT,SCRTUSDT,SEIUSDT,SFPUSDT,SHELLUSDT,SHIBUSDT,SIGNUSDT,SIRENUSDT,SKATEUSDT,SKLUSDT,SKYUSDT,SKYAIUSDT,SLERFUSDT,SLFUSDT,SNXUSDT,SOLUSDT,SOLVUSDT,SOMIUSDT,SONICUSDT,SOONUSDT,SOPHUSDT,SPELLUSDT,SPKUSDT,SPXUSDT,SQDUSDT,SSVUSDT,STEEMUSDT,STGUSDT,STOUSDT,STORJUSDT,STRKUSDT,STXUSDT,SUIUSDT,SUNUSDT,SUPERUSDT,SUSHUSDT,SWARMSUSDT,SWELLUSDT,SXPUSDT,SXTUSDT,SYNUSDT,SYRUPUSDT,SYSUSDT,TUSDT,TAUSDT,TACUSDT,TAGUSDT,TAIKOUSDT,TAKEUSDT,TANSSIUSDT,TAOUSDT,TFUELUSDT,THEUSDT,THETAUSDT,TIAUSDT,TKOUSDT,TLMUSDT,TNSRUSDT,TOKENUSDT,TONUSDT,TOWNSUSDT,TRBUSDT,TREEUSDT,TRUUSDT,TRUMPUSDT,TRXUSDT,TSTUSDT,TURBOUSDT,TUTUSDT,TWTUSDT,UMAUSDT,UNIUSDT,USD1USDT,USDCUSDT,USDEUSDT,USDTUSDT,USELESSUSDT,USTCUSDT,USUALUSDT,UTKUSDT,UXLINKUSDT,VANAUSDT,VANRYUSDT,VELODROMEUSDT,VELVETUSDT,VETUSDT,VICUSDT,VINEUSDT,VIRTUALUSDT,VOXELUSDT,VTHOUSDT,VVVUSDT,WUSDT,WALUSDT,WANUSDT,WAXPUSDT,WBETHUSDT,WBTCUSDT,WCTUSDT,WIFUSDT,WINUSDT,WLDUSDT,WLFIUSDT,WOOUSDT,XAIUSDT,XCNUSDT,XECUSDT,XLMUSDT,XNOUSDT,XNYUSDT,XPLUSDT,XRPUSDT,XTZUSDT,XUSDUSDT,XVGUSDT,XVSUSDT,YALAUSDT,YFIUSDT,YGGUSDT,ZECUSDT,ZENUSDT,ZEREBROUSDT,ZETAUSDT,ZILUSDT,ZKUSDT,ZKJUSDT,ZORAUSDT,ZRCUSDT,ZROUSDT,ZRXUSDT").split(",")
@@ -28,12 +32,129 @@ RESULTS = {
     "4h": int(os.getenv("RESULTS_4h", "1000"))
 }
 
+# main_v2 запрашивает по ТФ столько баров, сколько объявили потребители (app/services/lookback.py),
+# плюс запас LOOKBACK_MARGIN_BARS; RESULTS_* — верхняя граница (и размер ТФ, читаемых целиком).
+# LOOKBACK_BUDGETS=0 — всегда RESULTS_*.
+LOOKBACK_BUDGETS = os.getenv("LOOKBACK_BUDGETS", "1") == "1"
+LOOKBACK_MARGIN_BARS = int(os.getenv("LOOKBACK_MARGIN_BARS", "10"))
+
 # Настройки кэша и HTTP
 CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "90"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Stale-while-revalidate для пакетов свечей: просроченный пакет ещё PACK_STALE_GRACE_SECONDS
+# отдаётся сразу (с обновлением в фоне), если каждый ТФ укладывается в свой бюджет свежести
+PACK_STALE_GRACE_SECONDS = int(os.getenv("PACK_STALE_GRACE_SECONDS", "300"))
+MAX_AGE_SECONDS = {
+    "5m": int(os.getenv("MAX_AGE_5m", "150")),
+    "15m": int(os.getenv("MAX_AGE_15m", "300")),
+    "30m": int(os.getenv("MAX_AGE_30m", "600")),
+    "1h": int(os.getenv("MAX_AGE_1h", "1200")),
+    "4h": int(os.getenv("MAX_AGE_4h", "3600"))
+}
 HTTP_TIMEOUT_SECONDS = int(os.getenv("HTTP_TIMEOUT_SECONDS", "20"))
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
 CONCURRENCY = int(os.getenv("CONCURRENCY", "4")) 
 
+# Circuit breaker апстримов (app/services/circuit_breaker.py): окно последних BREAKER_WINDOW
+# вызовов; при доле ошибок/медленных (>= BREAKER_SLOW_CALL_MS) не ниже BREAKER_FAILURE_RATE
+# (и не меньше BREAKER_MIN_CALLS вызовов) апстрим не вызывается BREAKER_OPEN_SECONDS, затем
+# BREAKER_HALF_OPEN_PROBES пробных вызовов решают, закрыть breaker или открыть снова
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "50"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_MS = float(os.getenv("BREAKER_SLOW_CALL_MS", "8000"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "2"))
+
+# Хедж свечей TAAPI: без ответа дольше наблюдаемого p95 (в пределах [MIN, MAX], мс)
+# параллельно запрашивается Binance, побеждает первый ответ
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "250"))
+HEDGE_MAX_DELAY_MS = float(os.getenv("HEDGE_MAX_DELAY_MS", "3000"))
+
+# Дедлайн поиска уровня (deadline_ms в запросе): загрузка свечей ждёт не дольше дедлайна
+# за вычетом этого резерва на расчёт уровня, дальше — поиск по успевшим ТФ
+SEARCH_COMPUTE_RESERVE_MS = float(os.getenv("SEARCH_COMPUTE_RESERVE_MS", "150"))
+
+# Сжатие ответов v1 по Accept-Encoding: gzip для тел от GZIP_MIN_BYTES байт
+GZIP_ENABLED = os.getenv("GZIP_ENABLED", "1") == "1"
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+
+# Снимки уровней (app/services/level_snapshots.py): сессия, лучший уровень и кандидаты считаются
+# раз на закрытие бара и переиспользуются запросами; снимков не больше LEVEL_SNAPSHOT_MAX_SYMBOLS
+LEVEL_SNAPSHOTS_ENABLED = os.getenv("LEVEL_SNAPSHOTS_ENABLED", "1") == "1"
+LEVEL_SNAPSHOT_MAX_SYMBOLS = int(os.getenv("LEVEL_SNAPSHOT_MAX_SYMBOLS", "256"))
+# Индикаторы origin_tf=60m для intraday-search — в том же снимке, до закрытия бара 1h
+# (нужны LEVEL_SNAPSHOTS_ENABLED и INDICATORS_SOURCE=local: считаются по закрытым барам;
+# значения TAAPI — по формирующемуся бару и запрашиваются каждый раз). Фильтры 12h и цена — в каждом запросе
+ORIGIN_INDICATORS_MEMO_ENABLED = os.getenv("ORIGIN_INDICATORS_MEMO_ENABLED", "1") == "1"
+
+# Пакетный поиск уровней (POST /levels/intraday-search/batch): не больше BATCH_MAX_ITEMS
+# элементов, BATCH_SYMBOL_CONCURRENCY символов загружаются одновременно
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_SYMBOL_CONCURRENCY = int(os.getenv("BATCH_SYMBOL_CONCURRENCY", "8"))
+
+# /bulk/levels (v1): символов, уровни S/R которых считаются одновременно
+BULK_LEVELS_CONCURRENCY = int(os.getenv("BULK_LEVELS_CONCURRENCY", "8"))
+
+# /bulk/klines (v1): construct'ов свечей в одном bulk-батче, батчей одновременно и повторов
+# construct'ов, не вернувших свечи (повторяются только они, не весь батч)
+KLINES_BULK_BATCH_SIZE = int(os.getenv("KLINES_BULK_BATCH_SIZE", "10"))
+KLINES_BULK_CONCURRENCY = int(os.getenv("KLINES_BULK_CONCURRENCY", "4"))
+KLINES_BULK_RETRIES = int(os.getenv("KLINES_BULK_RETRIES", "2"))
+KLINES_BULK_RETRY_BACKOFF_MS = float(os.getenv("KLINES_BULK_RETRY_BACKOFF_MS", "200"))
+
+# Пул CPU-расчётов уровней вне event loop (app/services/executor.py):
+# thread | process | inline (на месте, без пула)
+COMPUTE_EXECUTOR = os.getenv("COMPUTE_EXECUTOR", "thread")
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", "4"))
+
+# Трассировка /levels/*: заголовок Server-Timing, гистограммы этапов (GET /metrics/latency).
+# Структурированный лог этапов пишется для такой доли запросов
+TRACE_LOG_SAMPLE_RATE = float(os.getenv("TRACE_LOG_SAMPLE_RATE", "0.01"))
+
+# Источник индикаторов пакета (ATR/EMA/ADX): "taapi" — bulk-запрос, "local" — расчёт
+# по уже загруженным свечам (app.services.indicators, соглашения TA-Lib)
+INDICATORS_SOURCE = os.getenv("INDICATORS_SOURCE", "taapi")
+
+# Старшие ТФ, которые строятся из базового (первый в TF_LIST, обычно 5m): история ТФ
+# загружается один раз, дальше продлевается агрегацией базовых баров. Остальные — запрашиваются.
+DERIVE_TIMEFRAMES = [tf for tf in os.getenv("DERIVE_TIMEFRAMES", "").split(",") if tf]
+
+# Фоновый прогрев к закрытию баров: фиксированные символы + PREFETCH_HOT_SIZE недавно запрошенных,
+# не больше PREFETCH_RPS запросов к апстримам в секунду
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "0") == "1"
+PREFETCH_SYMBOLS = [s for s in os.getenv("PREFETCH_SYMBOLS", "").split(",") if s]
+PREFETCH_HOT_SIZE = int(os.getenv("PREFETCH_HOT_SIZE", "20"))
+PREFETCH_RPS = float(os.getenv("PREFETCH_RPS", "2"))
+PREFETCH_DELAY_SECONDS = float(os.getenv("PREFETCH_DELAY_SECONDS", "3"))
+
+# Лимиты тарифов апстримов для регулятора запросов: "ёмкость/период_в_секундах".
+# TAAPI — запросы на ключ, Binance — weight на IP (у фьючерсов и спота лимиты раздельные).
+# RATE_ENDPOINT_WEIGHTS — JSON вида {"binance_futures:/fapi/v1/exchangeInfo": 1}
+# для переопределения веса эндпоинта.
+def _parse_limit(value: str) -> tuple:
+    capacity, _, period = value.partition("/")
+    return float(capacity), float(period or 1)
+
+
+RATE_LIMITS = {
+    "taapi": _parse_limit(os.getenv("TAAPI_RATE_LIMIT", "75/15")),
+    "binance_futures": _parse_limit(os.getenv("BINANCE_WEIGHT_LIMIT", "2400/60")),
+    "binance_spot": _parse_limit(os.getenv("BINANCE_SPOT_WEIGHT_LIMIT", "6000/60")),
+}
+RATE_ENDPOINT_WEIGHTS = json.loads(os.getenv("RATE_ENDPOINT_WEIGHTS", "{}"))
+
+# Пулы HTTP-соединений (общие для всех апстримов, по одному пулу на хост)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "0") == "1"
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.5"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "3.0"))
+
 # OpenAI / LLM settings for cursor module
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
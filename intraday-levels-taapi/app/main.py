@@ -1,11 +1,15 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 import uvicorn
 from typing import List, Dict, Optional
 from datetime import datetime
 from app.services.taapi_service import TaapiService
 from app.services.level_finder import find_levels_for_side
-from app.config import SYMBOLS, TF_LIST
+from app.services.http_clients import HttpClientRegistry, http_clients, use_http_clients
+from app.config import SYMBOLS, TF_LIST, GZIP_ENABLED, GZIP_MIN_BYTES
+from app.services.fast_json import CandleFormat, FastJSONResponse, api_payload, candles_payload, stream_ndjson
 from app.models import (
     LevelSearchRequest, 
     BallFlip, 
@@ -14,10 +18,22 @@ from app.models import (
     CacheStats
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Пулы HTTP-соединений создаются на время работы приложения и закрываются при остановке"""
+    app.state.http_clients = HttpClientRegistry()
+    use_http_clients(app.state.http_clients)
+    try:
+        yield
+    finally:
+        use_http_clients(None)
+        await app.state.http_clients.aclose()
+
 app = FastAPI(
     title="Intraday Levels Taapi.io API",
     description="API для анализа внутридневных уровней с использованием Taapi.io",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Настройка CORS
@@ -29,6 +45,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие ответов по Accept-Encoding (в том числе потоковых NDJSON)
+if GZIP_ENABLED:
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES)
+
 # Инициализация сервиса Taapi.io
 taapi_service = TaapiService()
 
@@ -72,6 +92,14 @@ async def get_config():
         }
     )
 
+@app.get("/http/stats")
+async def get_http_stats():
+    """Статистика пулов HTTP-соединений к апстримам"""
+    return APIResponse(
+        success=True,
+        data=http_clients.get_stats()
+    )
+
 @app.get("/symbols")
 async def get_symbols():
     """Получение списка символов"""
@@ -89,20 +117,21 @@ async def get_timeframes():
     )
 
 @app.get("/klines/{symbol}/{interval}")
-async def get_klines(symbol: str, interval: str, limit: int = 100):
-    """Получение свечных данных"""
+async def get_klines(symbol: str, interval: str, limit: int = 100,
+                     fmt: CandleFormat = Query("records", alias="format")):
+    """Получение свечных данных (format=columnar — колонки t/open/high/low/close/volume)"""
     try:
         data = await taapi_service.get_klines(symbol, interval, limit)
-        return APIResponse(
+        return FastJSONResponse(api_payload(
             success=True,
             data={
                 "symbol": symbol,
                 "interval": interval,
                 "limit": limit,
-                "data": data,
+                "data": candles_payload(data, fmt),
                 "count": len(data)
             }
-        )
+        ))
     except Exception as e:
         return APIResponse(
             success=False,
@@ -386,21 +415,36 @@ async def record_ball_flip(ball_flip: BallFlip):
 
 # Новые bulk эндпоинты
 @app.get("/bulk/klines")
-async def get_klines_bulk(symbols: Optional[str] = None, intervals: Optional[str] = None):
-    """Получение свечных данных для нескольких символов и таймфреймов"""
+async def get_klines_bulk(symbols: Optional[str] = None, intervals: Optional[str] = None,
+                          stream: bool = False, fmt: CandleFormat = Query("records", alias="format")):
+    """
+    Получение свечных данных для нескольких символов и таймфреймов.
+    Bulk-батчи выполняются параллельно. По умолчанию — единый ответ APIResponse;
+    stream=true — NDJSON по строке на символ и интервал ({"symbol", "interval", "candles"})
+    по мере готовности батчей.
+    format=columnar — свечи колонками t/open/high/low/close/volume.
+    """
+    symbol_list = symbols.split(",") if symbols else None
+    interval_list = intervals.split(",") if intervals else None
+    if stream:
+        async def rows():
+            async for symbol, interval, candles in taapi_service.iter_klines_bulk(symbol_list, interval_list):
+                yield {"symbol": symbol, "interval": interval, "candles": candles_payload(candles, fmt)}
+
+        return stream_ndjson(rows())
     try:
-        symbol_list = symbols.split(",") if symbols else None
-        interval_list = intervals.split(",") if intervals else None
-        
         data = await taapi_service.get_klines_bulk(symbol_list, interval_list)
-        return APIResponse(
+        return FastJSONResponse(api_payload(
             success=True,
             data={
                 "symbols": symbol_list or SYMBOLS,
                 "intervals": interval_list or TF_LIST,
-                "data": data
+                "data": {
+                    sym: {tf: candles_payload(candles, fmt) for tf, candles in by_tf.items()}
+                    for sym, by_tf in data.items()
+                }
             }
-        )
+        ))
     except Exception as e:
         return APIResponse(
             success=False,
@@ -413,7 +457,7 @@ async def get_indicators_bulk(symbol: str, interval: str, indicators: str):
     try:
         indicator_list = indicators.split(",")
         data = await taapi_service.get_indicators_bulk(symbol, interval, indicator_list)
-        return APIResponse(
+        return FastJSONResponse(api_payload(
             success=True,
             data={
                 "symbol": symbol,
@@ -421,7 +465,7 @@ async def get_indicators_bulk(symbol: str, interval: str, indicators: str):
                 "indicators": indicator_list,
                 "data": data
             }
-        )
+        ))
     except Exception as e:
         return APIResponse(
             success=False,
@@ -429,12 +473,22 @@ async def get_indicators_bulk(symbol: str, interval: str, indicators: str):
         )
 
 @app.get("/bulk/levels")
-async def get_support_resistance_bulk(symbols: Optional[str] = None, intervals: Optional[str] = None):
-    """Получение уровней поддержки и сопротивления для нескольких символов"""
+async def get_support_resistance_bulk(symbols: Optional[str] = None, intervals: Optional[str] = None,
+                                      stream: bool = False):
+    """
+    Получение уровней поддержки и сопротивления для нескольких символов.
+    Символы считаются параллельно. По умолчанию — единый ответ APIResponse;
+    stream=true — NDJSON по строке на символ в порядке готовности ({"symbol", "data": {интервал: уровни}}).
+    """
+    symbol_list = symbols.split(",") if symbols else None
+    interval_list = intervals.split(",") if intervals else None
+    if stream:
+        async def rows():
+            async for symbol, data in taapi_service.iter_support_resistance_bulk(symbol_list, interval_list):
+                yield {"symbol": symbol, "data": data}
+
+        return stream_ndjson(rows())
     try:
-        symbol_list = symbols.split(",") if symbols else None
-        interval_list = intervals.split(",") if intervals else None
-        
         data = await taapi_service.get_support_resistance_bulk(symbol_list, interval_list)
         return APIResponse(
             success=True,
@@ -470,10 +524,10 @@ async def get_cache_stats():
     """Получение статистики кэша"""
     try:
         stats = taapi_service.get_cache_stats()
-        return APIResponse(
+        return FastJSONResponse(api_payload(
             success=True,
             data=stats
-        )
+        ))
     except Exception as e:
         return APIResponse(
             success=False,
@@ -526,15 +580,14 @@ async def update_cache_ttl(new_ttl: int):
         )
 
 @app.get("/cache/keys")
-async def get_cache_keys():
-    """Получение всех ключей кэша"""
+async def get_cache_keys(limit: int = 100):
+    """Ключи кэша: недавно использованные (не более limit) и общее число"""
     try:
-        stats = taapi_service.get_cache_stats()
         return APIResponse(
             success=True,
             data={
-                "keys": stats.get("keys", []),
-                "count": len(stats.get("keys", []))
+                "keys": taapi_service.get_cache_keys(limit),
+                "count": taapi_service.get_cache_stats()["size"]
             }
         )
     except Exception as e:
@@ -1,5 +1,11 @@
-from fastapi import FastAPI, HTTPException
-from typing import Dict, Any
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import time
+import numpy as np
 import pandas as pd
 import httpx
 import logging
@@ -7,9 +13,13 @@ import json
 
 logger = logging.getLogger(__name__)
 
-from app.schemas import LevelSearchRequest, BallFlip, IntradaySearchResponse
+from app.schemas import LevelSearchRequest, LevelSearchBatchRequest, BallFlip, IntradaySearchResponse
 from app.schemas import CursorRunRequest, CursorRunResponse
-from app.config import SYMBOLS, TF_LIST, RESULTS, CACHE_TTL_SECONDS
+from app.config import SYMBOLS, TF_LIST, RESULTS, CACHE_TTL_SECONDS, CONCURRENCY
+from app.config import PACK_STALE_GRACE_SECONDS, MAX_AGE_SECONDS, PREFETCH_ENABLED, INDICATORS_SOURCE
+from app.config import DERIVE_TIMEFRAMES, LOOKBACK_BUDGETS, LOOKBACK_MARGIN_BARS
+from app.config import BATCH_MAX_ITEMS, BATCH_SYMBOL_CONCURRENCY, SEARCH_COMPUTE_RESERVE_MS
+from app.config import LEVEL_SNAPSHOTS_ENABLED, ORIGIN_INDICATORS_MEMO_ENABLED
 from app.services.cache import TTLCache
 # Use the unified TAAPI bulk client that matches constructs and response format
 from app.services.taapi_bulk import (
@@ -23,19 +33,92 @@ from app.services.taapi_bulk import (
 from app.services.indicators_12h import indicators_12h_service
 from app.services.vwap import session_vwap
 from app.services.pivots import classic_pivots
-from app.services.levels import find_best_level
+from app.services.levels import find_best_level, compute_candidates, level_swings, skipped_checks, degraded_score
+from app.services.level_snapshots import LevelSnapshot, level_snapshots
 from app.services.utils import infer_tick_from_price
 from app.services.binance_fallback import binance_fallback
+from app.services.candles import Candles, as_candles
+from app.services.indicators import pack_indicators
+from app.services.resample import resample, splice
+from app.services.candle_store import TF_MS
+from app.services.lookback import declare_lookback, required_bars, bars_used
 from app.services.cursor import fetch_taapi_cursor_pack, call_llm
 from app.services.cursor import maybe_notify_telegram
+from app.services.http_clients import HttpClientRegistry, http_clients, use_http_clients
+from app.services.rate_governor import governor, priority_scope, PRIORITY_SIGNAL, PRIORITY_BACKGROUND
+from app.services.prefetch import PrefetchScheduler
+from app.services.executor import compute, compute_scope
+from app.services.tracing import tracer, request_trace, current_trace, span, trace_log
+from app.services.circuit_breaker import candles_hedger, taapi_breaker
 
-app = FastAPI(title="Intraday Levels (TAAPI-only)")
-cache = TTLCache(ttl_seconds=CACHE_TTL_SECONDS)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Пулы соединений живут всё время работы приложения
+    app.state.http_clients = HttpClientRegistry()
+    use_http_clients(app.state.http_clients)
+    if PREFETCH_ENABLED:
+        prefetcher.start()
+    try:
+        yield
+    finally:
+        await prefetcher.stop()
+        use_http_clients(None)
+        await app.state.http_clients.aclose()
+        compute.shutdown()
+
+app = FastAPI(title="Intraday Levels (TAAPI-only)", lifespan=lifespan)
+cache = TTLCache(ttl_seconds=CACHE_TTL_SECONDS, grace_seconds=PACK_STALE_GRACE_SECONDS)
+# Ограничение одновременных запросов к апстримам (TAAPI/Binance)
+_upstream_sem = asyncio.Semaphore(CONCURRENCY)
 
 @app.get("/health")
 async def health(): 
     return {"ok": True}
 
+@app.get("/http/stats")
+async def http_stats():
+    return http_clients.get_stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return cache.get_stats()
+
+@app.get("/prefetch/stats")
+async def prefetch_stats():
+    return prefetcher.get_stats()
+
+@app.get("/rate/stats")
+async def rate_stats():
+    return governor.get_stats()
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    """Состояние breaker'ов TAAPI/Binance и исходы хеджированных запросов свечей."""
+    return candles_hedger.get_stats()
+
+@app.get("/compute/stats")
+async def compute_stats():
+    return compute.get_stats()
+
+@app.get("/snapshots/stats")
+async def snapshot_stats():
+    return level_snapshots.get_stats()
+
+@app.get("/metrics/latency")
+async def latency_metrics():
+    """Гистограммы задержек по этапам поиска уровней (спаны трассировки)."""
+    return tracer.get_stats()
+
+@app.middleware("http")
+async def trace_levels_requests(request: Request, call_next):
+    """Трасса на запросы /levels/*: этапы — в заголовке Server-Timing и гистограммах."""
+    if not request.url.path.startswith("/levels/"):
+        return await call_next(request)
+    with request_trace(request.url.path) as trace:
+        response = await call_next(request)
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
 @app.post("/ball_flip")
 async def ball_flip(evt: BallFlip):
     # Заглушка: можно вешать автоматический вызов поиска.
@@ -44,102 +127,412 @@ async def ball_flip(evt: BallFlip):
 def _cache_key(symbol: str) -> str:
     return f"pack:{symbol}"
 
-async def fetch_pack(symbol: str) -> Dict[str, Any]:
+async def _fetch_tf(symbol: str, tf: str) -> Tuple[Candles, str]:
     """
-    Тянем свечи 5m/15m/30m/1h/4h + индикаторы (ATR/EMA20/EMA50/EMA200/ADX) через TAAPI bulk.
-    При ошибке Taapi.io используем fallback на Binance API.
-    Кэшируем результат на CACHE_TTL_SECONDS.
+    Свечи одного ТФ: TAAPI Direct с хеджем на Binance — если TAAPI не ответил за свой p95,
+    параллельно идёт запрос к Binance, берётся первый ответ. При ошибке TAAPI или открытом
+    breaker — сразу Binance, только для этого ТФ.
     """
-    key = _cache_key(symbol)
-    cached = cache.get(key)
-    if cached: 
-        return cached
+    async def taapi():
+        async with _upstream_sem:
+            with span(f"fetch.{tf}"):
+                return await get_candles_direct(symbol, tf, FETCH_BARS[tf])
+
+    async def fallback():
+        async with _upstream_sem:
+            with span(f"fallback.{tf}"):
+                return await binance_fallback.get_candles(symbol, tf, FETCH_BARS[tf])
 
-    # Пробуем сначала Taapi.io
+    candles, from_taapi = await candles_hedger.call(taapi, fallback)
+    return candles, "taapi" if from_taapi else "binance_fallback"
+
+async def _fetch_indicators_30m(symbol: str) -> Optional[Dict[str, Optional[float]]]:
+    """Индикаторы 30m через Bulk (не более 20 результатов). None — если TAAPI недоступен."""
+    constructs = [
+        construct_indicator("atr", symbol, "30m", {"period": 14}),
+        construct_indicator("ema", symbol, "30m", {"period": 20}),
+        construct_indicator("ema", symbol, "30m", {"period": 50}),
+        construct_indicator("ema", symbol, "30m", {"period": 200}),
+        construct_indicator("adx", symbol, "30m", {"period": 14}),
+    ]
+    async def bulk():
+        async with _upstream_sem:
+            with span("fetch.indicators_30m"):
+                return await taapi_bulk(constructs)
+
+    # При открытом breaker TAAPI индикаторы сразу считаются локально
     try:
-        # Свечи — напрямую через Direct Method (без ограничений 20)
-        klines: Dict[str, Any] = {}
+        data = await taapi_breaker.run(bulk)
+    except Exception as taapi_error:
+        logger.warning(f"Taapi.io indicators failed for {symbol}: {taapi_error}")
+        return None
+    rows = data.get("results") or data.get("data") or []
+    def v(i):
+        return parse_indicator_value(rows[i]) if i < len(rows) else None
+    return {"atr": v(0), "ema20": v(1), "ema50": v(2), "ema200": v(3), "adx": v(4)}
+
+def pack_ages(pack: Dict[str, Any], now: Optional[float] = None) -> Dict[str, float]:
+    """Возраст данных пакета по ТФ в секундах (от момента загрузки ТФ)."""
+    now = time.time() if now is None else now
+    return {tf: round(now - ts, 3) for tf, ts in pack.get("fetched_at", {}).items()}
+
+def _within_budget(pack: Dict[str, Any], max_age: Optional[float] = None) -> bool:
+    """Каждый ТФ пакета укладывается в свой бюджет свежести (и в max_age, если задан)."""
+    ages = pack_ages(pack)
+    for tf in TF_LIST:
+        age = ages.get(tf)
+        limit = MAX_AGE_SECONDS.get(tf, CACHE_TTL_SECONDS)
+        if max_age is not None:
+            limit = min(limit, max_age)
+        if age is None or age > limit:
+            return False
+    return True
+
+async def fetch_pack(symbol: str, max_age: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Тянем свечи 5m/15m/30m/1h/4h + индикаторы (ATR/EMA20/EMA50/EMA200/ADX) через TAAPI
+    (при INDICATORS_SOURCE=local индикаторы считаются по свечам 30m без запроса).
+    Все ТФ и bulk индикаторов запрашиваются параллельно (не более CONCURRENCY одновременно);
+    каждый ТФ при ошибке Taapi.io сам переключается на Binance API, не задерживая остальные.
+    Кэшируем результат на CACHE_TTL_SECONDS; ещё PACK_STALE_GRACE_SECONDS просроченный пакет
+    отдаётся сразу с обновлением в фоне, если все ТФ в пределах MAX_AGE_SECONDS.
+    max_age — предел возраста данных любого ТФ: более старый пакет перезагружается синхронно.
+    """
+    key = _cache_key(symbol)
+    previous = cache.peek(key)
+    loader = lambda: _load_pack(symbol, previous, max_age)
+    # Одновременные запросы одного символа ждут одну загрузку
+    pack = await cache.get_or_load(key, loader, stale_ok=lambda p: _within_budget(p, max_age))
+    if max_age is not None and not _within_budget(pack, max_age):
+        pack = await cache.reload(key, lambda: _load_pack(symbol, pack, max_age))
+    return pack
+
+
+async def _load_pack(symbol: str, previous: Optional[Dict[str, Any]] = None,
+                     max_age: Optional[float] = None,
+                     refresh: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Загрузка пакета. ТФ из previous, ещё укладывающиеся в бюджет свежести, переиспользуются
+    (старшие ТФ обновляются реже младших); остальные и ТФ из refresh запрашиваются заново.
+    Индикаторы 30m перезапрашиваются вместе с 30m.
+    ТФ из DERIVE_TIMEFRAMES при наличии истории в previous не запрашиваются, а продлеваются
+    барами, собранными из базового ТФ.
+    """
+    base_tf = TF_LIST[0]
+    derive = [tf for tf in DERIVE_TIMEFRAMES
+              if tf in TF_LIST and tf != base_tf and previous and tf in previous.get("klines", {})]
+    reuse: Dict[str, Tuple[Candles, str, float]] = {}
+    if previous:
+        ages = pack_ages(previous)
         for tf in TF_LIST:
-            klines[tf] = await get_candles_direct(symbol, tf, RESULTS[tf])
+            if (refresh and tf in refresh) or tf in derive:
+                continue
+            limit = MAX_AGE_SECONDS.get(tf, 0)
+            if max_age is not None:
+                limit = min(limit, max_age)
+            # Половина бюджета: переиспользованный ТФ не должен выйти за бюджет до следующего обновления
+            if tf in ages and ages[tf] <= limit / 2 and tf in previous.get("klines", {}):
+                reuse[tf] = (previous["klines"][tf], previous["sources"][tf], previous["fetched_at"][tf])
+    fetch_tfs = [tf for tf in TF_LIST if tf not in reuse and tf not in derive]
+    started = time.time()
 
-        # Индикаторы 30m через Bulk (не более 20 результатов)
-        constructs = [
-            construct_indicator("atr", symbol, "30m", {"period": 14}),
-            construct_indicator("ema", symbol, "30m", {"period": 20}),
-            construct_indicator("ema", symbol, "30m", {"period": 50}),
-            construct_indicator("ema", symbol, "30m", {"period": 200}),
-            construct_indicator("adx", symbol, "30m", {"period": 14}),
-        ]
-        data = await taapi_bulk(constructs)
-        rows = data.get("results") or data.get("data") or []
-        atr30 = parse_indicator_value(rows[0]) if len(rows) > 0 else None
-        ema20 = parse_indicator_value(rows[1]) if len(rows) > 1 else None
-        ema50 = parse_indicator_value(rows[2]) if len(rows) > 2 else None
-        ema200 = parse_indicator_value(rows[3]) if len(rows) > 3 else None
-        adx30 = parse_indicator_value(rows[4]) if len(rows) > 4 else None
-
-        pack = {
-            "symbol": symbol,
-            "klines": klines,
-            "indicators_30m": {
-                "atr": atr30, 
-                "ema20": ema20, 
-                "ema50": ema50, 
-                "ema200": ema200, 
-                "adx": adx30
-            },
-            "source": "taapi"
-        }
-        
-    except Exception as taapi_error:
-        logger.warning(f"Taapi.io failed for {symbol}, using Binance fallback: {taapi_error}")
-        
-        # Fallback на Binance API
-        try:
-            klines: Dict[str, Any] = {}
-            indicators_30m = {}
-            
-            # Получаем свечи через Binance
-            for tf in TF_LIST:
-                klines[tf] = await binance_fallback.get_candles(symbol, tf, RESULTS[tf])
-            
-            # Рассчитываем индикаторы для 30m
-            if "30m" in klines and len(klines["30m"]) > 0:
-                indicators_30m = binance_fallback.calculate_simple_indicators(klines["30m"])
-            
-            pack = {
-                "symbol": symbol,
-                "klines": klines,
-                "indicators_30m": indicators_30m,
-                "source": "binance_fallback"
-            }
-            
-        except Exception as binance_error:
-            logger.error(f"Both Taapi.io and Binance fallback failed for {symbol}: {binance_error}")
+    reuse_indicators = previous is not None and "30m" in reuse and previous.get("indicators_30m")
+    local_indicators = INDICATORS_SOURCE == "local"
+
+    async def _no_fetch():
+        return previous["indicators_30m"] if reuse_indicators else None
+
+    # Загруженные ТФ видны запросам с дедлайном ещё до сборки пакета
+    progress: Dict[str, Tuple[Candles, str, float]] = {}
+    _loading[symbol] = progress
+
+    async def _fetch_tracked(tf: str) -> Tuple[Candles, str]:
+        candles, source = await _fetch_tf(symbol, tf)
+        progress[tf] = (candles, source, started)
+        return candles, source
+
+    try:
+        tf_results, indicators_30m = await asyncio.gather(
+            asyncio.gather(*(_fetch_tracked(tf) for tf in fetch_tfs), return_exceptions=True),
+            _no_fetch() if reuse_indicators or local_indicators else _fetch_indicators_30m(symbol),
+        )
+    finally:
+        if _loading.get(symbol) is progress:
+            del _loading[symbol]
+
+    klines: Dict[str, Any] = {}
+    sources: Dict[str, str] = {}
+    fetched_at: Dict[str, float] = {}
+    for tf, res in zip(fetch_tfs, tf_results):
+        if isinstance(res, BaseException):
+            logger.error(f"Both Taapi.io and Binance fallback failed for {symbol} {tf}: {res}")
             raise HTTPException(status_code=502, detail=f"All data sources failed for {symbol}")
+        klines[tf], sources[tf] = res
+        fetched_at[tf] = started
+    for tf, (candles, source, ts) in reuse.items():
+        klines[tf], sources[tf], fetched_at[tf] = candles, source, ts
+    for tf in derive:
+        derived = splice(previous["klines"][tf],
+                         resample(klines[base_tf], TF_MS[base_tf], TF_MS[tf]), TF_MS[tf], FETCH_BARS[tf])
+        if derived is None:
+            # Разрыв между историей и базовым рядом — загружаем ТФ заново
+            try:
+                klines[tf], sources[tf] = await _fetch_tf(symbol, tf)
+            except Exception as e:
+                logger.error(f"Both Taapi.io and Binance fallback failed for {symbol} {tf}: {e}")
+                raise HTTPException(status_code=502, detail=f"All data sources failed for {symbol}")
+            fetched_at[tf] = time.time()
+        else:
+            klines[tf], sources[tf], fetched_at[tf] = derived, "derived", fetched_at[base_tf]
+    klines = {tf: klines[tf] for tf in TF_LIST}
 
-    cache.set(key, pack)
+    # Рассчитываем индикаторы для 30m локально (INDICATORS_SOURCE=local или TAAPI bulk не ответил)
+    if reuse_indicators:
+        sources["indicators_30m"] = previous["sources"].get("indicators_30m", "taapi")
+    elif indicators_30m is None:
+        indicators_30m = pack_indicators(klines["30m"])
+        sources["indicators_30m"] = "local"
+    else:
+        sources["indicators_30m"] = "taapi"
+
+    distinct = set(sources.values())
+    pack = {
+        "symbol": symbol,
+        "klines": klines,
+        "indicators_30m": indicators_30m,
+        "source": distinct.pop() if len(distinct) == 1 else "mixed",
+        "sources": sources,
+        "fetched_at": {tf: fetched_at[tf] for tf in TF_LIST},
+    }
     return pack
 
-def build_session_info(k30: list, k5: list) -> Dict[str, Any]:
-    df = pd.DataFrame(k30)
-    df["t"] = pd.to_datetime(df["t"])
-    dates = sorted(set(df["t"].dt.date))
-    if len(dates) < 2:
+# Идущие загрузки пакетов: символ -> уже полученные ТФ (свечи, источник, время загрузки)
+_loading: Dict[str, Dict[str, Tuple[Candles, str, float]]] = {}
+
+async def _partial_pack(symbol: str, max_age: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Пакет из того, что есть к дедлайну запроса: ТФ идущей загрузки и ТФ прошлого пакета,
+    укладывающиеся в бюджет свежести. Недостающие ТФ — пустые свечи и список missing.
+    Без 5m или 30m (цена, пивоты, VWAP) уровень не ищется — 504.
+    """
+    previous = cache.peek(_cache_key(symbol))
+    progress = _loading.get(symbol, {})
+    ages = pack_ages(previous) if previous else {}
+    klines: Dict[str, Any] = {}
+    sources: Dict[str, str] = {}
+    fetched_at: Dict[str, float] = {}
+    for tf in TF_LIST:
+        limit = MAX_AGE_SECONDS.get(tf, CACHE_TTL_SECONDS)
+        if max_age is not None:
+            limit = min(limit, max_age)
+        if tf in progress:
+            klines[tf], sources[tf], fetched_at[tf] = progress[tf]
+        elif previous and tf in previous.get("klines", {}) and ages.get(tf, limit + 1) <= limit:
+            klines[tf], sources[tf] = previous["klines"][tf], previous["sources"][tf]
+            fetched_at[tf] = previous["fetched_at"][tf]
+    missing = [tf for tf in TF_LIST if tf not in klines]
+    if "5m" in missing or "30m" in missing:
+        raise HTTPException(504, f"Deadline exceeded before {symbol} 5m/30m candles arrived")
+
+    if previous and previous.get("indicators_30m") and previous["fetched_at"].get("30m") == fetched_at["30m"]:
+        indicators_30m = previous["indicators_30m"]
+        sources["indicators_30m"] = previous["sources"].get("indicators_30m", "taapi")
+    else:
+        indicators_30m = await compute.run(pack_indicators, klines["30m"])
+        sources["indicators_30m"] = "local"
+    distinct = set(sources.values())
+    return {
+        "symbol": symbol,
+        "klines": {tf: klines.get(tf, Candles.empty()) for tf in TF_LIST},
+        "indicators_30m": indicators_30m,
+        "source": distinct.pop() if len(distinct) == 1 else "mixed",
+        "sources": sources,
+        "fetched_at": fetched_at,
+        "missing": missing,
+    }
+
+def _remaining(deadline_at: Optional[float], reserve: float = 0.0) -> Optional[float]:
+    """Секунды до дедлайна за вычетом reserve (None — дедлайна нет)."""
+    if deadline_at is None:
+        return None
+    return max(0.0, deadline_at - asyncio.get_running_loop().time() - reserve)
+
+async def _await_until(task: "asyncio.Future[Any]", deadline_at: Optional[float]) -> bool:
+    """
+    Дождаться task, но не дольше дедлайна за вычетом половины резерва (вторая половина —
+    на поиск уровня). Не успела — отменяется.
+    """
+    done, _ = await asyncio.wait({task}, timeout=_remaining(deadline_at, SEARCH_COMPUTE_RESERVE_MS / 2000))
+    if not done:
+        task.cancel()
+    return bool(done)
+
+async def _pack_by_deadline(load: "asyncio.Future[Dict[str, Any]]", symbol: str,
+                            max_age: Optional[float], deadline_at: Optional[float]) -> Dict[str, Any]:
+    """
+    Дождаться загрузки пакета, но не дольше дедлайна за вычетом резерва на расчёт уровня.
+    Не успела — частичный пакет; загрузка продолжается и наполняет кэш для следующих запросов.
+    """
+    if deadline_at is None:
+        return await load
+    done, _ = await asyncio.wait({load}, timeout=_remaining(deadline_at, SEARCH_COMPUTE_RESERVE_MS / 1000))
+    if done:
+        return load.result()
+    load.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return await _partial_pack(symbol, max_age)
+
+async def _prefetch_pack(symbol: str, timeframes: List[str]) -> None:
+    """Обновить в кэше пакет символа: закрывшиеся ТФ — заново, остальные — по бюджету свежести."""
+    key = _cache_key(symbol)
+    previous = cache.peek(key)
+    # Прогрев уступает очередь к апстримам запросам сигнального пути
+    with priority_scope(PRIORITY_BACKGROUND):
+        pack = await cache.reload(key, lambda: _load_pack(symbol, previous, refresh=timeframes))
+    await _warm_snapshot(symbol, pack)
+
+# Прогрев горячих символов к закрытию баров (включается PREFETCH_ENABLED=1)
+prefetcher = PrefetchScheduler(_prefetch_pack)
+
+_DAY_MS = 86_400_000
+
+# Пивоты и VWAP: прошлые и текущие сутки UTC — не больше 96 баров 30m
+SESSION_LOOKBACK = declare_lookback("session", {"30m": 96})
+
+# Размер запроса по ТФ — максимум объявленных окон потребителей пакета
+if LOOKBACK_BUDGETS:
+    FETCH_BARS = required_bars(TF_LIST, margin=LOOKBACK_MARGIN_BARS, cap=RESULTS)
+else:
+    FETCH_BARS = dict(RESULTS)
+
+# ТФ, которые читают find_best_level/compute_candidates (4h передаётся, но не читается)
+SNAPSHOT_LEVEL_TFS = ("5m", "15m", "30m", "1h")
+
+def _level_snapshot(symbol: str, pack: Dict[str, Any]) -> Optional[LevelSnapshot]:
+    """Снимок уровней символа для закрытых баров пакета; частичный пакет (дедлайн) не снимается."""
+    if not LEVEL_SNAPSHOTS_ENABLED or pack.get("missing"):
+        return None
+    return level_snapshots.current(symbol, pack["klines"], SNAPSHOT_LEVEL_TFS)
+
+async def _snapshot_value(snap: LevelSnapshot, name: Tuple[Any, ...], tfs: Tuple[str, ...],
+                          fn: Any, *args: Any, **kwargs: Any) -> Any:
+    """Значение снимка: считается в пуле compute один раз на закрытие баров tfs."""
+    return await level_snapshots.get_or_compute(snap, name, tfs, lambda: compute.run(fn, *args, **kwargs))
+
+async def _session_info(snap: Optional[LevelSnapshot], kl: Dict[str, Candles]) -> Dict[str, Any]:
+    """
+    Сессия. В снимке — пивоты прошлых суток по закрытым барам 30m (текущие сутки — сутки
+    следующего за ними бара); VWAP текущих суток — в каждом запросе, с формирующимся баром.
+    """
+    if snap is None:
+        return await compute.run(build_session_info, kl["30m"], kl["5m"])
+    closed = snap.closed(kl)
+    today = (snap.key["30m"][0] + TF_MS["30m"]) // _DAY_MS
+    pivots = await _snapshot_value(snap, ("session",), ("30m",), build_session_pivots, closed["30m"], today=today)
+    return {**pivots, "vwap_session": current_session_vwap(kl["30m"])}
+
+async def _level_swings(snap: Optional[LevelSnapshot], kl: Dict[str, Candles]) -> Optional[Dict[str, Any]]:
+    """Свинги поиска уровней по закрытым барам из снимка; без снимка — None (считаются при поиске)."""
+    if snap is None:
+        return None
+    closed = snap.closed(kl)
+    return await _snapshot_value(snap, ("swings",), SNAPSHOT_LEVEL_TFS, level_swings,
+                                 closed["5m"], closed["15m"], closed["30m"], closed["1h"])
+
+def _level_indicators(inds: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"atr": (inds or {}).get("atr"), "ema200": (inds or {}).get("ema200")}
+
+async def _best_level(snap: Optional[LevelSnapshot], kl: Dict[str, Candles], session_info: Dict[str, Any],
+                      tick_size: float, inds: Optional[Dict[str, Any]], side: str,
+                      origin_tf: str) -> Optional[Dict[str, Any]]:
+    """Лучший уровень: свинги закрытых баров — из снимка, текущая цена (толерантность) — из запроса."""
+    swings = await _level_swings(snap, kl)
+    return await compute.run(find_best_level, kl["5m"], kl["15m"], kl["30m"], kl["1h"], kl["4h"], session_info,
+                             tick_size, _level_indicators(inds), side=side, origin_tf=origin_tf, swings=swings)
+
+async def _candidates(snap: Optional[LevelSnapshot], kl: Dict[str, Candles], session_info: Dict[str, Any],
+                      tick_size: float, inds: Optional[Dict[str, Any]], side: str) -> List[Dict[str, Any]]:
+    swings = await _level_swings(snap, kl)
+    return await compute.run(compute_candidates, kl["5m"], kl["15m"], kl["30m"], kl["1h"], kl["4h"], session_info,
+                             tick_size, _level_indicators(inds), side, swings=swings)
+
+async def _snapshot_levels(symbol: str, pack: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Снимок уровней по пакету: сессия, лучший уровень (origin_tf=30m) и ранжированные кандидаты
+    для обеих сторон. Сессия и свинги закрытых баров берутся из снимка, цена — текущая.
+    """
+    kl = pack["klines"]
+    snap = _level_snapshot(symbol, pack)
+    session_info = await _session_info(snap, kl)
+    tick_size = infer_tick_from_price(float(kl["5m"].close[-1]))
+    inds = pack["indicators_30m"]
+    sides = ("long", "short")
+    levels = await asyncio.gather(*(_best_level(snap, kl, session_info, tick_size, inds, side, "30m") for side in sides))
+    candidates = await asyncio.gather(*(_candidates(snap, kl, session_info, tick_size, inds, side) for side in sides))
+    return {
+        "symbol": symbol,
+        "bars": {tf: {"t": t, "close": close} for tf, (t, close) in snap.key.items()} if snap else None,
+        "built_at": snap.built_at if snap else None,
+        "session_info": session_info,
+        "tick_size": tick_size,
+        "levels": dict(zip(sides, levels)),
+        "candidates": dict(zip(sides, candidates)),
+    }
+
+async def _warm_snapshot(symbol: str, pack: Dict[str, Any]) -> None:
+    """Прогрев снимка уровней после обновления пакета на закрытии бара."""
+    if not LEVEL_SNAPSHOTS_ENABLED:
+        return
+    try:
+        await _snapshot_levels(symbol, pack)
+    except Exception as e:
+        logger.warning(f"Level snapshot warm-up failed for {symbol}: {e}")
+
+def build_session_pivots(k30: Candles, today: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Пивоты и PDH/PDL/PDC прошлых суток. today — номер текущих суток UTC, если k30 могут
+    не содержать их баров (только закрытые бары); по умолчанию — сутки последнего бара.
+    """
+    k30 = as_candles(k30).tail(SESSION_LOOKBACK.total("30m"))
+    # Сутки UTC по open time; ряд отсортирован, поэтому сутки — непрерывные срезы
+    days = k30.t // _DAY_MS
+    dates = np.unique(days)
+    if today is not None:
+        dates = dates[dates < today]
+        if len(dates) < 1:
+            raise HTTPException(503, "Not enough data for pivots")
+        prev = dates[-1]
+    elif len(dates) < 2:
         raise HTTPException(503, "Not enough data for pivots")
-    prev = dates[-2]; today = dates[-1]
-    dprev = df[df["t"].dt.date == prev]
-    PDH = float(dprev["high"].max()); PDL = float(dprev["low"].min()); PDC = float(dprev["close"].iloc[-1])
-    # Session VWAP по текущим суткам (30m достаточно, но можно и 5m)
-    dcur = df[df["t"].dt.date == today]
-    vwap_val = session_vwap(dcur.to_dict("records")) if len(dcur) > 0 else None
+    else:
+        prev = dates[-2]
+    dprev = k30[int(np.searchsorted(days, prev, "left")):int(np.searchsorted(days, prev, "right"))]
+    PDH = float(dprev.high.max()); PDL = float(dprev.low.min()); PDC = float(dprev.close[-1])
     piv = classic_pivots(PDH, PDL, PDC)
-    return {"PDH": PDH, "PDL": PDL, "PDC": PDC, "pivots_daily": piv, "vwap_session": vwap_val}
+    return {"PDH": PDH, "PDL": PDL, "PDC": PDC, "pivots_daily": piv}
+
+def current_session_vwap(k30: Candles) -> Optional[float]:
+    """Session VWAP по текущим суткам — суткам последнего бара 30m (включая формирующийся)."""
+    k30 = as_candles(k30).tail(SESSION_LOOKBACK.total("30m"))
+    if len(k30) == 0:
+        return None
+    days = k30.t // _DAY_MS
+    dcur = k30[int(np.searchsorted(days, days[-1], "left")):]
+    return session_vwap(dcur)
 
-async def get_origin_indicators(symbol: str, origin_tf: str) -> Dict[str, float]:
-    """Если origin_tf=60m — дотянем ATR/EMA/ADX для 60m отдельным bulk."""
+def build_session_info(k30: Candles, k5: Candles) -> Dict[str, Any]:
+    """Пивоты прошлых суток и VWAP текущих (30m достаточно, но можно и 5m)."""
+    return {**build_session_pivots(k30), "vwap_session": current_session_vwap(k30)}
+
+async def get_origin_indicators(symbol: str, origin_tf: str,
+                                candles: Optional[Candles] = None) -> Dict[str, float]:
+    """
+    Если origin_tf=60m — дотянем ATR/EMA/ADX для 60m отдельным bulk.
+    При INDICATORS_SOURCE=local (или ошибке TAAPI) и переданных свечах 1h — считаем локально.
+    """
     if origin_tf == "30m":
         return {}  # уже есть в pack['indicators_30m']
+    if INDICATORS_SOURCE == "local" and candles is not None and len(candles) > 0:
+        return await compute.run(pack_indicators, candles)
     
     try:
         constructs = [
@@ -156,10 +549,12 @@ async def get_origin_indicators(symbol: str, origin_tf: str) -> Dict[str, float]
         return {"atr": v(0), "ema20": v(1), "ema50": v(2), "ema200": v(3), "adx": v(4)}
     except Exception as taapi_error:
         logger.warning(f"Taapi.io failed for {symbol} 60m indicators, using Binance fallback: {taapi_error}")
+        if candles is not None and len(candles) > 0:
+            return await compute.run(pack_indicators, candles)
         try:
             # Fallback на Binance для 60m
             candles_60m = await binance_fallback.get_candles(symbol, "60m", 100)
-            indicators = binance_fallback.calculate_simple_indicators(candles_60m)
+            indicators = await compute.run(binance_fallback.calculate_simple_indicators, candles_60m)
             return indicators
         except Exception as binance_error:
             logger.error(f"Both Taapi.io and Binance fallback failed for {symbol} 60m: {binance_error}")
@@ -174,36 +569,139 @@ async def get_filters_12h(symbol: str) -> Dict[str, float]:
         logger.error(f"Failed to fetch 12h indicators for {symbol}: {e}")
         return {"rsi12h": None, "ema200_12h": None}
 
-@app.post("/levels/intraday-search")
-async def intraday_search(req: LevelSearchRequest) -> IntradaySearchResponse:
-    symbol = req.symbol.upper()
+def _allowed_symbol(symbol: str) -> str:
+    symbol = symbol.upper()
     if symbol not in [s.upper() for s in SYMBOLS]:
         raise HTTPException(400, f"Symbol {symbol} is not allowed")
+    return symbol
 
-    pack = await fetch_pack(symbol)
+@app.post("/levels/intraday-search")
+async def intraday_search(req: LevelSearchRequest) -> IntradaySearchResponse:
+    deadline_at = _deadline_at(req)
+    symbol = _allowed_symbol(req.symbol)
+    prefetcher.touch(symbol)
+    with priority_scope(PRIORITY_SIGNAL), span("cache"):
+        load = asyncio.ensure_future(fetch_pack(symbol, max_age=req.max_data_age_s))
+        pack = await _pack_by_deadline(load, symbol, req.max_data_age_s, deadline_at)
+    res = await _evaluate_search(req, symbol, pack, deadline_at)
+    trace = current_trace()
+    if req.debug and trace is not None:
+        res.timings = trace.summary()
+    return res
+
+@app.get("/levels/snapshot/{symbol}")
+async def level_snapshot(symbol: str) -> Dict[str, Any]:
+    """Снимок уровней символа: сессия, лучший уровень и ранжированные кандидаты по сторонам."""
+    symbol = _allowed_symbol(symbol)
+    with priority_scope(PRIORITY_SIGNAL):
+        pack = await fetch_pack(symbol)
+    return jsonable_encoder(await _snapshot_levels(symbol, pack))
+
+def _deadline_at(req: LevelSearchRequest) -> Optional[float]:
+    """Момент дедлайна запроса по часам event loop (None — без дедлайна)."""
+    if req.deadline_ms is None:
+        return None
+    return asyncio.get_running_loop().time() + req.deadline_ms / 1000
+
+async def _evaluate_search(req: LevelSearchRequest, symbol: str, pack: Dict[str, Any],
+                           deadline_at: Optional[float] = None) -> IntradaySearchResponse:
+    """Поиск уровня по загруженному пакету; ожидание и время CPU-расчётов — в поле compute."""
+    with compute_scope() as stats:
+        res = await _search_levels(req, symbol, pack, deadline_at)
+    res.compute = {k: round(v, 3) for k, v in stats.items()}
+    return res
+
+async def _origin_indicators(snap: Optional[LevelSnapshot], symbol: str,
+                             kl: Dict[str, Candles]) -> Dict[str, Any]:
+    """
+    Индикаторы 60m для поиска уровня. При INDICATORS_SOURCE=local со снимком — один расчёт
+    по закрытым барам 1h до закрытия следующего, общий для одновременных запросов; дедлайн
+    запроса ограничивает только его ожидание. Неудачный расчёт (все значения None) не
+    запоминается. TAAPI отдаёт значения формирующегося бара — они запрашиваются каждый раз.
+    """
+    if snap is None or not ORIGIN_INDICATORS_MEMO_ENABLED or INDICATORS_SOURCE != "local":
+        return await get_origin_indicators(symbol, "60m", kl["1h"])
+    closed_1h = snap.closed(kl)["1h"]
+    if len(closed_1h) == 0:
+        return await get_origin_indicators(symbol, "60m", kl["1h"])
+
+    async def load() -> Dict[str, Any]:
+        inds = await compute.run(pack_indicators, closed_1h)
+        if all(v is None for v in inds.values()):
+            raise LookupError(f"No 60m indicators for {symbol}")
+        return inds
+
+    try:
+        return await level_snapshots.get_or_compute(snap, ("origin", "60m"), ("1h",), load)
+    except LookupError:
+        return {"atr": None, "ema20": None, "ema50": None, "ema200": None, "adx": None}
+
+async def _search_levels(req: LevelSearchRequest, symbol: str, pack: Dict[str, Any],
+                         deadline_at: Optional[float] = None) -> IntradaySearchResponse:
+    """
+    Уровень и ордера по пакету. Частичный пакет (дедлайн) — поиск по имеющимся ТФ:
+    пропущенные проверки перечисляются в поле degraded и снижают оценку уровня.
+    """
     kl = pack["klines"]
-    if not kl["5m"] or not kl["30m"] or not kl["1h"] or not kl["4h"]:
+    ages = pack_ages(pack)
+    missing = pack.get("missing", [])
+    if not kl["5m"] or not kl["30m"] or any(not kl[tf] for tf in ("1h", "4h") if tf not in missing):
         raise HTTPException(503, "Candles not ready")
+    skipped = skipped_checks(missing)
 
-    # Сессионные агрегаты
-    session_info = build_session_info(kl["30m"], kl["5m"])
+    # Фильтры 12h загружаются, пока считаются сессия и индикаторы
+    filters_task = asyncio.ensure_future(get_filters_12h(symbol))
+    origin_task: Optional[asyncio.Future] = None
+    try:
+        # Сессионные агрегаты — из снимка уровней, пока не закрылся бар 30m
+        snap = _level_snapshot(symbol, pack)
+        with span("session"):
+            session_info = await _session_info(snap, kl)
 
-    # Индикаторы на origin_tf
-    if req.origin_tf == "30m":
-        inds = pack["indicators_30m"]
-    else:
-        inds = await get_origin_indicators(symbol, "60m")
+        # Индикаторы на origin_tf
+        consumers = ["session"]
+        if req.origin_tf == "30m":
+            inds = pack["indicators_30m"]
+            if pack["sources"].get("indicators_30m") == "local":
+                consumers.append("indicators_30m")
+        elif "1h" in missing:
+            inds = pack["indicators_30m"]
+            skipped.append("origin_indicators")
+        else:
+            origin_task = asyncio.ensure_future(_origin_indicators(snap, symbol, kl))
+            with span("origin_indicators"):
+                origin_ready = await _await_until(origin_task, deadline_at)
+            if origin_ready:
+                inds = origin_task.result()
+                if INDICATORS_SOURCE == "local":
+                    consumers.append("indicators_1h")
+            else:
+                inds = pack["indicators_30m"]
+                skipped.append("origin_indicators")
+    except BaseException:
+        for task in (filters_task, origin_task):
+            if task is not None:
+                task.cancel()
+        raise
 
     # tickSize: приближение от текущей цены
-    last_price = float(kl["5m"][-1]["close"])
+    last_price = float(kl["5m"].close[-1])
     tick_size = infer_tick_from_price(last_price)
 
     # Фильтры по RSI 12h и EMA200 12h
-    filters = await get_filters_12h(symbol)
+    with span("filters_12h"):
+        filters_ready = await _await_until(filters_task, deadline_at)
+    if filters_ready:
+        filters = filters_task.result()
+    else:
+        # Без фильтров 12h сделка не разрешается — как и при ошибке их загрузки
+        filters = {"rsi12h": None, "ema200_12h": None}
+        skipped.append("filters_12h")
     rsi12h = filters.get("rsi12h")
     ema200_12h = filters.get("ema200_12h")
     if req.origin_tf not in ("30m", "60m", "120m"):
         pass  # формально не требуется, но оставим для совместимости
+    degraded = {"missing_timeframes": missing, "skipped_checks": skipped} if missing or skipped else None
 
     # Условия пользователя:
     # long: rsi12h > 52 и price >= ema200_12h
@@ -224,24 +722,26 @@ async def intraday_search(req: LevelSearchRequest) -> IntradaySearchResponse:
     filters_ok = _flt_ok_long() if req.context == "long" else _flt_ok_short()
     if not filters_ok:
         return IntradaySearchResponse(
+            data_age_s=ages,
+            bars_used=bars_used(kl, consumers),
             decision="no_trade",
-            reason="filters_12h_blocked",
+            reason="filters_12h_timeout" if "filters_12h" in skipped else "filters_12h_blocked",
+            degraded=degraded,
         )
 
-    # Отладка session_info
-    print(f"DEBUG: session_info type: {type(session_info)}")
-    print(f"DEBUG: session_info content: {session_info}")
-    
+    trace_log("session_info", symbol=symbol, session_info=session_info)
+
     # Поиск лучшего уровня
-    res = find_best_level(
-        kl["5m"], kl["15m"], kl["30m"], kl["1h"], kl["4h"], session_info,
-        tick_size, {"atr": inds.get("atr"), "ema200": inds.get("ema200")}, 
-        side=req.context, origin_tf=req.origin_tf
-    )
+    consumers.append("levels")
+    with span("find_best_level"):
+        res = await _best_level(snap, kl, session_info, tick_size, inds, req.context, req.origin_tf)
     if not res:
         return IntradaySearchResponse(
+            data_age_s=ages,
+            bars_used=bars_used(kl, consumers),
             decision="no_trade",
-            reason="no valid level found at current criteria"
+            reason="no valid level found at current criteria",
+            degraded=degraded,
         )
 
     # Расчет ордеров с реальными уровнями сопротивления/поддержки
@@ -252,9 +752,6 @@ async def intraday_search(req: LevelSearchRequest) -> IntradaySearchResponse:
     # Получаем пивоты из session_info
     pivots = session_info.get("pivots_daily", {}) if isinstance(session_info, dict) else {}
     
-    # Отладочная информация
-    print(f"DEBUG: Available pivots for {req.symbol}: {pivots}")
-    
     if req.context == "long":
         entry = level
         # SL: ближайший уровень поддержки ниже (S1, S2, S3, S4)
@@ -265,16 +762,13 @@ async def intraday_search(req: LevelSearchRequest) -> IntradaySearchResponse:
                     sl_val = float(pivots[key])
                     if sl_val < entry:
                         sl_candidates.append(sl_val)
-                        print(f"DEBUG: SL candidate {key}: {sl_val}")
                 except:
                     continue
         
         if sl_candidates:
             sl = max(sl_candidates)  # ближайший уровень поддержки
-            print(f"DEBUG: Selected SL: {sl}")
         else:
             sl = entry - max(atr * 2, 3*tick_size)  # fallback на ATR
-            print(f"DEBUG: SL fallback: {sl}")
         
         # TP: ближайший уровень сопротивления выше (R1, R2, R3, R4)
         tp_candidates = []
@@ -284,18 +778,15 @@ async def intraday_search(req: LevelSearchRequest) -> IntradaySearchResponse:
                     tp_val = float(pivots[key])
                     if tp_val > entry:
                         tp_candidates.append(tp_val)
-                        print(f"DEBUG: TP candidate {key}: {tp_val}")
                 except:
                     continue
         
         if tp_candidates:
             tp1 = min(tp_candidates)  # ближайший уровень сопротивления
-            print(f"DEBUG: Selected TP: {tp1}")
         else:
             # Fallback: минимальное соотношение 1:1.5
             risk = entry - sl
             tp1 = entry + (risk * 1.5)
-            print(f"DEBUG: TP fallback: {tp1}")
             
     else:  # short
         entry = level
@@ -332,6 +823,9 @@ async def intraday_search(req: LevelSearchRequest) -> IntradaySearchResponse:
             # Fallback: минимальное соотношение 1:1.5
             risk = sl - entry
             tp1 = entry - (risk * 1.5)
+
+    trace_log("orders", symbol=symbol, side=req.context, pivots=pivots, entry=entry,
+              sl=sl, sl_candidates=sl_candidates, tp=tp1, tp_candidates=tp_candidates)
     
     # Рассчитываем проценты и соотношение риск/прибыль
     if req.context == "long":
@@ -359,13 +853,17 @@ async def intraday_search(req: LevelSearchRequest) -> IntradaySearchResponse:
         }
 
     return IntradaySearchResponse(
+        data_age_s=ages,
+        bars_used=bars_used(kl, consumers),
         decision=f"enter_{req.context}",
         reason="valid level found",
         level={
             "price": level,
-            "score": res["score"],
+            # При пропущенных проверках — сниженная оценка, исходная — в raw_score
+            "score": degraded_score(res["score"], skipped) if skipped else res["score"],
             "confluence": res["confluence"],
-            "tolerance": tol
+            "tolerance": tol,
+            **({"raw_score": res["score"]} if skipped else {}),
         },
         orders={
             "entry": {"type": "limit", "price": entry},
@@ -375,6 +873,7 @@ async def intraday_search(req: LevelSearchRequest) -> IntradaySearchResponse:
         # Добавляем key_levels для userbot
         key_levels=key_levels,
         last_price=current_price,
+        degraded=degraded,
         # Дополнительная информация для торгового сетапа
         trade_setup={
             "entry_price": entry,
@@ -391,6 +890,65 @@ async def intraday_search(req: LevelSearchRequest) -> IntradaySearchResponse:
     )
 
 
+def _batch_error(e: BaseException) -> Dict[str, Any]:
+    if isinstance(e, HTTPException):
+        return {"status": e.status_code, "error": e.detail}
+    logger.exception("Batch level search item failed", exc_info=e)
+    return {"status": 500, "error": str(e)}
+
+@app.post("/levels/intraday-search/batch")
+async def intraday_search_batch(req: LevelSearchBatchRequest) -> StreamingResponse:
+    """
+    Поиск уровней для многих символов одним запросом. Пакет каждого различного символа
+    загружается один раз (не больше BATCH_SYMBOL_CONCURRENCY одновременно, в общем бюджете
+    апстримов), уровни считаются в пуле compute. Ответ — NDJSON в порядке готовности:
+    {"index", "symbol", "context", "origin_tf", "status", "result" | "error"}.
+    """
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"Too many items: {len(req.items)} > {BATCH_MAX_ITEMS}")
+    sem = asyncio.Semaphore(BATCH_SYMBOL_CONCURRENCY)
+
+    async def load(symbol: str, max_age: Optional[float]) -> Dict[str, Any]:
+        async with sem:
+            with priority_scope(PRIORITY_SIGNAL):
+                return await fetch_pack(symbol, max_age=max_age)
+
+    async def run_item(index: int, item: LevelSearchRequest,
+                       packs: Dict[Tuple[str, Optional[float]], asyncio.Task]) -> Dict[str, Any]:
+        line = {"index": index, "symbol": item.symbol.upper(), "context": item.context,
+                "origin_tf": item.origin_tf}
+        try:
+            deadline_at = _deadline_at(item)
+            symbol = _allowed_symbol(item.symbol)
+            pack = await _pack_by_deadline(packs[(symbol, item.max_data_age_s)], symbol,
+                                           item.max_data_age_s, deadline_at)
+            res = await _evaluate_search(item, symbol, pack, deadline_at)
+            line.update(status=200, result=jsonable_encoder(res))
+        except Exception as e:
+            line.update(_batch_error(e))
+        return line
+
+    async def lines():
+        packs: Dict[Tuple[str, Optional[float]], asyncio.Task] = {}
+        for item in req.items:
+            symbol = item.symbol.upper()
+            key = (symbol, item.max_data_age_s)
+            if key not in packs and symbol in {s.upper() for s in SYMBOLS}:
+                prefetcher.touch(symbol)
+                packs[key] = asyncio.ensure_future(load(*key))
+        tasks = [asyncio.ensure_future(run_item(i, item, packs)) for i, item in enumerate(req.items)]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield json.dumps(await fut, ensure_ascii=False) + "\n"
+        finally:
+            # Клиент отключился — не продолжаем загрузку и расчёт
+            for t in tasks + list(packs.values()):
+                t.cancel()
+            await asyncio.gather(*tasks, *packs.values(), return_exceptions=True)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @app.post("/cursor/run", response_model=CursorRunResponse)
 async def cursor_run(req: CursorRunRequest) -> CursorRunResponse:
     symbol = req.setup.symbol.upper()
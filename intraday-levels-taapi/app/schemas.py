@@ -6,6 +6,16 @@ class LevelSearchRequest(BaseModel):
     symbol: str
     context: Literal["long", "short"]
     origin_tf: Literal["30m", "60m", "120m"] = "30m"
+    # Предел возраста данных любого ТФ (сек): более старый пакет перезагружается
+    max_data_age_s: Optional[float] = None
+    # Вернуть в ответе время этапов запроса (поле timings)
+    debug: bool = False
+    # Общий дедлайн запроса (мс): не успевшие ТФ пропускаются, уровень ищется по остальным
+    deadline_ms: Optional[float] = None
+
+class LevelSearchBatchRequest(BaseModel):
+    # Результаты приходят NDJSON в порядке готовности; index — позиция элемента в items
+    items: List[LevelSearchRequest]
 
 class BallFlip(BaseModel):
     symbol: str
@@ -121,6 +131,16 @@ class IntradaySearchResponse(BaseModel):
     key_levels: Optional[Dict[str, Any]] = None
     last_price: Optional[float] = None
     trade_setup: Optional[Dict[str, Any]] = None
+    # Возраст данных по ТФ (сек) на момент ответа
+    data_age_s: Optional[Dict[str, float]] = None
+    # Сколько последних баров каждого ТФ прочитали расчёты ответа
+    bars_used: Optional[Dict[str, int]] = None
+    # CPU-расчёты запроса в пуле: число вызовов, ожидание в очереди и время расчёта (мс)
+    compute: Optional[Dict[str, float]] = None
+    # Время этапов запроса, мс (только при debug=true)
+    timings: Optional[Dict[str, float]] = None
+    # Частичный расчёт по дедлайну: недостающие ТФ и пропущенные проверки
+    degraded: Optional[Dict[str, Any]] = None
 
 
 class ChartRequest(BaseModel):
@@ -3,14 +3,21 @@ Binance API fallback service for when Taapi.io is unavailable.
 Provides basic candles and simple indicators using Binance public API.
 """
 
-import httpx
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Any, Optional
 import logging
 
+from app.services.http_clients import http_clients
+from app.services.candle_store import candle_store
+from app.services.candles import Candles, as_candles
+
 logger = logging.getLogger(__name__)
 
+# Колонки Candles -> короткие колонки, на которых написаны расчёты ниже
+_SHORT_COLUMNS = {"open": "o", "high": "h", "low": "l", "close": "c", "volume": "v"}
+
+
 class BinanceFallbackService:
     """Fallback service using Binance public API when Taapi.io fails."""
     
@@ -25,46 +32,43 @@ class BinanceFallbackService:
         "4h": "4h"
     }
     
-    async def get_candles(self, symbol: str, timeframe: str, limit: int = 100) -> List[Dict]:
-        """Get candles from Binance API."""
+    MAX_LIMIT = 1000
+    
+    async def get_candles(self, symbol: str, timeframe: str, limit: int = 100) -> Candles:
+        """
+        Get candles (columnar Candles) from candle_store,
+        fetching only bars newer than the last stored one from Binance.
+        """
         if timeframe not in self.TIMEFRAME_MAP:
             raise ValueError(f"Unsupported timeframe: {timeframe}")
-            
+        return await candle_store.get(
+            symbol, timeframe, limit,
+            lambda n: self._fetch_candles(symbol, timeframe, n),
+            max_fetch=self.MAX_LIMIT,
+        )
+    
+    async def _fetch_candles(self, symbol: str, timeframe: str, limit: int) -> Candles:
+        """Get last `limit` candles from Binance API."""
         interval = self.TIMEFRAME_MAP[timeframe]
         url = f"{self.BASE_URL}/klines"
         
         params = {
             "symbol": symbol,
             "interval": interval,
-            "limit": min(limit, 1000)  # Binance limit
+            "limit": min(limit, self.MAX_LIMIT)  # Binance limit
         }
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                # Convert Binance format to our format
-                candles = []
-                for kline in data:
-                    candles.append({
-                        "t": int(kline[0]),  # timestamp
-                        "o": float(kline[1]),  # open
-                        "h": float(kline[2]),  # high
-                        "l": float(kline[3]),  # low
-                        "c": float(kline[4]),  # close
-                        "v": float(kline[5])   # volume
-                    })
-                
-                return candles
-                
+            response = await http_clients.get(url, params=params, timeout=10.0)
+            # Convert Binance format ([open_time, o, h, l, c, v, ...]) to Candles
+            return Candles.from_binance_klines(response.json())
+            
         except Exception as e:
             logger.error(f"Binance API error for {symbol} {timeframe}: {e}")
             raise
     
-    def calculate_simple_indicators(self, candles: List[Dict]) -> Dict[str, float]:
-        """Calculate simple indicators from candles."""
+    def calculate_simple_indicators(self, candles: Candles) -> Dict[str, float]:
+        """Calculate simple indicators from candles (Candles or list of candle dicts)."""
         if len(candles) < 50:
             return {
                 "atr": None,
@@ -74,8 +78,7 @@ class BinanceFallbackService:
                 "adx": None
             }
         
-        df = pd.DataFrame(candles)
-        df = df.sort_values('t')
+        df = as_candles(candles).to_frame().rename(columns=_SHORT_COLUMNS)
         
         # Calculate ATR (simplified)
         df['high_low'] = df['h'] - df['l']
@@ -113,13 +116,12 @@ class BinanceFallbackService:
             "adx": float(adx) if not pd.isna(adx) else None
         }
     
-    async def get_simple_levels(self, symbol: str, candles_4h: List[Dict]) -> Dict[str, Any]:
+    async def get_simple_levels(self, symbol: str, candles_4h: Candles) -> Dict[str, Any]:
         """Get simple support/resistance levels from 4h candles."""
         if len(candles_4h) < 20:
             return {"support_levels": [], "resistance_levels": []}
         
-        df = pd.DataFrame(candles_4h)
-        df = df.sort_values('t')
+        df = as_candles(candles_4h).to_frame().rename(columns=_SHORT_COLUMNS)
         
         # Simple pivot points
         recent_data = df.tail(20)
@@ -1,119 +1,261 @@
+import asyncio
+import sys
 import time
-from typing import Any, Dict, Tuple, Optional, List
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple, Optional, List
 import logging
 
+import numpy as np
+
+from app.config import CACHE_MAX_ENTRIES, CACHE_MAX_BYTES
+
 logger = logging.getLogger(__name__)
 
+
+def approx_size(value: Any, _depth: int = 0) -> int:
+    """Приблизительный размер значения в байтах (контейнеры — рекурсивно, на ограниченную глубину)."""
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, (int, np.integer)):
+        return int(nbytes)
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(approx_size(v, _depth + 1) for v in value)
+    return size
+
+
 class TTLCache:
-    def __init__(self, ttl_seconds: int = 60):
+    """
+    Кэш с TTL, ограничением по числу записей и приблизительному объёму, LRU-вытеснением.
+
+    Истекшие записи удаляются при обращении и порциями при записи (очередь по времени
+    истечения), без полного прохода по кэшу. get_or_load склеивает одновременные промахи
+    по одному ключу в одну загрузку.
+
+    grace_seconds > 0 включает stale-while-revalidate: просроченная запись хранится ещё
+    grace_seconds, и get_or_load(stale_ok=...) отдаёт её сразу, обновляя значение в фоне.
+    """
+
+    def __init__(self, ttl_seconds: int = 60,
+                 max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES,
+                 grace_seconds: float = 0,
+                 clock: Callable[[], float] = time.time):
         self.ttl = ttl_seconds
-        self._store: Dict[str, Tuple[float, Any]] = {}
+        self.grace = grace_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._clock = clock
+        # key -> (expires_at, value, size); порядок — от давно использованных к недавним
+        self._store: "OrderedDict[str, Tuple[float, Any, int]]" = OrderedDict()
+        # key -> expires_at + grace; порядок — по времени записи (≈ по времени истечения)
+        self._expiry: "OrderedDict[str, float]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self._counters = {
+            "hits": 0, "misses": 0, "evictions": 0, "expirations": 0,
+            "coalesced": 0, "loads": 0, "load_errors": 0,
+            "stale_hits": 0, "background_refreshes": 0,
+        }
 
-    def get(self, key: str) -> Optional[Any]:
-        """Получение значения из кэша"""
+    # --- внутреннее -------------------------------------------------------
+
+    def _remove(self, key: str) -> None:
+        item = self._store.pop(key, None)
+        self._expiry.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    def _purge_expired(self, limit: Optional[int] = None) -> None:
+        """Снять истекшие записи с начала очереди истечения (не более limit за вызов)."""
+        now = self._clock()
+        removed = 0
+        while self._expiry and (limit is None or removed < limit):
+            key, exp = next(iter(self._expiry.items()))
+            if exp > now:
+                break
+            self._remove(key)
+            self._counters["expirations"] += 1
+            removed += 1
+        if removed:
+            logger.debug(f"Cleaned up {removed} expired cache entries")
+
+    def _evict(self) -> None:
+        """Вытеснить давно неиспользуемые записи до попадания в лимиты."""
+        while self._store and (len(self._store) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._store))
+            self._remove(key)
+            self._counters["evictions"] += 1
+            logger.debug(f"Cache evicted key: {key}")
+
+    def _lookup(self, key: str, allow_stale: bool = False) -> Optional[Tuple[float, Any, int]]:
         item = self._store.get(key)
-        if not item:
+        if item is None:
             return None
-        
-        exp, val = item
-        if time.time() > exp:
-            self._store.pop(key, None)
+        now = self._clock()
+        if now > item[0] + self.grace:
+            self._remove(key)
+            self._counters["expirations"] += 1
             logger.debug(f"Cache expired for key: {key}")
             return None
-        
+        if now > item[0] and not allow_stale:
+            return None
+        return item
+
+    def _start_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Запустить загрузку ключа (или вернуть уже идущую)."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self._counters["coalesced"] += 1
+            return task
+
+        async def load() -> Any:
+            try:
+                result = await loader()
+                self.set(key, result)
+                return result
+            except BaseException:
+                self._counters["load_errors"] += 1
+                raise
+            finally:
+                self._inflight.pop(key, None)
+
+        self._counters["loads"] += 1
+        task = asyncio.ensure_future(load())
+        self._inflight[key] = task
+        return task
+
+    # --- API --------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Any]:
+        """Получение значения из кэша"""
+        item = self._lookup(key)
+        if item is None:
+            self._counters["misses"] += 1
+            return None
+        self._store.move_to_end(key)
+        self._counters["hits"] += 1
         logger.debug(f"Cache hit for key: {key}")
-        return val
+        return item[1]
 
     def set(self, key: str, value: Any) -> None:
         """Установка значения в кэш"""
-        self._store[key] = (time.time() + self.ttl, value)
+        self._remove(key)
+        exp = self._clock() + self.ttl
+        size = approx_size(value)
+        self._store[key] = (exp, value, size)
+        self._expiry[key] = exp + self.grace
+        self._bytes += size
+        # Амортизированная очистка: несколько истекших записей за каждую запись
+        self._purge_expired(limit=8)
+        self._evict()
         logger.debug(f"Cache set for key: {key}")
 
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]],
+                          stale_ok: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Значение из кэша или результат loader(). Одновременные промахи по ключу ждут одну
+        загрузку; ошибка загрузки получают все ожидающие, в кэш она не попадает.
+        Если задан stale_ok, просроченная запись в пределах grace, для которой stale_ok(value)
+        истинно, возвращается сразу, а загрузка запускается в фоне.
+        """
+        item = self._lookup(key, allow_stale=stale_ok is not None)
+        if item is not None:
+            exp, value, _ = item
+            if self._clock() <= exp:
+                self._store.move_to_end(key)
+                self._counters["hits"] += 1
+                return value
+            if stale_ok(value):
+                self._counters["stale_hits"] += 1
+                self.refresh(key, loader)
+                return value
+        self._counters["misses"] += 1
+        # Отмена одного ожидающего не отменяет загрузку для остальных
+        return await asyncio.shield(self._start_load(key, loader))
+
+    async def reload(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Загрузить значение заново, минуя кэш (с присоединением к уже идущей загрузке)."""
+        return await asyncio.shield(self._start_load(key, loader))
+
+    def refresh(self, key: str, loader: Callable[[], Awaitable[Any]]) -> None:
+        """Фоновое обновление ключа; ошибка логируется, старое значение остаётся до конца grace."""
+        if key in self._inflight:
+            return
+        self._counters["background_refreshes"] += 1
+        task = self._start_load(key, loader)
+
+        def _done(t: asyncio.Future) -> None:
+            if not t.cancelled() and t.exception() is not None:
+                logger.warning(f"Background refresh failed for {key}: {t.exception()}")
+        task.add_done_callback(_done)
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Значение, в том числе просроченное в пределах grace, без учёта в статистике и LRU."""
+        item = self._lookup(key, allow_stale=True)
+        return item[1] if item is not None else None
+
     def clear(self) -> None:
         """Очистка всего кэша"""
         self._store.clear()
+        self._expiry.clear()
+        self._bytes = 0
         logger.info("Cache cleared")
 
     def delete(self, key: str) -> bool:
         """Удаление конкретного ключа"""
         if key in self._store:
-            del self._store[key]
+            self._remove(key)
             logger.debug(f"Cache deleted for key: {key}")
             return True
         return False
 
     def exists(self, key: str) -> bool:
         """Проверка существования ключа"""
-        item = self._store.get(key)
-        if not item:
-            return False
-        
-        exp, _ = item
-        if time.time() > exp:
-            self._store.pop(key, None)
-            return False
-        
-        return True
-
-    def keys(self) -> List[str]:
-        """Получение всех ключей (с очисткой истекших)"""
-        current_time = time.time()
-        expired_keys = []
-        
-        for key, (exp, _) in self._store.items():
-            if current_time > exp:
-                expired_keys.append(key)
-        
-        # Удаляем истекшие ключи
-        for key in expired_keys:
-            self._store.pop(key, None)
-        
-        return list(self._store.keys())
+        return self._lookup(key) is not None
+
+    def keys(self, limit: Optional[int] = None) -> List[str]:
+        """Ключи от недавно использованных к давним (не более limit)"""
+        self._purge_expired()
+        out = []
+        for key in reversed(self._store):
+            if limit is not None and len(out) >= limit:
+                break
+            out.append(key)
+        return out
 
     def size(self) -> int:
         """Получение размера кэша (с очисткой истекших)"""
-        self._cleanup_expired()
+        self._purge_expired()
         return len(self._store)
 
-    def _cleanup_expired(self) -> None:
-        """Очистка истекших записей"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, (exp, _) in self._store.items() 
-            if current_time > exp
-        ]
-        
-        for key in expired_keys:
-            self._store.pop(key, None)
-        
-        if expired_keys:
-            logger.debug(f"Cleaned up {len(expired_keys)} expired cache entries")
-
     def get_stats(self) -> Dict[str, Any]:
-        """Получение статистики кэша"""
-        self._cleanup_expired()
+        """Получение статистики кэша (счётчики, без перечисления ключей)"""
+        self._purge_expired()
+        lookups = self._counters["hits"] + self._counters["misses"]
         return {
             "size": len(self._store),
+            "bytes": self._bytes,
             "ttl_seconds": self.ttl,
-            "keys": list(self._store.keys())
+            "grace_seconds": self.grace,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "inflight": len(self._inflight),
+            **self._counters,
+            "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else None,
         }
 
     def update_ttl(self, new_ttl: int) -> None:
-        """Обновление TTL для кэша"""
+        """Обновление TTL для кэша (для новых записей)"""
         self.ttl = new_ttl
         logger.info(f"Cache TTL updated to {new_ttl} seconds")
 
     def get_with_ttl(self, key: str) -> Optional[Tuple[Any, float]]:
         """Получение значения с оставшимся TTL"""
-        item = self._store.get(key)
-        if not item:
-            return None
-        
-        exp, val = item
-        remaining_ttl = exp - time.time()
-        
-        if remaining_ttl <= 0:
-            self._store.pop(key, None)
+        item = self._lookup(key)
+        if item is None:
             return None
-        
-        return val, remaining_ttl 
\ No newline at end of file
+        return item[1], item[0] - self._clock()
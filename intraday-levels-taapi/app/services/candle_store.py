@@ -0,0 +1,137 @@
+"""
+Инкрементальное хранилище свечей по (symbol, timeframe).
+
+История хранится между запросами; при обновлении у апстрима запрашиваются только бары
+новее последнего сохранённого open time (плюс сам последний бар — он мог быть ещё не закрыт).
+Незакрытый бар заменяется на месте, ряд обрезается до окна RESULTS.
+"""
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.services.candles import Candles
+
+logger = logging.getLogger(__name__)
+
+# Длительность бара в миллисекундах
+TF_MS = {
+    "1m": 60_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "30m": 1_800_000,
+    "1h": 3_600_000,
+    "60m": 3_600_000,
+    "2h": 7_200_000,
+    "120m": 7_200_000,
+    "4h": 14_400_000,
+    "12h": 43_200_000,
+    "1d": 86_400_000,
+}
+
+
+def store_key(symbol: str, timeframe: str) -> Tuple[str, str]:
+    return symbol.replace("/", "").upper(), timeframe
+
+
+class CandleStore:
+    """История свечей в памяти с дельта-обновлением."""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._series: Dict[Tuple[str, str], Candles] = {}
+        self._short: set = set()
+        self.stats = {"full_fetches": 0, "delta_fetches": 0, "bars_fetched": 0}
+
+    def series(self, symbol: str, timeframe: str) -> Candles:
+        return self._series.get(store_key(symbol, timeframe)) or Candles.empty()
+
+    def last_open_ms(self, symbol: str, timeframe: str) -> Optional[int]:
+        s = self.series(symbol, timeframe)
+        return int(s.t[-1]) if len(s) else None
+
+    def delta_size(self, symbol: str, timeframe: str, window: int) -> int:
+        """Сколько баров запросить: число закрывшихся с последнего open time + 1 (перезапрос текущего)."""
+        last = self.last_open_ms(symbol, timeframe)
+        tf_ms = TF_MS.get(timeframe)
+        if last is None or tf_ms is None:
+            return window
+        elapsed = max(0, int(self._clock() * 1000) - last) // tf_ms
+        return min(window, elapsed + 1)
+
+    def merge(self, symbol: str, timeframe: str, candles: Candles, window: int) -> Candles:
+        """
+        Слить новые свечи в историю: бары с тем же open time заменяются (незакрытый бар),
+        более новые дописываются. Возвращает ряд, обрезанный до window.
+        """
+        key = store_key(symbol, timeframe)
+        cur = self._series.get(key) or Candles.empty()
+        if not len(candles):
+            return cur.tail(window)
+        # Отрезаем из истории всё, что перекрывается новыми данными
+        cut = int(np.searchsorted(cur.t, candles.t[0], side="left"))
+        merged = Candles.concat([cur[:cut], candles]).tail(window)
+        self._series[key] = merged
+        return merged
+
+    def is_contiguous(self, symbol: str, timeframe: str, candles: Candles) -> bool:
+        """Дельта стыкуется с историей без пропуска баров."""
+        last = self.last_open_ms(symbol, timeframe)
+        tf_ms = TF_MS.get(timeframe)
+        if last is None or tf_ms is None or not len(candles):
+            return True
+        return int(candles.t[0]) <= last + tf_ms
+
+    def absorb(self, symbol: str, timeframe: str, candles: Candles, window: int) -> Candles:
+        """Принять свечи от апстрима: при разрыве с историей она отбрасывается, иначе — merge."""
+        if not self.is_contiguous(symbol, timeframe, candles):
+            self._series.pop(store_key(symbol, timeframe), None)
+        return self.merge(symbol, timeframe, candles, window)
+
+    async def get(self, symbol: str, timeframe: str, window: int,
+                  fetch: Callable[[int], Awaitable[Candles]],
+                  max_fetch: Optional[int] = None) -> Candles:
+        """
+        Ряд из хранилища, обновлённый у апстрима: fetch(n) должен вернуть последние n баров
+        (max_fetch — предел источника за один запрос, напр. 1000 у Binance, 20 у bulk).
+        Пустая/неполная история или разрыв больше предела — полная загрузка.
+        """
+        key = store_key(symbol, timeframe)
+        cap = min(window, max_fetch or window)
+        have = len(self._series.get(key) or Candles.empty())
+        n = self.delta_size(symbol, timeframe, window)
+
+        if have > 0 and n < cap and (have >= cap or key in self._short):
+            candles = await fetch(n)
+            self.stats["delta_fetches"] += 1
+            self.stats["bars_fetched"] += len(candles)
+            if self.is_contiguous(symbol, timeframe, candles):
+                return self.merge(symbol, timeframe, candles, window)
+            logger.debug(f"Candle gap for {symbol} {timeframe}, refetching full window")
+
+        candles = await fetch(cap)
+        self.stats["full_fetches"] += 1
+        self.stats["bars_fetched"] += len(candles)
+        # История у источника короче запрошенного окна — дальше обновляем дельтами
+        if len(candles) < cap:
+            self._short.add(key)
+        else:
+            self._short.discard(key)
+        return self.absorb(symbol, timeframe, candles, window)
+
+    def clear(self) -> None:
+        self._series.clear()
+        self._short.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "series": len(self._series),
+            "bars": sum(len(s) for s in self._series.values()),
+            "bytes": sum(s.nbytes for s in self._series.values()),
+        }
+
+
+# Глобальный экземпляр хранилища
+candle_store = CandleStore()
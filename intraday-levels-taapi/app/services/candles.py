@@ -0,0 +1,161 @@
+"""
+Колоночное представление свечей.
+
+Candles хранит ряд в непрерывных NumPy-массивах: open time в int64 epoch-ms и OHLCV во float64.
+Срезы и tail() возвращают представления без копирования данных. В dict'ы со строковым ISO-временем
+свечи превращаются только на границе API (to_records); для совместимости индекс по int
+отдаёт одну такую строку, а итерация — строки по очереди.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ("open", "high", "low", "close", "volume")
+# Короткие имена полей (Binance fallback / старые ответы TAAPI)
+_SHORT = {"open": "o", "high": "h", "low": "l", "close": "c", "volume": "v"}
+
+
+def to_epoch_ms(ts: Any) -> int:
+    """Время в epoch-ms из секунд/миллисекунд или ISO-8601."""
+    if isinstance(ts, (int, float, np.integer, np.floating)):
+        return int(ts if ts > 10**12 else ts * 1000)
+    return int(datetime.fromisoformat(str(ts).replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def iso_from_ms(ms: int) -> str:
+    return datetime.fromtimestamp(int(ms) / 1000, tz=timezone.utc).isoformat()
+
+
+class Candles:
+    """Ряд свечей в виде колонок: t (int64 epoch-ms), open/high/low/close/volume (float64)."""
+
+    __slots__ = ("t",) + FIELDS
+
+    def __init__(self, t: np.ndarray, open: np.ndarray, high: np.ndarray,
+                 low: np.ndarray, close: np.ndarray, volume: np.ndarray):
+        self.t = t
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    # --- конструкторы -----------------------------------------------------
+
+    @classmethod
+    def empty(cls) -> "Candles":
+        return cls(np.empty(0, dtype=np.int64), *(np.empty(0, dtype=np.float64) for _ in FIELDS))
+
+    @classmethod
+    def from_arrays(cls, t: Sequence[Any], open: Sequence[Any], high: Sequence[Any],
+                    low: Sequence[Any], close: Sequence[Any], volume: Sequence[Any],
+                    sort: bool = True) -> "Candles":
+        """Из параллельных последовательностей (обрезка до общей длины, сортировка по времени)."""
+        n = min(len(t), len(open), len(high), len(low), len(close), len(volume))
+        t_arr = np.asarray(t[:n], dtype=np.float64)
+        # секунды -> миллисекунды
+        if n and t_arr.max() < 10**12:
+            t_arr = t_arr * 1000
+        cols = [np.asarray(x[:n], dtype=np.float64) for x in (open, high, low, close, volume)]
+        c = cls(t_arr.astype(np.int64), *cols)
+        if sort and n > 1 and np.any(np.diff(c.t) < 0):
+            order = np.argsort(c.t, kind="stable")
+            c = c.take(order)
+        return c
+
+    @classmethod
+    def from_records(cls, rows: Iterable[Dict[str, Any]]) -> "Candles":
+        """Из списка dict'ов ({'t', 'open', ...} или {'t', 'o', ...}); строки без времени пропускаются."""
+        t, cols = [], {f: [] for f in FIELDS}
+        for r in rows:
+            if not isinstance(r, dict):
+                continue
+            ts = r.get("timestamp") or r.get("time") or r.get("t")
+            if ts is None:
+                continue
+            t.append(to_epoch_ms(ts))
+            for f in FIELDS:
+                v = r.get(f, r.get(_SHORT[f]))
+                cols[f].append(float(v) if v is not None else 0.0)
+        return cls.from_arrays(t, *(cols[f] for f in FIELDS))
+
+    @classmethod
+    def from_binance_klines(cls, klines: List[List[Any]]) -> "Candles":
+        """Из ответа Binance /klines: [[open_time, o, h, l, c, v, ...], ...]."""
+        if not klines:
+            return cls.empty()
+        arr = np.asarray([k[:6] for k in klines], dtype=np.float64)
+        return cls(arr[:, 0].astype(np.int64), *(np.ascontiguousarray(arr[:, i]) for i in range(1, 6)))
+
+    @classmethod
+    def concat(cls, parts: Sequence["Candles"]) -> "Candles":
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+        return cls(np.concatenate([p.t for p in parts]),
+                   *(np.concatenate([getattr(p, f) for p in parts]) for f in FIELDS))
+
+    # --- доступ -----------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+    def __bool__(self) -> bool:
+        return len(self.t) > 0
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union["Candles", Dict[str, Any]]:
+        if isinstance(idx, slice):
+            # Срез по базовым срезам numpy — представление без копирования
+            return Candles(self.t[idx], *(getattr(self, f)[idx] for f in FIELDS))
+        return self.row(idx)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """Одна свеча в виде dict'а (время — ISO-8601)."""
+        return {"t": iso_from_ms(self.t[i]), **{f: float(getattr(self, f)[i]) for f in FIELDS}}
+
+    def tail(self, n: int) -> "Candles":
+        """Последние n свечей (представление)."""
+        return self[-n:] if n > 0 else self[0:0]
+
+    def take(self, idx: np.ndarray) -> "Candles":
+        return Candles(self.t[idx], *(getattr(self, f)[idx] for f in FIELDS))
+
+    def last_close(self) -> Optional[float]:
+        return float(self.close[-1]) if len(self) else None
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.t.nbytes + sum(getattr(self, f).nbytes for f in FIELDS))
+
+    # --- граница API ------------------------------------------------------
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Список dict'ов {'t': iso8601, 'open', 'high', 'low', 'close', 'volume'} — только для ответа API."""
+        t_iso = [iso_from_ms(x) for x in self.t.tolist()]
+        cols = [getattr(self, f).tolist() for f in FIELDS]
+        keys = ("t",) + FIELDS
+        return [dict(zip(keys, row)) for row in zip(t_iso, *cols)]
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame для pandas-расчётов (t — epoch-ms)."""
+        return pd.DataFrame({"t": self.t, **{f: getattr(self, f) for f in FIELDS}})
+
+    def __repr__(self) -> str:
+        return f"Candles(n={len(self)})"
+
+
+def as_candles(data: Union["Candles", Iterable[Dict[str, Any]], None]) -> Candles:
+    """Привести вход (Candles или список dict'ов) к Candles."""
+    if isinstance(data, Candles):
+        return data
+    if data is None:
+        return Candles.empty()
+    return Candles.from_records(data)
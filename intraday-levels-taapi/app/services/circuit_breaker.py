@@ -0,0 +1,228 @@
+"""
+Circuit breaker по апстримам и хеджированные запросы TAAPI -> Binance.
+
+CircuitBreaker ведёт скользящее окно последних вызовов апстрима (успех, задержка):
+  - closed — запросы идут; доля ошибок или медленных вызовов (>= BREAKER_SLOW_CALL_MS)
+    в окне выше BREAKER_FAILURE_RATE — переход в open;
+  - open — апстрим не вызывается BREAKER_OPEN_SECONDS;
+  - half_open — пропускается не больше BREAKER_HALF_OPEN_PROBES пробных вызовов;
+    все успешны — closed, любая неудача — снова open.
+
+Hedger.call() вызывает основной источник, а если он не ответил за наблюдаемый p95 его задержки —
+параллельно запускает запасной; побеждает первый успешный ответ, проигравший отменяется.
+При открытом breaker основного источника запасной вызывается сразу.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from app.config import (
+    BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_FAILURE_RATE, BREAKER_SLOW_CALL_MS,
+    BREAKER_OPEN_SECONDS, BREAKER_HALF_OPEN_PROBES,
+    HEDGE_ENABLED, HEDGE_MIN_DELAY_MS, HEDGE_MAX_DELAY_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Сколько успешных вызовов нужно для оценки p95 (до этого — HEDGE_MAX_DELAY_MS)
+_MIN_LATENCY_SAMPLES = 10
+
+
+class CircuitOpenError(RuntimeError):
+    """Апстрим не вызывался: breaker открыт."""
+
+
+class CircuitBreaker:
+    """Breaker одного апстрима по скользящему окну ошибок и задержек."""
+
+    def __init__(self, name: str, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, slow_call_ms: float = BREAKER_SLOW_CALL_MS,
+                 open_seconds: float = BREAKER_OPEN_SECONDS, half_open_probes: int = BREAKER_HALF_OPEN_PROBES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_ms = slow_call_ms
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+        self._calls: Deque[Tuple[bool, float]] = deque(maxlen=window)
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self.stats = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "opened": 0}
+
+    def allow(self) -> bool:
+        """Можно ли сейчас вызвать апстрим (в half_open — занимает слот пробы)."""
+        if self.state == OPEN:
+            if self._clock() - self._opened_at < self.open_seconds:
+                self.stats["rejected"] += 1
+                return False
+            self.state, self._probes, self._probe_successes = HALF_OPEN, 0, 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self.stats["rejected"] += 1
+                return False
+            self._probes += 1
+        return True
+
+    def record(self, ok: bool, latency_ms: float) -> None:
+        """Итог вызова: ok=False — ошибка или вызов, отменённый как проигравший хедж."""
+        slow = latency_ms >= self.slow_call_ms
+        self.stats["calls"] += 1
+        self.stats["failures"] += not ok
+        self.stats["slow"] += ok and slow
+        self._calls.append((ok, latency_ms))
+        if self.state == HALF_OPEN:
+            if not ok or slow:
+                self._trip()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self.state = CLOSED
+                self._calls.clear()
+                logger.info(f"Circuit breaker {self.name}: closed")
+            return
+        if self.state == CLOSED and len(self._calls) >= self.min_calls:
+            bad = sum(1 for ok_, ms in self._calls if not ok_ or ms >= self.slow_call_ms)
+            if bad / len(self._calls) >= self.failure_rate:
+                self._trip()
+
+    def release(self) -> None:
+        """Вызов отменён до ответа: в half_open слот пробы возвращается."""
+        if self.state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    async def measure(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнить уже разрешённый (allow) вызов и учесть его итог и задержку."""
+        t0 = time.perf_counter()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Итог не известен (проигравший хедж учитывает Hedger) — освобождаем слот пробы
+            self.release()
+            raise
+        except Exception:
+            self.record(False, (time.perf_counter() - t0) * 1000)
+            raise
+        self.record(True, (time.perf_counter() - t0) * 1000)
+        return result
+
+    async def run(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Вызов через breaker: при открытом — CircuitOpenError без обращения к апстриму."""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker {self.name} is open")
+        return await self.measure(fn)
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self._opened_at = self._clock()
+        self.stats["opened"] += 1
+        logger.warning(f"Circuit breaker {self.name}: open for {self.open_seconds}s")
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        """Квантиль задержки успешных вызовов окна, мс (None — мало данных)."""
+        latencies = sorted(ms for ok, ms in self._calls if ok)
+        if len(latencies) < _MIN_LATENCY_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def hedge_delay(self) -> float:
+        """Через сколько секунд без ответа запускать хедж: p95 в пределах [min, max]."""
+        p95 = self.latency_quantile(0.95)
+        ms = HEDGE_MAX_DELAY_MS if p95 is None else min(max(p95, HEDGE_MIN_DELAY_MS), HEDGE_MAX_DELAY_MS)
+        return ms / 1000
+
+    def get_stats(self) -> Dict[str, Any]:
+        window = len(self._calls)
+        bad = sum(1 for ok, ms in self._calls if not ok or ms >= self.slow_call_ms)
+        p50, p95 = self.latency_quantile(0.5), self.latency_quantile(0.95)
+        return {
+            **self.stats,
+            "state": self.state,
+            "window": window,
+            "failure_rate": round(bad / window, 3) if window else 0.0,
+            "p50_ms": round(p50, 3) if p50 is not None else None,
+            "p95_ms": round(p95, 3) if p95 is not None else None,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 3),
+        }
+
+
+class Hedger:
+    """Хеджированный вызов основного источника с запасным и счётчики исходов."""
+
+    def __init__(self, primary: CircuitBreaker, fallback: CircuitBreaker, enabled: bool = HEDGE_ENABLED):
+        self.primary = primary
+        self.fallback = fallback
+        self.enabled = enabled
+        self.stats = {"calls": 0, "primary_only": 0, "hedged": 0, "primary_wins": 0,
+                      "fallback_wins": 0, "fallback_after_error": 0, "breaker_bypass": 0}
+
+    async def _run_fallback(self, fallback: Callable[[], Awaitable[Any]]) -> Any:
+        # Запасной источник — последний вариант: вызывается и при открытом собственном breaker
+        if self.fallback.allow():
+            return await self.fallback.measure(fallback)
+        return await fallback()
+
+    async def call(self, primary: Callable[[], Awaitable[Any]],
+                   fallback: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Результат и флаг «ответил основной источник»."""
+        self.stats["calls"] += 1
+        if not self.primary.allow():
+            self.stats["breaker_bypass"] += 1
+            return await self._run_fallback(fallback), False
+
+        started = time.perf_counter()
+        primary_task = asyncio.ensure_future(self.primary.measure(primary))
+        fallback_task: Optional[asyncio.Future] = None
+        try:
+            hedge = self.enabled and self.fallback.state == CLOSED
+            done, _ = await asyncio.wait({primary_task}, timeout=self.primary.hedge_delay() if hedge else None)
+            if not done:
+                self.stats["hedged"] += 1
+                fallback_task = asyncio.ensure_future(self._run_fallback(fallback))
+                pending = {primary_task, fallback_task}
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if not task.exception():
+                            won_primary = task is primary_task
+                            self.stats["primary_wins" if won_primary else "fallback_wins"] += 1
+                            if not won_primary and not primary_task.done():
+                                # Основной не ответил дольше запасного — для breaker это неудача
+                                self.primary.record(False, (time.perf_counter() - started) * 1000)
+                            return task.result(), won_primary
+                # Оба источника с ошибкой — наружу ошибка запасного
+                return fallback_task.result(), False
+            try:
+                result = primary_task.result()
+            except Exception as primary_error:
+                logger.warning(f"{self.primary.name} failed, using {self.fallback.name}: {primary_error}")
+                self.stats["fallback_after_error"] += 1
+                return await self._run_fallback(fallback), False
+            self.stats["primary_only"] += 1
+            return result, True
+        finally:
+            for task in (primary_task, fallback_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        hedged = self.stats["hedged"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "fallback_win_rate": round(self.stats["fallback_wins"] / hedged, 3) if hedged else None,
+            "breakers": {b.name: b.get_stats() for b in (self.primary, self.fallback)},
+        }
+
+
+# TAAPI — основной источник свечей, Binance — запасной
+taapi_breaker = CircuitBreaker("taapi")
+binance_breaker = CircuitBreaker("binance")
+candles_hedger = Hedger(taapi_breaker, binance_breaker)
@@ -5,8 +5,6 @@ import re
 import time
 from typing import Any, Dict, List, Optional, Tuple
 
-import httpx
-
 from app.config import (
     OPENAI_API_KEY,
     OPENAI_MODEL,
@@ -23,6 +21,8 @@ from app.services.taapi_bulk import (
     construct_candles,
     parse_bulk_candles,
 )
+from app.services.http_clients import http_clients
+from app.services.candles import Candles, iso_from_ms
 
 
 def _now_sec() -> int:
@@ -123,15 +123,15 @@ async def fetch_taapi_cursor_pack(symbol: str) -> Dict[str, Any]:
     macd12 = last_from_data(idx); idx += 1
     atr_12h = safe_indicator_value(idx); idx += 1
     # 4h candles
-    candles_4h = []
+    candles_4h = Candles.empty()
     last_4h_ts: Optional[str] = None
     if idx < len(results):
         try:
             candles_4h = parse_bulk_candles(results[idx])
             if candles_4h:
-                last_4h_ts = str(candles_4h[-1].get("t"))
+                last_4h_ts = iso_from_ms(candles_4h.t[-1])
         except Exception:
-            candles_4h = []
+            candles_4h = Candles.empty()
     idx += 1
 
     # Derived
@@ -187,12 +187,9 @@ async def fetch_taapi_cursor_pack(symbol: str) -> Dict[str, Any]:
     quality = {"missing_fields": missing}
 
     # Structure: last swing high/low via simple fractal 5/5
-    def last_swings_4h(candles: List[Dict[str, Any]]) -> Tuple[Optional[float], Optional[float]]:
-        try:
-            highs = [float(c.get("high")) for c in candles]
-            lows = [float(c.get("low")) for c in candles]
-        except Exception:
-            return None, None
+    def last_swings_4h(candles: Candles) -> Tuple[Optional[float], Optional[float]]:
+        highs = candles.high.tolist()
+        lows = candles.low.tolist()
         n = len(candles)
         if n < 11:
             return None, None
@@ -269,26 +266,24 @@ async def call_llm(payload: Dict[str, Any], prompt: str) -> Dict[str, Any]:
             pass
         return None
 
-    timeout = httpx.Timeout(OPENAI_TIMEOUT_SECONDS)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        # First attempt
-        r = await client.post(url, headers=headers, json=build_body())
-        r.raise_for_status()
-        data = r.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-        parsed = try_parse(content) if isinstance(content, str) else None
-        if parsed is not None:
-            return parsed
-
-        # One retry with explicit instruction
-        retry_body = build_body("Верни ТОЛЬКО JSON, без пояснений и без ```.")
-        rr = await client.post(url, headers=headers, json=retry_body)
-        rr.raise_for_status()
-        data2 = rr.json()
-        content2 = data2.get("choices", [{}])[0].get("message", {}).get("content", "")
-        parsed2 = try_parse(content2) if isinstance(content2, str) else None
-        if parsed2 is not None:
-            return parsed2
+    # LLM-запросы не повторяем автоматически: ретрай ниже — только при неразборчивом ответе
+    r = await http_clients.post(url, headers=headers, json=build_body(),
+                                timeout=OPENAI_TIMEOUT_SECONDS, retries=1)
+    data = r.json()
+    content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+    parsed = try_parse(content) if isinstance(content, str) else None
+    if parsed is not None:
+        return parsed
+
+    # One retry with explicit instruction
+    retry_body = build_body("Верни ТОЛЬКО JSON, без пояснений и без ```.")
+    rr = await http_clients.post(url, headers=headers, json=retry_body,
+                                 timeout=OPENAI_TIMEOUT_SECONDS, retries=1)
+    data2 = rr.json()
+    content2 = data2.get("choices", [{}])[0].get("message", {}).get("content", "")
+    parsed2 = try_parse(content2) if isinstance(content2, str) else None
+    if parsed2 is not None:
+        return parsed2
 
     # If still not parsable, return raw for debugging
     return {"raw": data}
@@ -301,9 +296,7 @@ async def maybe_notify_telegram(text: str) -> None:
     try:
         api = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
         payload = {"chat_id": TELEGRAM_CHAT_ID, "text": text[:3800], "disable_web_page_preview": True}
-        timeout = httpx.Timeout(10.0)
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            await client.post(api, json=payload)
+        await http_clients.post(api, json=payload, timeout=10.0, retries=1)
     except Exception:
         pass
 
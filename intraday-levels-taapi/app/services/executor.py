@@ -0,0 +1,120 @@
+"""
+Пул для CPU-расчётов уровней вне event loop.
+
+build_session_info, find_best_level, compute_candidates и расчёт индикаторов — чистые функции
+над массивами. Пока они считаются прямо в async-обработчике, стоят все остальные запросы
+и чтения апстримов. ComputeExecutor выполняет их:
+  - "thread"  — в пуле потоков (NumPy отпускает GIL на векторных операциях);
+  - "process" — в пуле процессов: аргументы — Candles (колоночные массивы), сериализуются
+    буферы NumPy, а не списки dict'ов свечей; функции должны быть импортируемыми;
+  - "inline"  — на месте, как раньше (для сравнения и отладки).
+Для каждого вызова меряются ожидание в очереди и время расчёта; compute_scope() собирает
+их по запросу, get_stats() — по всем вызовам.
+"""
+import asyncio
+import contextvars
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from app.config import COMPUTE_EXECUTOR, COMPUTE_WORKERS
+
+_request_stats: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "compute_request_stats", default=None
+)
+
+
+def _timed_call(fn: Callable[..., Any], args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Tuple[float, float, Any]:
+    """Выполняется в воркере: wall-время старта, длительность расчёта и результат."""
+    started = time.time()
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return started, time.perf_counter() - t0, result
+
+
+@contextmanager
+def compute_scope() -> Iterator[Dict[str, float]]:
+    """Собрать ожидание/время расчётов текущего запроса: {"calls", "queue_wait_ms", "compute_ms"}."""
+    stats = {"calls": 0, "queue_wait_ms": 0.0, "compute_ms": 0.0}
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+class ComputeExecutor:
+    """Асинхронный запуск чистых функций в пуле потоков/процессов с учётом времени."""
+
+    def __init__(self, kind: str = "thread", workers: int = 4):
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self._pool: Optional[Executor] = None
+        self._stats = {"calls": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0,
+                       "queue_wait_s": 0.0, "max_queue_wait_s": 0.0, "compute_s": 0.0}
+
+    def _executor(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compute")
+        return self._pool
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        submitted = time.time()
+        st = self._stats
+        st["in_flight"] += 1
+        st["max_in_flight"] = max(st["max_in_flight"], st["in_flight"])
+        try:
+            if self.kind == "inline":
+                started, compute_s, result = _timed_call(fn, args, kwargs)
+            else:
+                loop = asyncio.get_running_loop()
+                started, compute_s, result = await loop.run_in_executor(
+                    self._executor(), partial(_timed_call, fn, args, kwargs)
+                )
+        except BaseException:
+            st["errors"] += 1
+            raise
+        finally:
+            st["in_flight"] -= 1
+        wait_s = max(0.0, started - submitted)
+        st["calls"] += 1
+        st["queue_wait_s"] += wait_s
+        st["max_queue_wait_s"] = max(st["max_queue_wait_s"], wait_s)
+        st["compute_s"] += compute_s
+        req = _request_stats.get()
+        if req is not None:
+            req["calls"] += 1
+            req["queue_wait_ms"] += wait_s * 1000
+            req["compute_ms"] += compute_s * 1000
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        st = self._stats
+        calls = st["calls"]
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "calls": calls,
+            "errors": st["errors"],
+            "in_flight": st["in_flight"],
+            "max_in_flight": st["max_in_flight"],
+            "avg_queue_wait_ms": round(st["queue_wait_s"] / calls * 1000, 3) if calls else None,
+            "max_queue_wait_ms": round(st["max_queue_wait_s"] * 1000, 3),
+            "avg_compute_ms": round(st["compute_s"] / calls * 1000, 3) if calls else None,
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Global instance
+compute = ComputeExecutor(COMPUTE_EXECUTOR, COMPUTE_WORKERS)
@@ -0,0 +1,95 @@
+"""
+Быстрая JSON-сериализация ответов с рыночными данными.
+
+Ответы со свечами не проходят через jsonable_encoder (обход каждого вложенного dict'а
+в Python): тело кодируется сразу — через orjson, если он установлен, иначе через json.
+Свечи сериализуются из колонок Candles в одном из форматов:
+  - records — список {'t': iso8601, 'open', 'high', 'low', 'close', 'volume'}, как Candles.to_records();
+  - columnar — {'t': [epoch-ms], 'open': [...], ...}: компактнее, массивы кодируются целиком.
+Большие ответы по многим символам отдаются потоком NDJSON (stream_ndjson), а не собираются в памяти.
+"""
+import json
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, List, Literal
+
+import numpy as np
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.models import APIResponse
+from app.services.candles import FIELDS, Candles
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость: без неё — стандартный json
+    orjson = None
+
+CandleFormat = Literal["records", "columnar"]
+
+
+def _default(obj: Any) -> Any:
+    """Типы, которых не знает json: NumPy, время, Candles, pydantic-модели."""
+    if isinstance(obj, Candles):
+        return candles_payload(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """JSON в байтах (UTF-8, без экранирования не-ASCII)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _iso_times(t: np.ndarray) -> List[str]:
+    """epoch-ms -> ISO-8601 UTC как в Candles.to_records(), одним векторным преобразованием."""
+    iso = np.datetime_as_string(t.astype("datetime64[ms]"), unit="s").tolist()
+    if np.any(t % 1000):
+        # datetime.isoformat() пишет микросекунды только когда они ненулевые
+        iso = [s if ms % 1000 == 0 else s + f".{ms % 1000:03d}000"
+               for s, ms in zip(iso, t.tolist())]
+    return [s + "+00:00" for s in iso]
+
+
+def candles_payload(candles: Candles, fmt: CandleFormat = "records") -> Any:
+    """Свечи для ответа API прямо из колонок (без to_records и jsonable_encoder)."""
+    if fmt == "columnar":
+        # Массивы NumPy orjson кодирует целиком; без него — списки
+        cols = {f: getattr(candles, f) for f in FIELDS}
+        if orjson is None:
+            cols = {f: c.tolist() for f, c in cols.items()}
+        return {"t": candles.t if orjson is not None else candles.t.tolist(), **cols}
+    keys = ("t",) + FIELDS
+    cols = [getattr(candles, f).tolist() for f in FIELDS]
+    return [dict(zip(keys, row)) for row in zip(_iso_times(candles.t), *cols)]
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse с кодированием через dumps (orjson при наличии)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def stream_ndjson(rows: AsyncIterator[Any]) -> StreamingResponse:
+    """Поток NDJSON: строка на элемент rows, каждая кодируется по готовности."""
+    async def lines() -> AsyncIterator[bytes]:
+        async for row in rows:
+            yield dumps(row) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def api_payload(success: bool, data: Any = None, error: Any = None) -> Dict[str, Any]:
+    """Тело в форме APIResponse (success/data/error/timestamp) без валидации и обхода data."""
+    payload = APIResponse(success=success, error=error).model_dump()
+    payload["data"] = data
+    return payload
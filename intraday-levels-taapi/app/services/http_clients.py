@@ -0,0 +1,226 @@
+"""
+Общие пулы HTTP-соединений для всех апстримов (TAAPI, Binance, CoinGecko, OpenAI, Telegram).
+
+Один httpx.AsyncClient на хост с keep-alive, лимитами из настроек, опциональным HTTP/2
+и общей политикой повторов. Запросы к TAAPI и Binance проходят через регулятор частоты
+(rate_governor): он выдерживает лимиты тарифа и паузы после 429.
+
+Реестр создаётся в lifespan FastAPI (app.state.http_clients), устанавливается как текущий через
+use_http_clients и закрывается при остановке. Сервисы обращаются к нему через http_clients —
+ссылку на текущий реестр; вне приложения (скрипты, тесты) реестр по умолчанию создаётся лениво.
+"""
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.config import (
+    HTTP_TIMEOUT_SECONDS,
+    MAX_RETRIES,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP2_ENABLED,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+)
+from app.services.rate_governor import RateGovernor, governor as rate_governor
+
+logger = logging.getLogger(__name__)
+
+# Статусы, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def backoff_delay(attempt: int) -> float:
+    """Экспоненциальная задержка перед повтором номер `attempt` (с 1)."""
+    return min(RETRY_BACKOFF_BASE * (2 ** (attempt - 1)), RETRY_BACKOFF_MAX)
+
+
+class HttpClientRegistry:
+    """Реестр пулов соединений: по одному AsyncClient на scheme://host[:port]."""
+
+    def __init__(self,
+                 timeout: float = HTTP_TIMEOUT_SECONDS,
+                 max_connections: int = HTTP_MAX_CONNECTIONS,
+                 max_keepalive: int = HTTP_MAX_KEEPALIVE,
+                 keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+                 http2: bool = HTTP2_ENABLED,
+                 max_retries: int = MAX_RETRIES,
+                 governor: Optional[RateGovernor] = rate_governor):
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2 and not _http2_available():
+            logger.warning("HTTP2_ENABLED=1, but package 'h2' is not installed; using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.max_retries = max_retries
+        self.governor = governor
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def _host_key(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        """Пул соединений для хоста из url (создаётся при первом обращении)."""
+        key = self._host_key(url)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=self.limits,
+                http2=self.http2,
+            )
+            self._clients[key] = client
+            self._stats.setdefault(key, {
+                "requests": 0, "connections_opened": 0, "retries": 0, "errors": 0,
+            })
+        return client
+
+    def _trace(self, key: str):
+        stats = self._stats[key]
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            # Новое TCP-соединение; всё остальное — переиспользование из пула
+            if event_name == "connection.connect_tcp.complete":
+                stats["connections_opened"] += 1
+        return trace
+
+    async def request(self, method: str, url: str, *, retries: Optional[int] = None,
+                      raise_for_status: bool = True, priority: Optional[int] = None,
+                      retry_if: Optional[Callable[[httpx.Response], bool]] = None,
+                      **kwargs: Any) -> httpx.Response:
+        """
+        Запрос через пул хоста с общей политикой повторов:
+        сетевые ошибки и статусы из RETRY_STATUSES повторяются с экспоненциальной задержкой.
+        retry_if — признак ошибки, сообщённой в теле успешного ответа (например, rate limit
+        при статусе 200): такой ответ повторяется по той же политике.
+        Каждая попытка к регулируемому апстриму ждёт разрешения регулятора (priority —
+        класс запроса, по умолчанию из priority_scope); 429 повторяется без собственной
+        задержки — паузу по Retry-After выдерживает регулятор.
+        """
+        client = self.client(url)
+        key = self._host_key(url)
+        stats = self._stats[key]
+        attempts = max(1, self.max_retries if retries is None else retries)
+        extensions = {"trace": self._trace(key)}
+
+        for attempt in range(1, attempts + 1):
+            bucket = None
+            if self.governor is not None:
+                bucket = await self.governor.acquire(method, url, kwargs.get("params"),
+                                                     kwargs.get("json"), priority)
+            stats["requests"] += 1
+            try:
+                response = await client.request(method, url, extensions=extensions, **kwargs)
+                if self.governor is not None:
+                    self.governor.observe(bucket, response)
+                if response.status_code in RETRY_STATUSES and attempt < attempts:
+                    stats["retries"] += 1
+                    if not (bucket is not None and response.status_code == 429):
+                        await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                if retry_if is not None and response.is_success and retry_if(response):
+                    if attempt < attempts:
+                        stats["retries"] += 1
+                        logger.warning(f"{key}: retryable error in response body, "
+                                       f"attempt {attempt}/{attempts}")
+                        await asyncio.sleep(backoff_delay(attempt))
+                        continue
+                    stats["errors"] += 1
+                    return response
+                if raise_for_status:
+                    response.raise_for_status()
+                return response
+            except httpx.TransportError:
+                if attempt == attempts:
+                    stats["errors"] += 1
+                    raise
+                stats["retries"] += 1
+                await asyncio.sleep(backoff_delay(attempt))
+            except httpx.HTTPStatusError:
+                stats["errors"] += 1
+                raise
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика использования пулов по хостам."""
+        hosts = {}
+        for key, st in self._stats.items():
+            hosts[key] = {
+                **st,
+                "connections_reused": max(0, st["requests"] - st["connections_opened"]),
+                "open": key in self._clients and not self._clients[key].is_closed,
+            }
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "hosts": hosts,
+        }
+
+    async def aclose(self) -> None:
+        """Закрыть все пулы (вызывается при остановке приложения)."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Failed to close HTTP client: {e}")
+
+
+class CurrentHttpClients:
+    """
+    Ссылка на текущий реестр: сервисы импортируют её один раз, а сам реестр
+    устанавливает lifespan приложения (use_http_clients). Без установленного реестра
+    создаётся реестр по умолчанию.
+    """
+
+    def __init__(self) -> None:
+        self._registry: Optional[HttpClientRegistry] = None
+
+    def use(self, registry: Optional[HttpClientRegistry]) -> None:
+        self._registry = registry
+
+    @property
+    def registry(self) -> HttpClientRegistry:
+        if self._registry is None:
+            self._registry = HttpClientRegistry()
+        return self._registry
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.registry, name)
+
+
+# Текущий реестр (устанавливается в lifespan приложения)
+http_clients = CurrentHttpClients()
+
+
+def use_http_clients(registry: Optional[HttpClientRegistry]) -> None:
+    """Сделать registry текущим реестром для всех сервисов (None — сбросить)."""
+    http_clients.use(registry)
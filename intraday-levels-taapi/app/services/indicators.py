@@ -0,0 +1,277 @@
+"""
+Локальный расчёт индикаторов по свечам (вместо отдельных запросов к TAAPI).
+
+Соглашения совпадают с TA-Lib, на которой построен TAAPI:
+  - EMA затравливается SMA первых period значений, alpha = 2 / (period + 1);
+  - RSI, ATR, ADX/DMI сглаживаются по Уайлдеру (RMA, alpha = 1 / period) с затравкой SMA;
+  - MACD: быстрая EMA затравливается на том же баре, что и медленная (как в TA_MACD);
+  - BBands: SMA и стандартное отклонение генеральной совокупности.
+Все функции принимают массивы NumPy и возвращают массив той же длины (NaN до первого
+значения). Рекурсивная часть EMA/RMA считается ewm(adjust=False) от pandas, остальное —
+векторно в NumPy.
+
+taapi_value() возвращает ответ в формате TAAPI для одного индикатора (с backtrack),
+pack_indicators() — набор ATR/EMA20/EMA50/EMA200/ADX для пакета main_v2.
+"""
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.services.candles import Candles, as_candles
+from app.services.lookback import declare_lookback
+
+# pack_indicators читает 200 баров (EMA200) и 600 баров прогрева: вклад затравки EMA200
+# затухает как (1 - 2/201)^600 ≈ e^-6. Считается по 30m пакета и по 1h для origin_tf=60m.
+PACK_BARS, PACK_WARMUP = 200, 600
+declare_lookback("indicators_30m", {"30m": PACK_BARS}, warmup=PACK_WARMUP)
+declare_lookback("indicators_1h", {"1h": PACK_BARS}, warmup=PACK_WARMUP)
+
+
+def _nan(n: int) -> np.ndarray:
+    return np.full(n, np.nan)
+
+
+def _recursive(values: np.ndarray, alpha: float, start: int, seed: float,
+               ignore_na: bool = False) -> np.ndarray:
+    """y[start] = seed, y[t] = (1 - alpha) * y[t-1] + alpha * values[t] для t > start."""
+    out = _nan(len(values))
+    if start >= len(values):
+        return out
+    seg = np.array(values[start:], dtype=float)
+    seg[0] = seed
+    out[start:] = pd.Series(seg).ewm(alpha=alpha, adjust=False, ignore_na=ignore_na).mean().to_numpy()
+    return out
+
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    values = np.asarray(values, dtype=float)
+    out = _nan(len(values))
+    if len(values) >= period:
+        out[period - 1:] = sliding_window_view(values, period).mean(axis=1)
+    return out
+
+
+def ema(values: np.ndarray, period: int) -> np.ndarray:
+    """EMA с затравкой SMA первых period значений."""
+    values = np.asarray(values, dtype=float)
+    if len(values) < period:
+        return _nan(len(values))
+    return _recursive(values, 2.0 / (period + 1), period - 1, values[:period].mean())
+
+
+def rma(values: np.ndarray, period: int) -> np.ndarray:
+    """Скользящее среднее Уайлдера с затравкой SMA."""
+    values = np.asarray(values, dtype=float)
+    if len(values) < period:
+        return _nan(len(values))
+    return _recursive(values, 1.0 / period, period - 1, values[:period].mean())
+
+
+def rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    close = np.asarray(close, dtype=float)
+    out = _nan(len(close))
+    if len(close) <= period:
+        return out
+    delta = np.diff(close)
+    gain = rma(np.clip(delta, 0, None), period)
+    loss = rma(np.clip(-delta, 0, None), period)
+    total = gain + loss
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out[1:] = np.where(total != 0, 100.0 * gain / total, 0.0)
+    out[:period] = np.nan
+    return out
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """TR; для первого бара не определён (нет предыдущего закрытия)."""
+    high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+    out = _nan(len(close))
+    if len(close) > 1:
+        prev = close[:-1]
+        out[1:] = np.maximum.reduce([high[1:] - low[1:], np.abs(high[1:] - prev), np.abs(low[1:] - prev)])
+    return out
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    tr = true_range(high, low, close)
+    out = _nan(len(tr))
+    if len(tr) > period:
+        out[1:] = rma(tr[1:], period)
+    return out
+
+
+def _wilder_sum(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Сглаженная сумма Уайлдера из TA-Lib (DM/TR в ADX), делённая на period:
+    затравка — сумма первых period-1 значений, далее S = S - S/period + x.
+    values[0] не используется (нет предыдущего бара).
+    """
+    seed = values[1:period].sum() / period
+    return _recursive(values, 1.0 / period, period - 1, seed)
+
+
+def dmi(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+        period: int = 14) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(+DI, -DI, ADX) по TA-Lib."""
+    high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+    n = len(close)
+    pdi, mdi, adx_out = _nan(n), _nan(n), _nan(n)
+    if n < period + 1:
+        return pdi, mdi, adx_out
+
+    up = np.zeros(n)
+    down = np.zeros(n)
+    up[1:] = high[1:] - high[:-1]
+    down[1:] = low[:-1] - low[1:]
+    plus_dm = np.where((up > 0) & (up > down), up, 0.0)
+    minus_dm = np.where((down > 0) & (down > up), down, 0.0)
+    tr = true_range(high, low, close)
+    tr[0] = 0.0
+
+    s_plus = _wilder_sum(plus_dm, period)
+    s_minus = _wilder_sum(minus_dm, period)
+    s_tr = _wilder_sum(tr, period)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pdi = np.where(s_tr != 0, 100.0 * s_plus / s_tr, np.nan)
+        mdi = np.where(s_tr != 0, 100.0 * s_minus / s_tr, np.nan)
+        di_sum = pdi + mdi
+        dx = np.where(di_sum != 0, 100.0 * np.abs(pdi - mdi) / di_sum, np.nan)
+    pdi[:period] = np.nan
+    mdi[:period] = np.nan
+
+    first = 2 * period - 1
+    if n > first:
+        # Затравка ADX — среднее первых period значений DX (неопределённые DX считаются нулём),
+        # дальше неопределённые DX пропускаются
+        seed = np.nan_to_num(dx[period:first + 1]).sum() / period
+        adx_out = _recursive(dx, 1.0 / period, first, seed, ignore_na=True)
+    return pdi, mdi, adx_out
+
+
+def adx(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    return dmi(high, low, close, period)[2]
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26,
+         signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(MACD, signal, hist) по TA-Lib: быстрая EMA стартует на первом баре медленной."""
+    close = np.asarray(close, dtype=float)
+    if slow < fast:
+        fast, slow = slow, fast
+    n = len(close)
+    line, sig, hist = _nan(n), _nan(n), _nan(n)
+    start = slow - 1
+    if n < start + signal:
+        return line, sig, hist
+    slow_ema = _recursive(close, 2.0 / (slow + 1), start, close[:slow].mean())
+    fast_ema = _recursive(close, 2.0 / (fast + 1), start, close[slow - fast:slow].mean())
+    line = fast_ema - slow_ema
+    sig_start = start + signal - 1
+    sig = _recursive(line, 2.0 / (signal + 1), sig_start, line[start:sig_start + 1].mean())
+    line[:sig_start] = np.nan
+    hist = line - sig
+    return line, sig, hist
+
+
+def bbands(close: np.ndarray, period: int = 20,
+           stddev: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(upper, middle, lower)."""
+    close = np.asarray(close, dtype=float)
+    middle = sma(close, period)
+    dev = _nan(len(close))
+    if len(close) >= period:
+        dev[period - 1:] = sliding_window_view(close, period).std(axis=1)
+    return middle + stddev * dev, middle, middle - stddev * dev
+
+
+def obv(close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """OBV от первого бара окна (абсолютный уровень зависит от длины истории)."""
+    close = np.asarray(close, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+    if len(close) == 0:
+        return _nan(0)
+    signed = np.zeros(len(close))
+    signed[0] = volume[0]
+    signed[1:] = np.sign(np.diff(close)) * volume[1:]
+    return np.cumsum(signed)
+
+
+def mfi(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray,
+        period: int = 14) -> np.ndarray:
+    high, low, close, volume = (np.asarray(a, dtype=float) for a in (high, low, close, volume))
+    n = len(close)
+    out = _nan(n)
+    if n <= period:
+        return out
+    tp = (high + low + close) / 3.0
+    flow = tp * volume
+    move = np.diff(tp)
+    pos = sliding_window_view(np.where(move > 0, flow[1:], 0.0), period).sum(axis=1)
+    neg = sliding_window_view(np.where(move < 0, flow[1:], 0.0), period).sum(axis=1)
+    total = pos + neg
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out[period:] = np.where(total < 1.0, 0.0, 100.0 * pos / total)
+    return out
+
+
+# --- совместимость с ответами TAAPI ---------------------------------------
+
+def _last(values: np.ndarray, backtrack: int = 0) -> Optional[float]:
+    idx = len(values) - 1 - backtrack
+    if idx < 0 or np.isnan(values[idx]):
+        return None
+    return float(values[idx])
+
+
+def taapi_value(indicator: str, candles: Any,
+                params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Optional[float]]]:
+    """
+    Значение индикатора в формате ответа TAAPI (те же ключи и параметры: period,
+    optInFastPeriod/optInSlowPeriod/optInSignalPeriod, stddev, backtrack).
+    None — индикатор не поддерживается локально.
+    """
+    c = as_candles(candles)
+    p = params or {}
+    bt = int(p.get("backtrack", 0) or 0)
+    period = int(p.get("period", 0) or 0)
+
+    if indicator == "rsi":
+        return {"value": _last(rsi(c.close, period or 14), bt)}
+    if indicator == "ema":
+        return {"value": _last(ema(c.close, period or 30), bt)}
+    if indicator == "sma":
+        return {"value": _last(sma(c.close, period or 30), bt)}
+    if indicator == "atr":
+        return {"value": _last(atr(c.high, c.low, c.close, period or 14), bt)}
+    if indicator == "adx":
+        return {"value": _last(adx(c.high, c.low, c.close, period or 14), bt)}
+    if indicator == "dmi":
+        pdi, mdi, adx_v = dmi(c.high, c.low, c.close, period or 14)
+        return {"adx": _last(adx_v, bt), "pdi": _last(pdi, bt), "mdi": _last(mdi, bt)}
+    if indicator == "macd":
+        line, sig, hist = macd(c.close, int(p.get("optInFastPeriod", 12)),
+                               int(p.get("optInSlowPeriod", 26)), int(p.get("optInSignalPeriod", 9)))
+        return {"valueMACD": _last(line, bt), "valueMACDSignal": _last(sig, bt), "valueMACDHist": _last(hist, bt)}
+    if indicator == "bbands":
+        upper, middle, lower = bbands(c.close, period or 20, float(p.get("stddev", 2)))
+        return {"valueUpperBand": _last(upper, bt), "valueMiddleBand": _last(middle, bt),
+                "valueLowerBand": _last(lower, bt)}
+    if indicator == "obv":
+        return {"value": _last(obv(c.close, c.volume), bt)}
+    if indicator == "mfi":
+        return {"value": _last(mfi(c.high, c.low, c.close, c.volume, period or 14), bt)}
+    return None
+
+
+def pack_indicators(candles: Candles) -> Dict[str, Optional[float]]:
+    """ATR14, EMA20/50/200 и ADX14 на последнем баре — то же, что bulk TAAPI в main_v2."""
+    c = as_candles(candles).tail(PACK_BARS + PACK_WARMUP)
+    return {
+        "atr": _last(atr(c.high, c.low, c.close, 14)),
+        "ema20": _last(ema(c.close, 20)),
+        "ema50": _last(ema(c.close, 50)),
+        "ema200": _last(ema(c.close, 200)),
+        "adx": _last(adx(c.high, c.low, c.close, 14)),
+    }
@@ -3,12 +3,13 @@
 с поддержкой Binance API (основной) и CoinGecko API (резервный)
 """
 import asyncio
-import httpx
 import pandas as pd
 import numpy as np
 from typing import Dict, Optional, Tuple
 import logging
 
+from app.services.http_clients import http_clients
+
 logger = logging.getLogger(__name__)
 
 class Indicators12hService:
@@ -48,45 +49,43 @@ class Indicators12hService:
         # Конвертируем USDT символ для Binance
         binance_symbol = symbol.replace("USDT", "USDT")
         
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            # Получаем 12h свечи (максимум 1000 свечей = ~500 дней)
-            url = f"{self.binance_base_url}/klines"
-            params = {
-                "symbol": binance_symbol,
-                "interval": "12h",
-                "limit": 1000
-            }
-            
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            klines = response.json()
-            
-            if not klines:
-                raise ValueError("No klines data from Binance")
-            
-            # Конвертируем в DataFrame
-            df = pd.DataFrame(klines, columns=[
-                'timestamp', 'open', 'high', 'low', 'close', 'volume',
-                'close_time', 'quote_asset_volume', 'number_of_trades',
-                'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
-            ])
-            
-            # Конвертируем типы данных
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            
-            df = df.dropna()
-            
-            if len(df) < 200:  # Нужно минимум 200 свечей для EMA200
-                raise ValueError(f"Insufficient data: {len(df)} candles")
-            
-            # Вычисляем RSI(14) на 12h
-            rsi = self._calculate_rsi(df['close'], 14)
-            
-            # Вычисляем EMA(200) на 12h
-            ema200 = self._calculate_ema(df['close'], 200)
-            
-            return rsi, ema200
+        # Получаем 12h свечи (максимум 1000 свечей = ~500 дней)
+        url = f"{self.binance_base_url}/klines"
+        params = {
+            "symbol": binance_symbol,
+            "interval": "12h",
+            "limit": 1000
+        }
+        
+        response = await http_clients.get(url, params=params, timeout=self.timeout)
+        klines = response.json()
+        
+        if not klines:
+            raise ValueError("No klines data from Binance")
+        
+        # Конвертируем в DataFrame
+        df = pd.DataFrame(klines, columns=[
+            'timestamp', 'open', 'high', 'low', 'close', 'volume',
+            'close_time', 'quote_asset_volume', 'number_of_trades',
+            'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
+        ])
+        
+        # Конвертируем типы данных
+        for col in ['open', 'high', 'low', 'close', 'volume']:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        
+        df = df.dropna()
+        
+        if len(df) < 200:  # Нужно минимум 200 свечей для EMA200
+            raise ValueError(f"Insufficient data: {len(df)} candles")
+        
+        # Вычисляем RSI(14) на 12h
+        rsi = self._calculate_rsi(df['close'], 14)
+        
+        # Вычисляем EMA(200) на 12h
+        ema200 = self._calculate_ema(df['close'], 200)
+        
+        return rsi, ema200
     
     async def _get_from_coingecko(self, symbol: str) -> Tuple[Optional[float], Optional[float]]:
         """Получить данные с CoinGecko API"""
@@ -95,38 +94,36 @@ class Indicators12hService:
         if not coingecko_id:
             raise ValueError(f"Unknown symbol for CoinGecko: {symbol}")
         
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            # Получаем исторические данные (максимум 365 дней)
-            url = f"{self.coingecko_base_url}/coins/{coingecko_id}/market_chart"
-            params = {
-                "vs_currency": "usd",
-                "days": "365",
-                "interval": "12h"  # 12-часовые интервалы
-            }
-            
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if 'prices' not in data or not data['prices']:
-                raise ValueError("No price data from CoinGecko")
-            
-            # Конвертируем в DataFrame
-            prices = data['prices']
-            df = pd.DataFrame(prices, columns=['timestamp', 'price'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df = df.set_index('timestamp')
-            
-            if len(df) < 200:
-                raise ValueError(f"Insufficient data: {len(df)} points")
-            
-            # Вычисляем RSI(14) на 12h
-            rsi = self._calculate_rsi(df['price'], 14)
-            
-            # Вычисляем EMA(200) на 12h
-            ema200 = self._calculate_ema(df['price'], 200)
-            
-            return rsi, ema200
+        # Получаем исторические данные (максимум 365 дней)
+        url = f"{self.coingecko_base_url}/coins/{coingecko_id}/market_chart"
+        params = {
+            "vs_currency": "usd",
+            "days": "365",
+            "interval": "12h"  # 12-часовые интервалы
+        }
+        
+        response = await http_clients.get(url, params=params, timeout=self.timeout)
+        data = response.json()
+        
+        if 'prices' not in data or not data['prices']:
+            raise ValueError("No price data from CoinGecko")
+        
+        # Конвертируем в DataFrame
+        prices = data['prices']
+        df = pd.DataFrame(prices, columns=['timestamp', 'price'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df = df.set_index('timestamp')
+        
+        if len(df) < 200:
+            raise ValueError(f"Insufficient data: {len(df)} points")
+        
+        # Вычисляем RSI(14) на 12h
+        rsi = self._calculate_rsi(df['price'], 14)
+        
+        # Вычисляем EMA(200) на 12h
+        ema200 = self._calculate_ema(df['price'], 200)
+        
+        return rsi, ema200
     
     def _symbol_to_coingecko_id(self, symbol: str) -> Optional[str]:
         """Конвертировать символ в CoinGecko ID"""
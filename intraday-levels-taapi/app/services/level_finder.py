@@ -1,3 +1,5 @@
+from app.services.candles import as_candles
+from app.services.executor import compute
 from app.services.taapi_bulk import swing_points, cluster_levels, classic_pivots, session_vwap, compute_tolerance, score_level
 
 ROUND_STEPS = [1000, 500, 250, 100, 50, 25, 10, 5, 1, 0.5, 0.1]
@@ -57,7 +59,8 @@ def find_best_level(c5, c15, c30, c1h, c4h, session_info,
     Returns:
         Dict с информацией о лучшем уровне или None
     """
-    price_now = float(c5[-1]['close'])
+    c5, c1h = as_candles(c5), as_candles(c1h)
+    price_now = float(c5.close[-1])
     atr = float(indicators.get('atr', 0.0)) if indicators else 0.0
 
     # Находим свинг-точки на разных таймфреймах
@@ -87,8 +90,8 @@ def find_best_level(c5, c15, c30, c1h, c4h, session_info,
     # Проверяем приближение к старшим таймфреймам
     def htf_swing_ok(level):
         """Проверяет, есть ли свинг-точка на старшем таймфрейме рядом с уровнем"""
-        highs1h = [float(x['high']) for x in c1h[-200:]]
-        lows1h = [float(x['low']) for x in c1h[-200:]]
+        highs1h = c1h.high[-200:].tolist()
+        lows1h = c1h.low[-200:].tolist()
         if any(abs(level - hh) <= tol for hh in highs1h): 
             return True
         if any(abs(level - ll) <= tol for ll in lows1h): 
@@ -164,6 +167,7 @@ def find_best_level(c5, c15, c30, c1h, c4h, session_info,
 def analyze_session_info(candles_1h, candles_4h):
     """Анализирует информацию о торговой сессии"""
     session_info = {}
+    candles_4h = as_candles(candles_4h)
     
     # Рассчитываем VWAP для сессии
     if candles_1h:
@@ -171,18 +175,16 @@ def analyze_session_info(candles_1h, candles_4h):
     
     # Рассчитываем пивотные точки на дневном таймфрейме
     if len(candles_4h) >= 2:
-        prev_candle = candles_4h[-2]
-        prev_high = float(prev_candle['high'])
-        prev_low = float(prev_candle['low'])
-        prev_close = float(prev_candle['close'])
+        prev_high = float(candles_4h.high[-2])
+        prev_low = float(candles_4h.low[-2])
+        prev_close = float(candles_4h.close[-2])
         session_info["pivots_daily"] = classic_pivots(prev_high, prev_low, prev_close)
     
     # Находим PDH и PDL (Previous Day High/Low)
     if candles_4h:
-        highs = [float(c['high']) for c in candles_4h[-6:]]  # Последние 6 свечей (24 часа)
-        lows = [float(c['low']) for c in candles_4h[-6:]]
-        session_info["PDH"] = max(highs)
-        session_info["PDL"] = min(lows)
+        # Последние 6 свечей (24 часа)
+        session_info["PDH"] = float(candles_4h.high[-6:].max())
+        session_info["PDL"] = float(candles_4h.low[-6:].min())
     
     return session_info
 
@@ -223,11 +225,12 @@ async def find_levels_for_side(symbol, side, taapi_service, limit=200):
         session_info = analyze_session_info(c1h, c4h)
         
         # Рассчитываем размер тика на основе текущей цены
-        current_price = float(c5[-1]['close'])
+        current_price = float(c5.close[-1])
         tick_size = infer_tick_from_price(current_price)
         
         # Ищем лучший уровень
-        best_level = find_best_level(
+        best_level = await compute.run(
+            find_best_level,
             c5, c15, c30, c1h, c4h, 
             session_info, tick_size, indicators, side
         )
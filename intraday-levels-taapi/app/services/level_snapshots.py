@@ -0,0 +1,156 @@
+"""
+Снимки уровней по символам, пересчитываемые на закрытии баров.
+
+Пивоты прошлых суток (PDH/PDL/PDC) и свинги поиска уровней считаются только по закрытым барам
+(LevelSnapshot.closed), поэтому между закрытиями — один раз; текущая цена и VWAP текущих
+суток (с формирующимся баром) применяются к ним в каждом запросе. Снимок символа ключуется
+временем последнего закрытого бара каждого ТФ (и его close — на случай смены источника/правки
+истории). Каждое значение снимка объявляет ТФ, от которых зависит: при закрытии бара 5m пивоты
+(30m) переезжают в новый снимок без пересчёта, а свинги считаются заново.
+
+Значения хранятся как futures: одновременные запросы ждут один расчёт, ошибка расчёта
+не кэшируется.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import LEVEL_SNAPSHOT_MAX_SYMBOLS
+from app.services.candle_store import TF_MS
+
+BarKey = Dict[str, Tuple[int, float]]
+
+
+def bar_key(klines: Mapping[str, Any], timeframes: Sequence[str],
+            now_ms: Optional[int] = None) -> BarKey:
+    """ТФ -> (open time, close) последнего закрытого бара; без закрытых баров — (0, 0.0)."""
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    key: BarKey = {}
+    for tf in timeframes:
+        c = klines.get(tf)
+        n = len(c) if c is not None else 0
+        i = n - 1
+        # Последний бар может быть ещё формирующимся
+        while i >= 0 and int(c.t[i]) + TF_MS.get(tf, 0) > now_ms:
+            i -= 1
+        key[tf] = (int(c.t[i]), float(c.close[i])) if i >= 0 else (0, 0.0)
+    return key
+
+
+class LevelSnapshot:
+    """Значения, посчитанные для одного набора закрытых баров символа."""
+
+    __slots__ = ("symbol", "key", "built_at", "_values")
+
+    def __init__(self, symbol: str, key: BarKey):
+        self.symbol = symbol
+        self.key = key
+        self.built_at = time.time()
+        self._values: Dict[Hashable, Tuple[Tuple[str, ...], "asyncio.Future[Any]"]] = {}
+
+    def carry_from(self, old: "LevelSnapshot") -> int:
+        """Перенести из старого снимка значения, чьи ТФ не закрыли новый бар."""
+        carried = 0
+        for name, (tfs, fut) in old._values.items():
+            if fut.done() and not fut.cancelled() and fut.exception() is None \
+                    and all(old.key.get(tf) == self.key.get(tf) for tf in tfs):
+                self._values[name] = (tfs, fut)
+                carried += 1
+        return carried
+
+    def closed(self, klines: Mapping[str, Any]) -> Dict[str, Any]:
+        """Свечи без формирующихся баров: по ТФ снимка — до закрытого бара ключа включительно."""
+        out = dict(klines)
+        for tf, (t, _) in self.key.items():
+            c = klines.get(tf)
+            if c is not None:
+                out[tf] = c[:int(np.searchsorted(c.t, t, "right")) if t else 0]
+        return out
+
+    def peek(self, name: Hashable) -> Any:
+        """Готовое значение или None."""
+        entry = self._values.get(name)
+        if entry is None or not entry[1].done() or entry[1].cancelled() or entry[1].exception():
+            return None
+        return entry[1].result()
+
+    def names(self) -> list:
+        return list(self._values)
+
+
+class LevelSnapshots:
+    """Снимки уровней по символам (LRU не больше max_symbols) и счётчики попаданий."""
+
+    def __init__(self, max_symbols: int = LEVEL_SNAPSHOT_MAX_SYMBOLS):
+        self.max_symbols = max_symbols
+        self._snapshots: "OrderedDict[str, LevelSnapshot]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "rebuilds": 0, "carried": 0, "errors": 0}
+        # Попадания по видам значений (первый элемент имени: session, swings, origin, ...)
+        self._by_kind: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, name: Hashable, outcome: str) -> None:
+        kind = str(name[0] if isinstance(name, tuple) else name)
+        self.stats[outcome] += 1
+        self._by_kind.setdefault(kind, {"hits": 0, "misses": 0})[outcome] += 1
+
+    def current(self, symbol: str, klines: Mapping[str, Any], timeframes: Sequence[str],
+                now_ms: Optional[int] = None) -> LevelSnapshot:
+        """Снимок символа для закрытых баров klines; закрылся бар — новый снимок."""
+        key = bar_key(klines, timeframes, now_ms)
+        snap = self._snapshots.get(symbol)
+        if snap is None or snap.key != key:
+            new = LevelSnapshot(symbol, key)
+            if snap is not None:
+                self.stats["rebuilds"] += 1
+                self.stats["carried"] += new.carry_from(snap)
+            snap = self._snapshots[symbol] = new
+        self._snapshots.move_to_end(symbol)
+        while len(self._snapshots) > self.max_symbols:
+            self._snapshots.popitem(last=False)
+        return snap
+
+    def peek(self, symbol: str) -> Optional[LevelSnapshot]:
+        return self._snapshots.get(symbol)
+
+    async def get_or_compute(self, snap: LevelSnapshot, name: Hashable, tfs: Sequence[str],
+                             compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Значение name снимка: посчитанное — сразу, идущий расчёт — ждём его, иначе считаем.
+        tfs — ТФ, закрытие бара которых делает значение устаревшим.
+        """
+        entry = snap._values.get(name)
+        if entry is not None and not (entry[1].done() and (entry[1].cancelled() or entry[1].exception())):
+            self._count(name, "hits")
+            return await asyncio.shield(entry[1])
+        self._count(name, "misses")
+        fut = asyncio.ensure_future(compute())
+        snap._values[name] = (tuple(tfs), fut)
+        try:
+            return await asyncio.shield(fut)
+        except Exception:
+            self.stats["errors"] += 1
+            if snap._values.get(name, (None, None))[1] is fut:
+                del snap._values[name]
+            raise
+
+    def clear(self) -> None:
+        self._snapshots.clear()
+
+    @staticmethod
+    def _hit_rate(counts: Dict[str, int]) -> Optional[float]:
+        lookups = counts["hits"] + counts["misses"]
+        return round(counts["hits"] / lookups, 3) if lookups else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "symbols": len(self._snapshots),
+            "hit_rate": self._hit_rate(self.stats),
+            "by_kind": {kind: {**c, "hit_rate": self._hit_rate(c)} for kind, c in self._by_kind.items()},
+        }
+
+
+level_snapshots = LevelSnapshots()
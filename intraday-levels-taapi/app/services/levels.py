@@ -1,9 +1,113 @@
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, Sequence
+import numpy as np
 from .taapi_bulk import swing_points, cluster_levels, compute_tolerance, score_level
-from .utils import nearest_round, rr_to_opposite
+from .utils import nearest_round
+from .candles import as_candles
+from .lookback import WHOLE_SERIES, declare_lookback
+from .swings import count_within as _count_within
+
+# Поиск уровней ищет свинги (касания) по всей переданной истории 5m/15m/30m/1h;
+# близость к старшему ТФ — по последним HTF_SWING_BARS барам 1h. 4h передаётся, но не читается.
+LOOKBACK = declare_lookback("levels", {tf: WHOLE_SERIES for tf in ("5m", "15m", "30m", "1h")})
+HTF_SWING_BARS = 200
+
+# Частичный пакет (дедлайн запроса): без ТФ поиск идёт дальше, но часть проверок не выполняется.
+# 5m (цена, касания) и 30m (пивоты, VWAP) обязательны; 4h не читается — его нехватка ничего не стоит.
+CHECKS_BY_TF = {"15m": ("touches_15m",), "1h": ("touches_1h", "htf_swing")}
+# Доля оценки уровня, снимаемая за каждую пропущенную проверку
+SKIPPED_CHECK_PENALTY = {"touches_15m": 0.05, "touches_1h": 0.05, "htf_swing": 0.10, "origin_indicators": 0.05}
+
+
+def skipped_checks(missing_tfs: Sequence[str]) -> List[str]:
+    """Проверки поиска уровня, которые не выполняются без свечей missing_tfs."""
+    return [check for tf in missing_tfs for check in CHECKS_BY_TF.get(tf, ())]
+
+
+def degraded_score(score: float, skipped: Sequence[str]) -> float:
+    """Оценка уровня с поправкой на пропущенные проверки."""
+    for check in skipped:
+        score *= 1.0 - SKIPPED_CHECK_PENALTY.get(check, 0.0)
+    return round(score, 4)
+
+
+def _near(levels: np.ndarray, ref: Any, tol: float) -> np.ndarray:
+    """Маска уровней рядом с ref (ref пустой/нулевой — фактор не учитывается)."""
+    if not ref:
+        return np.zeros(len(levels), dtype=bool)
+    return np.abs(levels - float(ref)) <= tol
+
+
+def _rr_to_nearest(levels: np.ndarray, opposite: Sequence[float], side: str) -> List[Optional[float]]:
+    """RR до ближайшего противоположного уровня (строго выше для long, строго ниже для short)."""
+    opp = np.sort(np.asarray(opposite, dtype=np.float64))
+    if len(opp) == 0:
+        return [None] * len(levels)
+    if side == 'long':
+        idx = np.searchsorted(opp, levels, "right")
+        has = idx < len(opp)
+        dist = opp[np.minimum(idx, len(opp) - 1)] - levels
+    else:
+        idx = np.searchsorted(opp, levels, "left") - 1
+        has = idx >= 0
+        dist = levels - opp[np.maximum(idx, 0)]
+    rr = dist / np.maximum(1e-9, levels * 0.01)
+    return [float(r) if h else None for r, h in zip(rr.tolist(), has.tolist())]
+
+
+def _evaluate_levels(levels: np.ndarray, tol: float, pool: np.ndarray, htf: np.ndarray,
+                     piv_vals: List[float], pdl, pdh, ema200, vwap_val,
+                     base: Tuple[str, ...] = ()) -> Tuple[List[set], np.ndarray]:
+    """
+    Факторы конфлюэнса для всех уровней сразу.
+    pool и htf — отсортированные массивы свингов (touches и старший ТФ).
+    Множества собираются в прежнем порядке добавления — от него зависит порядок суммы в score_level.
+    """
+    touches = _count_within(pool, levels, tol)
+    if piv_vals:
+        near_piv = (np.abs(levels[:, None] - np.asarray(piv_vals)[None, :]) <= tol).any(axis=1)
+    else:
+        near_piv = np.zeros(len(levels), dtype=bool)
+    factors = [
+        ("pivot", near_piv),
+        ("pivot", _near(levels, pdl, tol)),
+        ("pivot", _near(levels, pdh, tol)),
+        ("ema200_near", _near(levels, ema200, tol)),
+        ("vwap", _near(levels, vwap_val, tol)),
+        ("round", np.array([abs(lvl - nearest_round(lvl)) <= tol for lvl in levels.tolist()], dtype=bool)),
+        ("htf_swing", _count_within(htf, levels, tol) > 0),
+        ("touches", touches >= 2),
+    ]
+    flags = np.stack([m for _, m in factors], axis=1).tolist()
+    confs = []
+    for row in flags:
+        conf = set(base)
+        for (name, _), hit in zip(factors, row):
+            if hit:
+                conf.add(name)
+        conf.add("trend_ok")
+        confs.append(conf)
+    return confs, touches
+
+
+def _htf_swings(c1h) -> np.ndarray:
+    """Отсортированные high/low последних HTF_SWING_BARS баров 1h — для проверки близости к старшему ТФ."""
+    n = HTF_SWING_BARS
+    return np.sort(np.concatenate([c1h.high[-n:], c1h.low[-n:]]))
+
+
+def level_swings(c5, c15, c30, c1h) -> Dict[str, Any]:
+    """
+    Часть поиска уровня, не зависящая от текущей цены: свинги по ТФ
+    ({tf: (highs, lows)}) и high/low старшего ТФ ("htf"). Считается один раз на набор
+    закрытых баров и передаётся в find_best_level/compute_candidates (swings=...).
+    """
+    c5, c15, c30, c1h = as_candles(c5), as_candles(c15), as_candles(c30), as_candles(c1h)
+    out: Dict[str, Any] = {tf: swing_points(c) for tf, c in (("5m", c5), ("15m", c15), ("30m", c30), ("1h", c1h))}
+    out["htf"] = _htf_swings(c1h)
+    return out
 
 def find_best_level(c5, c15, c30, c1h, c4h, session_info,
-                    tick_size, indicators, side, origin_tf="30m"):
+                    tick_size, indicators, side, origin_tf="30m", swings=None):
     """
     Находит лучший уровень для входа на основе множественных факторов
     
@@ -14,11 +118,13 @@ def find_best_level(c5, c15, c30, c1h, c4h, session_info,
         indicators: Индикаторы (ATR, EMA200 и др.)
         side: Направление ('long' или 'short')
         origin_tf: Исходный таймфрейм
+        swings: Готовые свинги level_swings (например, по закрытым барам); цена — по c5
     
     Returns:
         Dict с информацией о лучшем уровне или None
     """
-    price_now = float(c5[-1]['close'])
+    price_now = float(as_candles(c5).close[-1])
+    sw = swings if swings is not None else level_swings(c5, c15, c30, c1h)
     # Robust to None/invalid ATR
     if indicators:
         try:
@@ -28,11 +134,11 @@ def find_best_level(c5, c15, c30, c1h, c4h, session_info,
     else:
         atr = 0.0
 
-    # Находим свинг-точки на разных таймфреймах (используются для touches/конфлюэнса)
-    highs5, lows5 = swing_points(c5)
-    highs15, lows15 = swing_points(c15)
-    highs30, lows30 = swing_points(c30)
-    highs1h, lows1h = swing_points(c1h)
+    # Свинг-точки на разных таймфреймах (используются для touches/конфлюэнса)
+    highs5, lows5 = sw["5m"]
+    highs15, lows15 = sw["15m"]
+    highs30, lows30 = sw["30m"]
+    highs1h, lows1h = sw["1h"]
 
     # Пул свингов для оценки touches
     if side == 'long':
@@ -49,19 +155,11 @@ def find_best_level(c5, c15, c30, c1h, c4h, session_info,
     pdl = session_info.get("PDL")
     vwap_val = session_info.get("vwap_session")
 
-    # Проверяем приближение к старшим таймфреймам
-    def htf_swing_ok(level):
-        """Проверяет, есть ли свинг-точка на старшем таймфрейме рядом с уровнем"""
-        highs1h = [float(x['high']) for x in c1h[-200:]]
-        lows1h = [float(x['low']) for x in c1h[-200:]]
-        if any(abs(level - hh) <= tol for hh in highs1h): 
-            return True
-        if any(abs(level - ll) <= tol for ll in lows1h): 
-            return True
-        return False
+    # Близость к свингам старшего таймфрейма и пул касаний — один раз на запрос
+    htf = sw["htf"]
+    pool = np.sort(np.asarray(swing_pool, dtype=np.float64))
 
     ema200 = indicators.get('ema200') if indicators else None
-    candidates = []
 
     # Кандидаты уровней: используем ПИВОТЫ TAAPI/классические
     # Для LONG — поддержка (S1..S3), для SHORT — сопротивление (R1..R3)
@@ -85,80 +183,38 @@ def find_best_level(c5, c15, c30, c1h, c4h, session_info,
         if not raw:
             return None
         cl = cluster_levels(raw, tol)
-        for lvl in cl:
-            conf = set()
-            if any(abs(lvl - float(v)) <= tol for v in piv.values() if v is not None):
-                conf.add("pivot")
-            if pdl and abs(lvl - float(pdl)) <= tol:
-                conf.add("pivot")
-            if pdh and abs(lvl - float(pdh)) <= tol:
-                conf.add("pivot")
-            if ema200 and abs(lvl - float(ema200)) <= tol:
-                conf.add("ema200_near")
-            if vwap_val and abs(lvl - float(vwap_val)) <= tol:
-                conf.add("vwap")
-            if abs(lvl - nearest_round(lvl)) <= tol:
-                conf.add("round")
-            if htf_swing_ok(lvl):
-                conf.add("htf_swing")
-            touches = sum(1 for p in raw if abs(p - lvl) <= tol)
-            if touches >= 2:
-                conf.add("touches")
-            conf.add("trend_ok")
-            opposite = [p for p in cl if (p > lvl if side == 'long' else p < lvl)]
-            rr = rr_to_opposite(lvl, opposite, "long" if side == 'long' else "short")
-            score = score_level(lvl, conf, rr, smashed_recent=False)
-            candidates.append((score, lvl, conf, rr))
+        levels = np.asarray(cl, dtype=np.float64)
+        piv_vals = [float(v) for v in piv.values() if v is not None]
+        confs, _ = _evaluate_levels(levels, tol, pool, htf, piv_vals, pdl, pdh, ema200, vwap_val)
+        rrs = _rr_to_nearest(levels, cl, side)
+        scores = [score_level(lvl, conf, rr, smashed_recent=False)
+                  for lvl, conf, rr in zip(cl, confs, rrs)]
+        ranks = [0] * len(cl)
     else:
         # НОВЫЙ МЕХАНИЗМ: берем только уровни пивотов и ранжируем как "фундаментальные"
         tier_bonus_map = {"S1": 0.03, "S2": 0.07, "S3": 0.12, "S4": 0.12,
                           "R1": 0.03, "R2": 0.07, "R3": 0.12, "R4": 0.12}
-        for key, lvl in pivot_levels:
-            conf = set(["pivot"])  # пивот — базовый фактор
-            if pdl and abs(lvl - float(pdl)) <= tol:
-                conf.add("pivot")
-            if pdh and abs(lvl - float(pdh)) <= tol:
-                conf.add("pivot")
-            if ema200 and abs(lvl - float(ema200)) <= tol:
-                conf.add("ema200_near")
-            if vwap_val and abs(lvl - float(vwap_val)) <= tol:
-                conf.add("vwap")
-            if abs(lvl - nearest_round(lvl)) <= tol:
-                conf.add("round")
-            if htf_swing_ok(lvl):
-                conf.add("htf_swing")
-            touches = sum(1 for p in swing_pool if abs(p - lvl) <= tol)
-            if touches >= 2:
-                conf.add("touches")
-            conf.add("trend_ok")
-
-            # Для RR ориентируемся на другие pivot-уровни с противоположной стороны
-            other_lvls = [pl for _, pl in pivot_levels if pl != lvl]
-            opposite = [pl for pl in other_lvls if (pl > lvl if side == 'long' else pl < lvl)]
-            rr = rr_to_opposite(lvl, opposite, "long" if side == 'long' else "short")
-
-            base_score = score_level(lvl, conf, rr, smashed_recent=False)
-            bonus = tier_bonus_map.get(key, 0.0)
-            score = min(base_score + bonus, 1.0)
-            candidates.append((score, lvl, conf, rr, key))
-
-    # Сортируем кандидатов по оценке; при равенстве — по "более фундаментальному" уровню (S3/R3 предпочтительнее)
-    def sort_key(item):
-        # item может быть (score, lvl, conf, rr) или (score, lvl, conf, rr, key)
-        score = item[0]
-        pivot_rank = 0
-        if len(item) >= 5:
-            key = item[4]
-            order = {"S4": 4, "S3": 3, "S2": 2, "S1": 1, "R4": 4, "R3": 3, "R2": 2, "R1": 1}
-            pivot_rank = order.get(key, 0)
-        return (score, pivot_rank)
-    candidates.sort(reverse=True, key=sort_key)
-    
+        keys = [k for k, _ in pivot_levels]
+        cl = [lvl for _, lvl in pivot_levels]
+        levels = np.asarray(cl, dtype=np.float64)
+        # пивот — базовый фактор
+        confs, _ = _evaluate_levels(levels, tol, pool, htf, [], pdl, pdh, ema200, vwap_val, base=("pivot",))
+        # Для RR ориентируемся на другие pivot-уровни с противоположной стороны
+        rrs = _rr_to_nearest(levels, cl, side)
+        scores = [min(score_level(lvl, conf, rr, smashed_recent=False) + tier_bonus_map.get(key, 0.0), 1.0)
+                  for key, lvl, conf, rr in zip(keys, cl, confs, rrs)]
+        # При равенстве оценки более "фундаментальный" уровень (S3/R3) предпочтительнее
+        order = {"S4": 4, "S3": 3, "S2": 2, "S1": 1, "R4": 4, "R3": 3, "R2": 2, "R1": 1}
+        ranks = [order.get(key, 0) for key in keys]
+
     # Возвращаем лучший уровень только если оценка достаточно высокая
-    if not candidates or candidates[0][0] < 0.60:
+    passed = np.asarray(scores, dtype=np.float64) >= 0.60
+    if not passed.any():
         return None
 
-    best = candidates[0]
+    # Первый по порядку среди максимальных (score, pivot_rank) — как стабильная сортировка по убыванию
+    i = max(np.flatnonzero(passed).tolist(), key=lambda j: (scores[j], ranks[j]))
+    best = (scores[i], cl[i], confs[i], rrs[i])
     # Используем более точное округление на основе размера тика
     rounded_price = round(best[1]/tick_size)*tick_size
     return {
@@ -173,21 +229,23 @@ def find_best_level(c5, c15, c30, c1h, c4h, session_info,
 
 def compute_candidates(c5, c15, c30, c1h, c4h, session_info,
                        tick_size, indicators, side, include_1h_swings: bool = False,
-                       score_threshold: float = 0.60):
+                       score_threshold: float = 0.60, swings=None):
     """Возвращает список кандидатов-уровней со всеми факторами и флагами прохождения.
     Каждый элемент: {price, touches, confluence:[...], rr, score, passed:bool, reason:str}
+    swings — готовые свинги level_swings; цена — по c5.
     """
-    price_now = float(c5[-1]['close'])
+    price_now = float(as_candles(c5).close[-1])
+    sw = swings if swings is not None else level_swings(c5, c15, c30, c1h)
     try:
         atr = float(indicators.get('atr') or 0.0)
     except Exception:
         atr = 0.0
 
     # База свингов
-    highs5, lows5 = swing_points(c5)
-    highs15, lows15 = swing_points(c15)
-    highs30, lows30 = swing_points(c30)
-    highs1h, lows1h = swing_points(c1h)
+    highs5, lows5 = sw["5m"]
+    highs15, lows15 = sw["15m"]
+    highs30, lows30 = sw["30m"]
+    highs1h, lows1h = sw["1h"]
 
     if side == 'long':
         raw = [p for _, p in lows5 + lows15 + lows30]
@@ -210,50 +268,25 @@ def compute_candidates(c5, c15, c30, c1h, c4h, session_info,
     vwap_val = session_info.get("vwap_session")
     ema200 = indicators.get('ema200') if indicators else None
 
-    def htf_swing_ok(level):
-        highs1 = [float(x['high']) for x in c1h[-200:]]
-        lows1 = [float(x['low']) for x in c1h[-200:]]
-        if any(abs(level - hh) <= tol for hh in highs1):
-            return True
-        if any(abs(level - ll) <= tol for ll in lows1):
-            return True
-        return False
+    levels = np.asarray(clusters, dtype=np.float64)
+    piv_vals = [float(v) for v in piv.values() if v is not None]
+    confs, touches = _evaluate_levels(levels, tol, np.sort(np.asarray(raw, dtype=np.float64)),
+                                      sw["htf"], piv_vals, pdl, pdh, ema200, vwap_val)
+    rrs = _rr_to_nearest(levels, clusters, side)
+    scores = [score_level(lvl, conf, rr, smashed_recent=False)
+              for lvl, conf, rr in zip(clusters, confs, rrs)]
+    passed = np.asarray(scores, dtype=np.float64) >= score_threshold
 
     candidates = []
-    for lvl in clusters:
-        conf = set()
-        if any(abs(lvl - float(v)) <= tol for v in piv.values() if v is not None):
-            conf.add("pivot")
-        if pdl and abs(lvl - float(pdl)) <= tol:
-            conf.add("pivot")
-        if pdh and abs(lvl - float(pdh)) <= tol:
-            conf.add("pivot")
-        if ema200 and abs(lvl - float(ema200)) <= tol:
-            conf.add("ema200_near")
-        if vwap_val and abs(lvl - float(vwap_val)) <= tol:
-            conf.add("vwap")
-        if abs(lvl - nearest_round(lvl)) <= tol:
-            conf.add("round")
-        if htf_swing_ok(lvl):
-            conf.add("htf_swing")
-        touches = sum(1 for p in raw if abs(p - lvl) <= tol)
-        if touches >= 2:
-            conf.add("touches")
-        conf.add("trend_ok")
-
-        opposite = [p for p in clusters if (p > lvl if side == 'long' else p < lvl)]
-        rr = rr_to_opposite(lvl, opposite, "long" if side == 'long' else "short")
-        score = score_level(lvl, conf, rr, smashed_recent=False)
-        passed = score >= score_threshold
-        reason = "" if passed else f"score<{score_threshold}"
+    for lvl, conf, rr, score, n_touch, ok in zip(clusters, confs, rrs, scores, touches.tolist(), passed.tolist()):
         candidates.append({
             "price": lvl,
-            "touches": touches,
+            "touches": n_touch,
             "confluence": sorted(list(conf)),
             "rr": rr,
             "score": round(score, 4),
-            "passed": passed,
-            "reason": reason
+            "passed": ok,
+            "reason": "" if ok else f"score<{score_threshold}"
         })
 
     candidates.sort(key=lambda x: x["score"], reverse=True)
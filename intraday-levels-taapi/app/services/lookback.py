@@ -0,0 +1,81 @@
+"""
+Объявленные окна истории потребителей пакета свечей.
+
+Каждый потребитель (поиск уровней, сессионные агрегаты, локальные индикаторы) объявляет,
+сколько последних баров каждого ТФ он читает, и сам ограничивается этим окном — результат
+не зависит от того, сколько баров отдал апстрим сверх окна. Окно WHOLE_SERIES — потребитель
+читает весь ряд (результат зависит от длины истории), и ТФ запрашивается по верхней границе.
+main_v2 запрашивает по каждому ТФ максимум объявлений (с прогревом рекурсивных расчётов)
+плюс небольшой запас.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+# Окно «весь ряд»: потребитель читает всю переданную историю ТФ
+WHOLE_SERIES = None
+
+
+@dataclass(frozen=True)
+class Lookback:
+    """Окно потребителя: bars — читаемые бары по ТФ, warmup — прогрев EMA/RMA сверх окна."""
+
+    name: str
+    bars: Mapping[str, Optional[int]] = field(default_factory=dict)
+    warmup: int = 0
+
+    def total(self, tf: str) -> Optional[int]:
+        """Сколько последних баров ТФ нужно потребителю (0 — ТФ не читается, None — весь ряд)."""
+        if tf not in self.bars:
+            return 0
+        return None if self.bars[tf] is WHOLE_SERIES else self.bars[tf] + self.warmup
+
+
+_DECLARED: Dict[str, Lookback] = {}
+
+
+def declare_lookback(name: str, bars: Mapping[str, Optional[int]], warmup: int = 0) -> Lookback:
+    """Объявить (или переобъявить) окно потребителя name."""
+    lookback = Lookback(name, dict(bars), warmup)
+    _DECLARED[name] = lookback
+    return lookback
+
+
+def declared() -> Dict[str, Lookback]:
+    return dict(_DECLARED)
+
+
+def required_bars(timeframes: Iterable[str], margin: int = 0,
+                  cap: Optional[Mapping[str, int]] = None,
+                  consumers: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """
+    Размер запроса по ТФ: максимум объявлений + margin (не больше cap[tf]).
+    ТФ без объявлений получает только margin — его наличие проверяется, но бары не читаются.
+    ТФ, который кто-то читает целиком (WHOLE_SERIES), запрашивается по cap[tf].
+    """
+    names = list(consumers) if consumers is not None else list(_DECLARED)
+    out: Dict[str, int] = {}
+    for tf in timeframes:
+        totals = [_DECLARED[n].total(tf) for n in names if n in _DECLARED]
+        if any(t is None for t in totals):
+            if not cap or tf not in cap:
+                raise ValueError(f"{tf}: окно на весь ряд требует верхней границы cap")
+            out[tf] = cap[tf]
+            continue
+        need = max(totals, default=0) + margin
+        if cap and tf in cap:
+            need = min(need, cap[tf])
+        out[tf] = need
+    return out
+
+
+def bars_used(klines: Mapping[str, Any], consumers: Iterable[str]) -> Dict[str, int]:
+    """Сколько баров каждого ТФ пакета фактически прочитали потребители (для ответа API)."""
+    names = [n for n in consumers if n in _DECLARED]
+    out: Dict[str, int] = {}
+    for tf, candles in klines.items():
+        totals = [_DECLARED[n].total(tf) for n in names]
+        if any(t is None for t in totals):
+            out[tf] = len(candles)
+        elif max(totals, default=0):
+            out[tf] = min(max(totals), len(candles))
+    return out
@@ -0,0 +1,180 @@
+"""
+Фоновый прогрев данных к закрытию баров.
+
+Планировщик просыпается на закрытии бара каждого таймфрейма (плюс небольшая задержка, чтобы
+биржа успела закрыть свечу) и ставит в очередь обновление закрывшихся ТФ для «горячих»
+символов: фиксированного списка и недавно запрошенных (LRU). Очередь разбирается с
+ограничением запросов к апстримам в секунду; задачи одного символа, ещё не взятые в работу,
+сливаются. Часы и sleep подменяются в тестах.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config import (
+    TF_LIST,
+    PREFETCH_SYMBOLS,
+    PREFETCH_HOT_SIZE,
+    PREFETCH_RPS,
+    PREFETCH_DELAY_SECONDS,
+)
+from app.services.candle_store import TF_MS
+
+logger = logging.getLogger(__name__)
+
+RefreshFn = Callable[[str, List[str]], Awaitable[Any]]
+
+
+class PrefetchScheduler:
+    """Обновление горячих символов по закрытию баров с бюджетом запросов в секунду."""
+
+    def __init__(self, refresh: RefreshFn,
+                 timeframes: Iterable[str] = TF_LIST,
+                 symbols: Iterable[str] = PREFETCH_SYMBOLS,
+                 hot_size: int = PREFETCH_HOT_SIZE,
+                 rps: float = PREFETCH_RPS,
+                 delay: float = PREFETCH_DELAY_SECONDS,
+                 clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep):
+        self._refresh = refresh
+        self.timeframes = [tf for tf in timeframes if tf in TF_MS]
+        self.fixed = [s.upper() for s in symbols if s]
+        self.hot_size = hot_size
+        self.rps = rps
+        self.delay = delay
+        self._clock = clock
+        self._sleep = sleep
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        # symbol -> (срок, ТФ); порядок — очередь
+        self._pending: "OrderedDict[str, Tuple[float, Set[str]]]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._next_slot = 0.0
+        self._tasks: List[asyncio.Task] = []
+        self.next_due: Optional[float] = None
+        self.stats: Dict[str, Any] = {
+            "cycles": 0, "jobs": 0, "merged": 0, "refreshed": 0, "errors": 0,
+            "requests": 0, "last_lag_s": None, "max_lag_s": 0.0,
+        }
+
+    # --- горячий набор ----------------------------------------------------
+
+    def touch(self, symbol: str) -> None:
+        """Отметить символ как недавно запрошенный."""
+        symbol = symbol.upper()
+        self._recent[symbol] = None
+        self._recent.move_to_end(symbol)
+        while len(self._recent) > self.hot_size:
+            self._recent.popitem(last=False)
+
+    def hot_set(self) -> List[str]:
+        return list(dict.fromkeys(self.fixed + list(reversed(self._recent))))
+
+    # --- расписание -------------------------------------------------------
+
+    def next_close(self, now: Optional[float] = None) -> Tuple[float, List[str]]:
+        """Ближайшее закрытие бара (epoch-секунды) и ТФ, которые закрываются в этот момент."""
+        now_ms = int((self._clock() if now is None else now) * 1000)
+        closes = {tf: (now_ms // TF_MS[tf] + 1) * TF_MS[tf] for tf in self.timeframes}
+        close_ms = min(closes.values())
+        return close_ms / 1000, [tf for tf, ms in closes.items() if ms == close_ms]
+
+    def schedule(self, due: float, timeframes: List[str]) -> None:
+        """Поставить обновление ТФ для горячих символов; ожидающие задачи символа сливаются."""
+        for symbol in self.hot_set():
+            if symbol in self._pending:
+                self._pending[symbol][1].update(timeframes)
+                self.stats["merged"] += 1
+            else:
+                self._pending[symbol] = (due, set(timeframes))
+                self.stats["jobs"] += 1
+        self._wakeup.set()
+
+    async def tick(self) -> None:
+        """Дождаться ближайшего закрытия бара и поставить задачи."""
+        close, tfs = self.next_close()
+        due = close + self.delay
+        self.next_due = due
+        wait = due - self._clock()
+        if wait > 0:
+            await self._sleep(wait)
+        self.stats["cycles"] += 1
+        self.schedule(due, tfs)
+
+    # --- разбор очереди ---------------------------------------------------
+
+    async def _throttle(self, cost: int) -> None:
+        """Равномерный темп: не больше rps запросов к апстримам в секунду."""
+        if self.rps <= 0:
+            return
+        now = self._clock()
+        start = max(now, self._next_slot)
+        self._next_slot = start + cost / self.rps
+        if start > now:
+            await self._sleep(start - now)
+
+    async def drain(self) -> None:
+        """Выполнить все ожидающие задачи."""
+        while self._pending:
+            symbol, (due, tfs) = self._pending.popitem(last=False)
+            order = [tf for tf in self.timeframes if tf in tfs]
+            await self._throttle(len(order))
+            lag = max(0.0, self._clock() - due)
+            self.stats["last_lag_s"] = round(lag, 3)
+            self.stats["max_lag_s"] = round(max(self.stats["max_lag_s"], lag), 3)
+            try:
+                await self._refresh(symbol, order)
+                self.stats["refreshed"] += 1
+                self.stats["requests"] += len(order)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Prefetch failed for {symbol} {order}: {e}")
+
+    async def _ticker(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Prefetch scheduler tick failed: {e}")
+                await self._sleep(1.0)
+
+    async def _worker(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.drain()
+
+    # --- жизненный цикл ---------------------------------------------------
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._ticker()), asyncio.create_task(self._worker())]
+        logger.info(f"Prefetch scheduler started: tfs={self.timeframes}, rps={self.rps}")
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        backlog_requests = sum(len(tfs) for _, tfs in self._pending.values())
+        oldest = min((due for due, _ in self._pending.values()), default=None)
+        return {
+            **self.stats,
+            "running": bool(self._tasks),
+            "hot_symbols": len(self.hot_set()),
+            "backlog": len(self._pending),
+            "backlog_requests": backlog_requests,
+            # Насколько отстаёт самая старая задача очереди
+            "backlog_lag_s": round(max(0.0, self._clock() - oldest), 3) if oldest is not None else 0.0,
+            # Оценка времени разбора очереди при текущем бюджете
+            "backlog_eta_s": round(backlog_requests / self.rps, 3) if self.rps > 0 else 0.0,
+            "next_due": self.next_due,
+            "rps": self.rps,
+        }
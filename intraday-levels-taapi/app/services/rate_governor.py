@@ -0,0 +1,289 @@
+"""
+Общий регулятор частоты запросов к TAAPI и Binance на процесс.
+
+По token bucket на (апстрим, API-ключ): ёмкость и период — из лимитов тарифа, стоимость
+запроса — вес эндпоинта (Binance считает weight, bulk TAAPI — по числу construct'ов).
+Регулятор подстраивается под ответы апстрима:
+  - 429/418 и Retry-After — пауза до указанного момента и снижение темпа вдвое;
+  - X-MBX-USED-WEIGHT-1M у Binance — остаток токенов подтягивается к фактическому расходу
+    (ключ/IP могут использовать и другие процессы);
+  - успешные ответы постепенно возвращают темп к номинальному.
+Ожидающие обслуживаются по приоритету: сигнальный путь раньше обычных запросов, фоновый
+прогрев — последним. Приоритет задаётся контекстом (priority_scope) и наследуется задачами.
+"""
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from app.config import RATE_LIMITS, RATE_ENDPOINT_WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_SIGNAL = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BACKGROUND = 2
+
+_PRIORITY_NAMES = {PRIORITY_SIGNAL: "signal", PRIORITY_DEFAULT: "default", PRIORITY_BACKGROUND: "background"}
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("upstream_priority", default=PRIORITY_DEFAULT)
+
+# Хост -> апстрим. У спота и фьючерсов Binance раздельные лимиты weight и свои
+# X-MBX-USED-WEIGHT-1M, поэтому и bucket'ы раздельные
+UPSTREAM_HOSTS = {
+    "api.taapi.io": "taapi",
+    "fapi.binance.com": "binance_futures",
+    "api.binance.com": "binance_spot",
+}
+
+# Минимальная доля номинального темпа после серии 429
+_MIN_SCALE = 0.125
+# Шаг восстановления темпа на успешный ответ
+_RECOVER_STEP = 0.05
+# Пауза по 429 без Retry-After
+_DEFAULT_PENALTY = 5.0
+
+
+@contextlib.contextmanager
+def priority_scope(priority: int) -> Iterator[None]:
+    """Выполнять запросы внутри блока с указанным приоритетом."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def _binance_klines_weight(limit: int) -> int:
+    # Веса /klines по документации Binance Futures
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+def request_weight(upstream: str, method: str, url: str,
+                   params: Optional[Dict[str, Any]] = None, json: Any = None) -> int:
+    """Стоимость запроса в единицах лимита апстрима."""
+    path = urlsplit(url).path
+    override = RATE_ENDPOINT_WEIGHTS.get(f"{upstream}:{path}")
+    if override is not None:
+        return int(override)
+    if upstream == "binance_spot" and path.endswith("/klines"):
+        return 2  # спот: фиксированный вес независимо от limit
+    if upstream == "binance_futures" and path.endswith("/klines"):
+        try:
+            return _binance_klines_weight(int((params or {}).get("limit", 500)))
+        except (TypeError, ValueError):
+            return 5
+    if upstream == "taapi" and path.endswith("/bulk") and isinstance(json, dict):
+        construct = json.get("construct")
+        return max(1, len(construct)) if isinstance(construct, list) else 1
+    return 1
+
+
+def _api_key(upstream: str, params: Optional[Dict[str, Any]], json: Any) -> str:
+    """Идентификатор ключа для разделения лимитов (хэш, сам ключ в статистику не попадает)."""
+    secret = None
+    if isinstance(params, dict):
+        secret = params.get("secret")
+    if secret is None and isinstance(json, dict):
+        secret = json.get("secret")
+    if not secret:
+        return "default"
+    return hashlib.sha1(str(secret).encode()).hexdigest()[:8]
+
+
+class TokenBucket:
+    """Token bucket с адаптивным темпом и очередью ожидающих по приоритету."""
+
+    def __init__(self, capacity: float, period: float, clock: Callable[[], float]):
+        self.capacity = float(capacity)
+        self.period = float(period)
+        self.scale = 1.0
+        self.tokens = float(capacity)
+        self.blocked_until = 0.0
+        self._clock = clock
+        self._updated = clock()
+        self._waiters: List[Tuple[int, int]] = []
+        self._changed = asyncio.Event()
+        self.stats = {"granted": 0, "waited": 0, "wait_seconds": 0.0, "throttled": 0}
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period * self.scale
+
+    def _refill(self) -> float:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def delay_for(self, weight: float) -> float:
+        """Сколько ждать, пока хватит токенов на weight (0 — можно сейчас)."""
+        now = self._refill()
+        wait = max(0.0, self.blocked_until - now)
+        need = min(weight, self.capacity) - self.tokens
+        if need > 0:
+            wait = max(wait, need / self.rate)
+        return wait
+
+    async def acquire(self, weight: float, priority: int,
+                      sleep: Callable[[float], Awaitable[Any]], seq: int) -> float:
+        """Дождаться очереди и токенов; возвращает время ожидания."""
+        entry = (priority, seq)
+        heapq.heappush(self._waiters, entry)
+        started = self._clock()
+        try:
+            while True:
+                changed = self._changed
+                if self._waiters[0] == entry:
+                    delay = self.delay_for(weight)
+                    if delay <= 0:
+                        heapq.heappop(self._waiters)
+                        self.tokens -= min(weight, self.capacity)
+                        break
+                    await sleep(delay)
+                else:
+                    await changed.wait()
+        except BaseException:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+        finally:
+            self._notify()
+        waited = self._clock() - started
+        self.stats["granted"] += 1
+        if waited > 0:
+            self.stats["waited"] += 1
+            self.stats["wait_seconds"] = round(self.stats["wait_seconds"] + waited, 3)
+        return waited
+
+    def penalize(self, retry_after: Optional[float]) -> None:
+        """429: пауза до Retry-After и снижение темпа."""
+        now = self._refill()
+        self.blocked_until = max(self.blocked_until, now + (retry_after if retry_after is not None else _DEFAULT_PENALTY))
+        self.scale = max(_MIN_SCALE, self.scale / 2)
+        self.tokens = min(self.tokens, 0.0)
+        self.stats["throttled"] += 1
+
+    def sync_used(self, used: float) -> None:
+        """Фактический расход за окно от апстрима: токенов не больше, чем осталось у него."""
+        self._refill()
+        self.tokens = min(self.tokens, self.capacity - used)
+
+    def recover(self) -> None:
+        if self.scale < 1.0:
+            self._refill()
+            self.scale = min(1.0, self.scale + _RECOVER_STEP)
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = self._refill()
+        return {
+            **self.stats,
+            "capacity": self.capacity,
+            "period": self.period,
+            "rate_scale": round(self.scale, 3),
+            "tokens": round(self.tokens, 3),
+            "blocked_for": round(max(0.0, self.blocked_until - now), 3),
+            "waiting": len(self._waiters),
+        }
+
+
+class RateGovernor:
+    """Реестр token bucket'ов по (апстрим, ключ)."""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]] = RATE_LIMITS,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep):
+        self.limits = dict(limits)
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._seq = itertools.count()
+        self._by_priority = {name: 0 for name in _PRIORITY_NAMES.values()}
+
+    @staticmethod
+    def upstream_for(url: str) -> Optional[str]:
+        return UPSTREAM_HOSTS.get(urlsplit(url).hostname or "")
+
+    def bucket(self, upstream: str, key: str = "default") -> Optional[TokenBucket]:
+        limit = self.limits.get(upstream)
+        if not limit:
+            return None
+        b = self._buckets.get((upstream, key))
+        if b is None:
+            b = self._buckets[(upstream, key)] = TokenBucket(limit[0], limit[1], self._clock)
+        return b
+
+    async def acquire(self, method: str, url: str, params: Optional[Dict[str, Any]] = None,
+                      json: Any = None, priority: Optional[int] = None) -> Optional[TokenBucket]:
+        """
+        Дождаться разрешения на запрос. Возвращает bucket для observe()
+        или None, если апстрим не регулируется.
+        """
+        upstream = self.upstream_for(url)
+        if upstream is None:
+            return None
+        b = self.bucket(upstream, _api_key(upstream, params, json))
+        if b is None:
+            return None
+        priority = current_priority() if priority is None else priority
+        self._by_priority[_PRIORITY_NAMES.get(priority, str(priority))] = \
+            self._by_priority.get(_PRIORITY_NAMES.get(priority, str(priority)), 0) + 1
+        waited = await b.acquire(request_weight(upstream, method, url, params, json), priority, self._sleep, next(self._seq))
+        if waited > 1.0:
+            logger.debug(f"Rate governor delayed {upstream} request by {waited:.2f}s")
+        return b
+
+    def observe(self, bucket: Optional[TokenBucket], response: Any) -> None:
+        """Учесть ответ апстрима: 429/418, Retry-After, X-MBX-USED-WEIGHT-*."""
+        if bucket is None or response is None:
+            return
+        headers = getattr(response, "headers", {}) or {}
+        used = headers.get("x-mbx-used-weight-1m") or headers.get("x-mbx-used-weight")
+        if used is not None:
+            try:
+                bucket.sync_used(float(used))
+            except ValueError:
+                pass
+        status = getattr(response, "status_code", 200)
+        if status in (429, 418):
+            retry_after = headers.get("retry-after")
+            try:
+                delay = float(retry_after) if retry_after is not None else None
+            except ValueError:
+                delay = None
+            bucket.penalize(delay)
+            logger.warning(f"Upstream rate limit hit (HTTP {status}), retry after {delay}s")
+        elif status < 400:
+            bucket.recover()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "limits": {k: {"capacity": v[0], "period": v[1]} for k, v in self.limits.items()},
+            "requests_by_priority": dict(self._by_priority),
+            "buckets": {f"{u}:{k}": b.get_stats() for (u, k), b in self._buckets.items()},
+        }
+
+
+# Глобальный регулятор процесса
+governor = RateGovernor()
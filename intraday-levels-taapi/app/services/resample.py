@@ -0,0 +1,140 @@
+"""
+Построение старших таймфреймов из базового ряда (обычно 5m).
+
+Бары старшего ТФ выровнены как у биржи: по open time, кратному длительности ТФ от эпохи UTC
+(15m — :00/:15/..., 4h — 00/04/08... UTC). Агрегация: open первого базового бара, high/low —
+экстремумы, close последнего, volume — сумма.
+
+Неполные бары:
+  - первый бакет, в который попала не вся его часть базового ряда (история началась внутри
+    бара), отбрасывается — у биржи этот бар полный, и частичный исказил бы уровни;
+  - последний бакет остаётся частичным — это формирующийся бар, как и у биржи.
+
+resample() — пакетный расчёт, Resampler — инкрементальный по закрытым базовым барам,
+splice() — склейка ранее загруженной длинной истории с производными барами.
+"""
+from typing import Any, Dict, List, Mapping, Optional
+
+import numpy as np
+
+from app.services.candles import Candles, as_candles
+
+
+def resample(base: Candles, base_ms: int, target_ms: int) -> Candles:
+    """Старший ТФ из базового ряда (первый неполный бакет отбрасывается)."""
+    base = as_candles(base)
+    if target_ms % base_ms:
+        raise ValueError(f"Target timeframe {target_ms}ms is not a multiple of base {base_ms}ms")
+    if len(base) == 0:
+        return Candles.empty()
+    if target_ms == base_ms:
+        return base
+
+    bucket = base.t // target_ms
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    # История началась внутри первого бакета — его бар у биржи полный, у нас нет
+    if base.t[0] != bucket[0] * target_ms:
+        starts = starts[1:]
+        if len(starts) == 0:
+            return Candles.empty()
+        base = base[int(starts[0]):]
+        starts = starts - starts[0]
+        bucket = bucket[len(bucket) - len(base):]
+    ends = np.r_[starts[1:], len(base)] - 1
+    return Candles(
+        bucket[starts] * target_ms,
+        base.open[starts],
+        np.maximum.reduceat(base.high, starts),
+        np.minimum.reduceat(base.low, starts),
+        base.close[ends],
+        np.add.reduceat(base.volume, starts),
+    )
+
+
+def splice(history: Optional[Candles], derived: Candles, target_ms: int,
+           max_bars: Optional[int] = None) -> Optional[Candles]:
+    """
+    История ТФ до начала производных баров + производные бары (последние max_bars).
+    None — между историей и производными барами разрыв (нужно загрузить ТФ заново).
+    """
+    derived = as_candles(derived)
+    if history is None or len(history) == 0:
+        return None
+    history = as_candles(history)
+    if len(derived) == 0:
+        return history
+    if history.t[-1] + target_ms < derived.t[0]:
+        return None
+    cut = int(np.searchsorted(history.t, derived.t[0], "left"))
+    out = Candles.concat([history[:cut], derived])
+    return out.tail(max_bars) if max_bars else out
+
+
+class Resampler:
+    """
+    Инкрементальная агрегация: update() принимает закрытый базовый бар и возвращает
+    закрытый бар старшего ТФ, когда его бакет завершился. candles() — закрытые бары
+    плюс текущий частичный (не больше max_bars).
+    """
+
+    def __init__(self, base_ms: int, target_ms: int, max_bars: Optional[int] = None):
+        if target_ms % base_ms:
+            raise ValueError(f"Target timeframe {target_ms}ms is not a multiple of base {base_ms}ms")
+        self.base_ms = base_ms
+        self.target_ms = target_ms
+        self.max_bars = max_bars
+        self._closed: Dict[str, List[Any]] = {k: [] for k in ("t", "open", "high", "low", "close", "volume")}
+        self._current: Optional[Dict[str, float]] = None
+        self._last_t: Optional[int] = None
+
+    def _close_current(self) -> Dict[str, float]:
+        bar = self._current
+        for k, v in bar.items():
+            self._closed[k].append(v)
+        if self.max_bars and len(self._closed["t"]) > 2 * self.max_bars:
+            for k in self._closed:
+                del self._closed[k][:-self.max_bars]
+        self._current = None
+        return bar
+
+    def update(self, bar: Mapping[str, Any]) -> Optional[Dict[str, float]]:
+        t = int(bar["t"])
+        if self._last_t is not None and t <= self._last_t:
+            return None  # уже учтён
+        self._last_t = t
+        start = t // self.target_ms * self.target_ms
+        finished = None
+        if self._current is not None and self._current["t"] != start:
+            finished = self._close_current()
+        if self._current is None:
+            if t != start and not self._closed["t"] and finished is None:
+                # Начали внутри бакета — ждём следующего полного
+                return None
+            self._current = {"t": start, "open": float(bar["open"]), "high": float(bar["high"]),
+                             "low": float(bar["low"]), "close": float(bar["close"]),
+                             "volume": float(bar["volume"])}
+        else:
+            cur = self._current
+            cur["high"] = max(cur["high"], float(bar["high"]))
+            cur["low"] = min(cur["low"], float(bar["low"]))
+            cur["close"] = float(bar["close"])
+            cur["volume"] += float(bar["volume"])
+        # Последний базовый бар бакета — бар старшего ТФ закрыт
+        if t + self.base_ms == start + self.target_ms:
+            finished = self._close_current() if finished is None else finished
+        return finished
+
+    def update_many(self, base: Candles) -> None:
+        base = as_candles(base)
+        for i in range(len(base)):
+            self.update({"t": int(base.t[i]), "open": base.open[i], "high": base.high[i],
+                         "low": base.low[i], "close": base.close[i], "volume": base.volume[i]})
+
+    def candles(self) -> Candles:
+        cols = {k: list(v) for k, v in self._closed.items()}
+        if self._current is not None:
+            for k, v in self._current.items():
+                cols[k].append(v)
+        out = Candles.from_arrays(cols["t"], cols["open"], cols["high"], cols["low"],
+                                  cols["close"], cols["volume"], sort=False)
+        return out.tail(self.max_bars) if self.max_bars else out
@@ -0,0 +1,115 @@
+"""
+Векторизованный поиск свинг-точек (локальных экстремумов) на массивах.
+
+Точка i — свинг-максимум, если её значение не меньше (strict — строго больше) всех соседей
+в окне [i-left, i+right]; для минимума — наоборот. Соседние экстремумы считаются скользящими
+max/min по левому и правому окну без Python-циклов по барам. Кандидаты — только i из
+[left, n-right), как и в прежних циклических реализациях; NaN свингом не бывает и соседом
+не пропускает никого.
+"""
+from typing import Any, NamedTuple, Sequence, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.services.candles import as_candles
+
+
+class Swings(NamedTuple):
+    """Индексы и цены свинг-максимумов (по high) и свинг-минимумов (по low)."""
+    high_idx: np.ndarray
+    high_price: np.ndarray
+    low_idx: np.ndarray
+    low_price: np.ndarray
+
+
+def _neighbour_extreme(x: np.ndarray, left: int, right: int, find_min: bool) -> np.ndarray:
+    """Экстремум соседей каждой точки: окна [i-left, i-1] и [i+1, i+right] (сама точка не входит)."""
+    n = len(x)
+    reduce = np.minimum if find_min else np.maximum
+    out = np.full(n, np.inf if find_min else -np.inf)
+    if left:
+        win = sliding_window_view(x, left)
+        agg = win.min(axis=1) if find_min else win.max(axis=1)
+        # agg[k] — экстремум x[k:k+left], для точки i это k = i-left
+        out[left:] = reduce(out[left:], agg[:n - left])
+    if right:
+        win = sliding_window_view(x, right)
+        agg = win.min(axis=1) if find_min else win.max(axis=1)
+        # для точки i правое окно начинается с k = i+1
+        out[:n - right] = reduce(out[:n - right], agg[1:])
+    return out
+
+
+def swing_mask(values: Sequence[float], left: int = 2, right: int = 2,
+               find_min: bool = False, strict: bool = False) -> np.ndarray:
+    """Булева маска свинг-точек ряда values."""
+    x = np.asarray(values, dtype=np.float64)
+    n = len(x)
+    mask = np.zeros(n, dtype=bool)
+    if n < left + right + 1:
+        return mask
+    if left == 0 and right == 0:
+        # Пустое окно соседей: каждая точка — свинг (как all() по пустому набору)
+        mask[:] = True
+        return mask
+    nb = _neighbour_extreme(x, left, right, find_min)
+    if find_min:
+        hit = x < nb if strict else x <= nb
+    else:
+        hit = x > nb if strict else x >= nb
+    mask[left:n - right] = hit[left:n - right]
+    return mask
+
+
+def swing_indices(values: Sequence[float], left: int = 2, right: int = 2,
+                  find_min: bool = False, strict: bool = False) -> np.ndarray:
+    """Индексы свинг-точек ряда values по возрастанию."""
+    return np.flatnonzero(swing_mask(values, left, right, find_min, strict))
+
+
+def find_swings(ohlcv: Any, left: int = 2, right: int = 2, strict: bool = False) -> Swings:
+    """Свинг-максимумы по high и свинг-минимумы по low для Candles или списка свечей."""
+    c = as_candles(ohlcv)
+    hi = swing_indices(c.high, left, right, strict=strict)
+    lo = swing_indices(c.low, left, right, find_min=True, strict=strict)
+    return Swings(hi, c.high[hi], lo, c.low[lo])
+
+
+def count_within(sorted_vals: np.ndarray, levels: np.ndarray, tol: Union[float, np.ndarray]) -> np.ndarray:
+    """
+    Для каждого уровня — число значений v с |v - level| <= tol (sorted_vals отсортирован по возрастанию).
+    tol — скаляр или массив той же длины, что и levels.
+    """
+    n = len(sorted_vals)
+    if n == 0 or len(levels) == 0:
+        return np.zeros(len(levels), dtype=np.int64)
+    lo = np.searchsorted(sorted_vals, levels - tol, "left")
+    hi = np.searchsorted(sorted_vals, levels + tol, "right")
+
+    def ok(idx):
+        return np.abs(sorted_vals[np.clip(idx, 0, n - 1)] - levels) <= tol
+
+    # |v - level| <= tol монотонно по v, но после округления границы могут сдвинуться
+    # относительно level ± tol на соседние значения — уточняем их той же проверкой, что и раньше
+    while True:
+        step = (lo > 0) & ok(lo - 1)
+        if not step.any():
+            break
+        lo = np.where(step, np.searchsorted(sorted_vals, sorted_vals[np.maximum(lo - 1, 0)], "left"), lo)
+    while True:
+        step = (lo < hi) & ~ok(lo)
+        if not step.any():
+            break
+        lo = np.where(step, np.searchsorted(sorted_vals, sorted_vals[np.minimum(lo, n - 1)], "right"), lo)
+    while True:
+        step = (hi < n) & ok(hi)
+        if not step.any():
+            break
+        hi = np.where(step, np.searchsorted(sorted_vals, sorted_vals[np.minimum(hi, n - 1)], "right"), hi)
+    while True:
+        step = (hi > lo) & ~ok(hi - 1)
+        if not step.any():
+            break
+        hi = np.where(step, np.searchsorted(sorted_vals, sorted_vals[np.maximum(hi - 1, 0)], "left"), hi)
+    return np.maximum(hi - lo, 0)
@@ -2,16 +2,33 @@ import os
 import json
 import asyncio
 import math
-import httpx
-from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+import logging
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
 from datetime import datetime, timezone
 from app.config import (
     TAAPI_KEY, 
     HTTP_TIMEOUT_SECONDS, 
     MAX_RETRIES, 
     TAAPI_BASE_URL,
-    RESULTS
+    TAAPI_BULK_MAX_INDICATORS,
+    TAAPI_BULK_MAX_CONSTRUCTS,
+    CONCURRENCY,
+    RESULTS,
+    BULK_LEVELS_CONCURRENCY,
+    KLINES_BULK_BATCH_SIZE,
+    KLINES_BULK_CONCURRENCY,
+    KLINES_BULK_RETRIES,
+    KLINES_BULK_RETRY_BACKOFF_MS
 )
+from app.services.http_clients import http_clients
+from app.services.candle_store import candle_store
+from app.services.candles import Candles, as_candles, to_epoch_ms
+from app.services.vwap import session_vwap
+from app.services.swings import find_swings, swing_indices, count_within
+from app.services.executor import compute
+
+logger = logging.getLogger(__name__)
 
 def to_ta_symbol(sym: str) -> str:
     """Конвертация символа в формат Taapi.io"""
@@ -21,15 +38,6 @@ def to_ta_symbol(sym: str) -> str:
         return sym[:-4] + "/USDT"
     return sym  # простая эвристика
 
-def session_vwap(ohlcv_rows):
-    """Расчет VWAP (Volume Weighted Average Price)"""
-    num, den = 0.0, 0.0
-    for r in ohlcv_rows:
-        p = (float(r['high']) + float(r['low']) + float(r['close'])) / 3.0
-        v = float(r['volume'])
-        num += p * v; den += v
-    return num/den if den > 0 else None
-
 def classic_pivots(prev_high, prev_low, prev_close):
     """Расчет классических пивотных точек"""
     pp = (prev_high + prev_low + prev_close)/3.0
@@ -45,14 +53,9 @@ def classic_pivots(prev_high, prev_low, prev_close):
 
 def swing_points(ohlcv, left=2, right=2):
     """Поиск свинг-точек (локальных максимумов и минимумов)"""
-    highs, lows = [], []
-    for i in range(left, len(ohlcv)-right):
-        h = float(ohlcv[i]['high'])
-        if all(h>=float(ohlcv[j]['high']) for j in range(i-left, i+right+1) if j!=i):
-            highs.append((i, h))
-        l = float(ohlcv[i]['low'])
-        if all(l<=float(ohlcv[j]['low']) for j in range(i-left, i+right+1) if j!=i):
-            lows.append((i, l))
+    sw = find_swings(ohlcv, left, right)
+    highs = list(zip(sw.high_idx.tolist(), sw.high_price.tolist()))
+    lows = list(zip(sw.low_idx.tolist(), sw.low_price.tolist()))
     return highs, lows
 
 def cluster_levels(points, tolerance):
@@ -116,7 +119,66 @@ def construct_indicator(ind: str, symbol: str, interval: str, inputs: Dict[str,
         c["inputs"] = inputs
     return c
 
-async def taapi_bulk(constructs: List[Dict[str, Any]]) -> Dict[str, Any]:
+def _indicator_obj(c: Dict[str, Any]) -> Dict[str, Any]:
+    """Индикатор construct'а в формате элемента bulk `indicators` (без id)."""
+    ind_name = c.get("indicator")
+    indicator_obj: Dict[str, Any] = {"indicator": ind_name}
+    # candles: use "results" parameter
+    if ind_name == "candles":
+        if "results" in c:
+            # Bulk API restriction: max 20 results per construct
+            try:
+                indicator_obj["results"] = max(1, min(int(c["results"]), 20))
+            except Exception:
+                indicator_obj["results"] = 20
+    else:
+        # other indicators: flatten inputs as fields (e.g., period)
+        inputs = c.get("inputs") or {}
+        for k, v in inputs.items():
+            indicator_obj[k] = v
+    return indicator_obj
+
+def plan_bulk(constructs: List[Dict[str, Any]],
+              max_indicators: int = TAAPI_BULK_MAX_INDICATORS,
+              max_constructs: int = TAAPI_BULK_MAX_CONSTRUCTS) -> Tuple[List[List[Dict[str, Any]]], Dict[str, List[int]]]:
+    """
+    План bulk-запросов:
+    - construct'ы с одинаковыми exchange/symbol/interval сливаются в один (не более max_indicators индикаторов);
+    - одинаковые индикаторы запрашиваются один раз;
+    - несколько construct'ов (символов/интервалов) упаковываются в один POST, если тариф позволяет (max_constructs).
+    Возвращает (requests, owners): requests — список тел `construct` для каждого POST,
+    owners — id индикатора -> индексы исходных construct'ов.
+    """
+    groups: Dict[Tuple[Any, Any, Any], List[Dict[str, Any]]] = {}
+    owners: Dict[str, List[int]] = {}
+    seen: Dict[Tuple[Tuple[Any, Any, Any], str], str] = {}
+
+    for idx, c in enumerate(constructs):
+        base = (c.get("exchange", "binance"), c.get("symbol"), c.get("interval"))
+        indicator_obj = _indicator_obj(c)
+        dedup_key = (base, json.dumps(indicator_obj, sort_keys=True, default=str))
+        ind_id = seen.get(dedup_key)
+        if ind_id is None:
+            ind_id = f"c{idx}"
+            seen[dedup_key] = ind_id
+            groups.setdefault(base, []).append({**indicator_obj, "id": ind_id})
+        owners.setdefault(ind_id, []).append(idx)
+
+    merged: List[Dict[str, Any]] = []
+    for (exchange, symbol, interval), indicators in groups.items():
+        for i in range(0, len(indicators), max_indicators):
+            merged.append({
+                "exchange": exchange,
+                "symbol": symbol,
+                "interval": interval,
+                "indicators": indicators[i:i + max_indicators],
+            })
+
+    step = max(1, max_constructs)
+    requests = [merged[i:i + step] for i in range(0, len(merged), step)]
+    return requests, owners
+
+async def taapi_bulk(constructs: List[Dict[str, Any]], return_exceptions: bool = False) -> Dict[str, Any]:
     """
     Taapi Bulk (per latest docs):
     POST /bulk
@@ -126,71 +188,63 @@ async def taapi_bulk(constructs: List[Dict[str, Any]]) -> Dict[str, Any]:
          "exchange": "binance",
          "symbol": "BTC/USDT",
          "interval": "5m",
-         "indicators": [ {"indicator":"rsi", "period":14}, ... ]
+         "indicators": [ {"indicator":"rsi", "period":14, "id": "c0"}, ... ]
       }
     }
 
-    Мы эмулируем массив запросов, выполняя несколько последовательных вызовов (по одному на каждый construct),
-    и возвращаем агрегированный ответ вида {"results": [ ... ]} в исходном порядке.
+    Construct'ы объединяются планировщиком plan_bulk, запросы выполняются параллельно,
+    а ответы раскладываются по id обратно: {"results": [ ... ]} в исходном порядке,
+    где каждый элемент имеет вид {"data": [<элемент ответа TAAPI для этого construct>]}.
+    Соединения и повторы — через общий пул http_clients.
+    return_exceptions=True — упавший POST не роняет остальные: его construct'ы остаются {"data": []}.
     """
     if not TAAPI_KEY:
         raise RuntimeError("TAAPI_KEY is not set")
 
     url = f"{TAAPI_BASE_URL}/bulk"
-    timeout = httpx.Timeout(HTTP_TIMEOUT_SECONDS)
-    results: List[Any] = []
+    requests, owners = plan_bulk(constructs)
+    sem = asyncio.Semaphore(CONCURRENCY)
 
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        last_err = None
-        for idx, c in enumerate(constructs):
-            for attempt in range(1, MAX_RETRIES + 1):
-                try:
-                    base = {
-                        "exchange": c.get("exchange", "binance"),
-                        "symbol": c.get("symbol"),
-                        "interval": c.get("interval"),
-                    }
-                    ind_name = c.get("indicator")
-                    indicator_obj: Dict[str, Any] = {"indicator": ind_name}
-                    # candles: use "results" parameter
-                    if ind_name == "candles":
-                        if "results" in c:
-                            # Bulk API restriction: max 20 results per construct
-                            try:
-                                indicator_obj["results"] = max(1, min(int(c["results"]), 20))
-                            except Exception:
-                                indicator_obj["results"] = 20
-                    else:
-                        # other indicators: flatten inputs as fields (e.g., period)
-                        inputs = c.get("inputs") or {}
-                        for k, v in inputs.items():
-                            indicator_obj[k] = v
-
-                    body = {
-                        "secret": TAAPI_KEY,
-                        "construct": {
-                            **base,
-                            "indicators": [indicator_obj],
-                        },
-                    }
+    async def send(body_constructs: List[Dict[str, Any]]) -> Any:
+        body = {
+            "secret": TAAPI_KEY,
+            "construct": body_constructs[0] if len(body_constructs) == 1 else body_constructs,
+        }
+        async with sem:
+            r = await http_clients.post(url, json=body, headers={"Content-Type": "application/json"})
+        return r.json()
 
-                    r = await client.post(url, json=body, headers={"Content-Type": "application/json"})
-                    r.raise_for_status()
-                    results.append(r.json())
-                    break
-                except Exception as e:
-                    last_err = e
-                    if attempt == MAX_RETRIES:
-                        raise last_err
-                    await asyncio.sleep(min(0.5 * (2 ** (attempt - 1)), 3.0))
+    responses = await asyncio.gather(*(send(rc) for rc in requests), return_exceptions=return_exceptions)
+
+    results: List[Any] = [{"data": []} for _ in constructs]
+    for response in responses:
+        if isinstance(response, Exception):
+            logger.warning(f"TAAPI bulk request failed: {response}")
+            continue
+        rows = response.get("data") if isinstance(response, dict) else response
+        for item in rows or []:
+            if not isinstance(item, dict):
+                continue
+            for idx in owners.get(str(item.get("id")), []):
+                results[idx] = {"data": [item]}
 
     return {"results": results}
 
-async def get_candles_direct(symbol: str, interval: str, results: int) -> List[Dict[str, Any]]:
+async def get_candles_direct(symbol: str, interval: str, results: int) -> Candles:
+    """
+    Свечи из candle_store: у TAAPI запрашиваются только бары новее последнего сохранённого
+    (при пустой истории — все `results`).
+    """
+    return await candle_store.get(
+        symbol, interval, results,
+        lambda n: _fetch_candles_direct(symbol, interval, n),
+    )
+
+async def _fetch_candles_direct(symbol: str, interval: str, results: int) -> Candles:
     """
     Fetch candles via Direct Method:
     GET /candle?secret=...&exchange=binance&symbol=BTC/USDT&interval=5m&results=...&addResultTimestamp=true
-    Returns normalized list of candles using parse_bulk_candles.
+    Returns Candles (columnar) using parse_bulk_candles for non-array shapes.
     """
     if not TAAPI_KEY:
         raise RuntimeError("TAAPI_KEY is not set")
@@ -205,57 +259,55 @@ async def get_candles_direct(symbol: str, interval: str, results: int) -> List[D
         "addResultTimestamp": "true",
     }
 
-    timeout = httpx.Timeout(HTTP_TIMEOUT_SECONDS)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        last_err = None
-        for attempt in range(1, MAX_RETRIES + 1):
-            try:
-                r = await client.get(url, params=params)
-                r.raise_for_status()
-                data = r.json()
-                # Direct returns object with arrays: timestamp/open/high/low/close/volume
-                if isinstance(data, dict) and all(k in data for k in ["timestamp","open","high","low","close","volume"]):
-                    candles_list: List[Dict[str, Any]] = []
-                    ts_list = data.get("timestamp", []) or []
-                    o_list = data.get("open", []) or []
-                    h_list = data.get("high", []) or []
-                    l_list = data.get("low", []) or []
-                    c_list = data.get("close", []) or []
-                    v_list = data.get("volume", []) or []
-                    n = min(len(ts_list), len(o_list), len(h_list), len(l_list), len(c_list), len(v_list))
-                    for i in range(n):
-                        ts = ts_list[i]
-                        t_iso = datetime.utcfromtimestamp(ts).replace(tzinfo=timezone.utc).isoformat()
-                        candles_list.append({
-                            "t": t_iso,
-                            "open": float(o_list[i]),
-                            "high": float(h_list[i]),
-                            "low": float(l_list[i]),
-                            "close": float(c_list[i]),
-                            "volume": float(v_list[i]),
-                        })
-                    return candles_list
-                # Fallback: parse generic shapes
-                if isinstance(data, list):
-                    payload = {"data": data}
-                elif isinstance(data, dict):
-                    payload = data
-                else:
-                    payload = {"data": []}
-                return parse_bulk_candles(payload)
-            except Exception as e:
-                last_err = e
-                if attempt == MAX_RETRIES:
-                    raise last_err
-                await asyncio.sleep(min(0.5 * (2 ** (attempt - 1)), 3.0))
+    r = await http_clients.get(url, params=params)
+    data = r.json()
+    # Direct returns object with arrays: timestamp/open/high/low/close/volume
+    if isinstance(data, dict) and all(k in data for k in CANDLE_KEYS):
+        return _candles_from_columns(data)
+    # Fallback: parse generic shapes
+    if isinstance(data, list):
+        payload = {"data": data}
+    elif isinstance(data, dict):
+        payload = data
+    else:
+        payload = {"data": []}
+    return parse_bulk_candles(payload)
+
+CANDLE_KEYS = ("timestamp", "open", "high", "low", "close", "volume")
 
-def parse_bulk_candles(construct_result: Any) -> List[Dict[str, Any]]:
+def _candles_from_columns(res: Dict[str, Any]) -> Candles:
+    """Колоночный ответ TAAPI ({'timestamp': [...], 'open': [...], ...}) -> Candles без промежуточных dict'ов."""
+    return Candles.from_arrays(*((res.get(k) or []) for k in CANDLE_KEYS))
+
+def _candles_from_rows(rows: List[Any]) -> Candles:
+    """
+    Список свечей-dict'ов -> Candles: каждое поле сразу собирается в массив,
+    без промежуточной записи на бар; строки без времени пропускаются.
     """
-    Приводим свечи к единому виду:
-    [{'t': iso8601, 'open': float, 'high':..., 'low':..., 'close':..., 'volume': float}]
+    rows = [r for r in rows if isinstance(r, dict)]
+    ts = [r.get("timestamp") or r.get("time") or r.get("t") for r in rows]
+    if any(x is None for x in ts):
+        rows = [r for r, x in zip(rows, ts) if x is not None]
+        ts = [x for x in ts if x is not None]
+    if not rows:
+        return Candles.empty()
+    try:
+        t = np.asarray(ts, dtype=np.float64)
+    except (TypeError, ValueError):
+        # ISO-время
+        t = np.fromiter((to_epoch_ms(x) for x in ts), dtype=np.float64, count=len(ts))
+    cols = []
+    for full, short in (("open", "o"), ("high", "h"), ("low", "l"), ("close", "c"), ("volume", "v")):
+        key = full if full in rows[0] else short
+        col = np.asarray([r.get(key) for r in rows], dtype=np.float64)
+        cols.append(np.nan_to_num(col, nan=0.0))
+    return Candles.from_arrays(t, *cols)
+
+def parse_bulk_candles(construct_result: Any) -> Candles:
+    """
+    Приводим свечи к единому виду — Candles (int64 epoch-ms + float64 OHLCV).
     TAAPI обычно возвращает {'data':[{'timestamp':..., 'open':..., ...},...]}
     """
-    out = []
     # Support multiple TAAPI response shapes
     # 1) Bulk wrapper: { "data": [ { "indicator":"candles", "result": { ... } } ] }
     # 2) Direct result object: { "timestamp": [...], "open": [...], ... }
@@ -267,64 +319,29 @@ def parse_bulk_candles(construct_result: Any) -> List[Dict[str, Any]]:
                 continue
             res = item.get("result") or {}
             # Shape 2a: arrays per field
-            if all(k in res for k in ["timestamp","open","high","low","close","volume"]):
-                ts_list = res.get("timestamp", []) or []
-                o_list = res.get("open", []) or []
-                h_list = res.get("high", []) or []
-                l_list = res.get("low", []) or []
-                c_list = res.get("close", []) or []
-                v_list = res.get("volume", []) or []
-                n = min(len(ts_list), len(o_list), len(h_list), len(l_list), len(c_list), len(v_list))
-                for i in range(n):
-                    ts = ts_list[i]
-                    t_iso = datetime.utcfromtimestamp(ts/1000 if ts > 10**12 else ts).replace(tzinfo=timezone.utc).isoformat()
-                    out.append({
-                        "t": t_iso,
-                        "open": float(o_list[i]),
-                        "high": float(h_list[i]),
-                        "low": float(l_list[i]),
-                        "close": float(c_list[i]),
-                        "volume": float(v_list[i]),
-                    })
-                break
+            if isinstance(res, dict) and all(k in res for k in CANDLE_KEYS):
+                return _candles_from_columns(res)
+            # Shape 2c: list of candle dicts directly under result (bulk candles с results > 1)
+            if isinstance(res, list) and res:
+                return _candles_from_rows(res)
             # Shape 2b: list of dicts under result.data
             data_list = res.get("data") if isinstance(res, dict) else None
             if isinstance(data_list, list) and data_list:
                 construct_result = {"data": data_list}
                 break
 
+    if not isinstance(construct_result, dict):
+        return Candles.empty()
+    if all(k in construct_result for k in CANDLE_KEYS):
+        return _candles_from_columns(construct_result)
+
     data = (
         construct_result.get("data")
         or construct_result.get("value")
         or construct_result.get("result")
         or []
     )
-
-    for r in data:
-        if isinstance(r, dict):
-            ts = r.get("timestamp") or r.get("time") or r.get("t")
-            if isinstance(ts, (int, float)):
-                t_iso = datetime.utcfromtimestamp(ts/1000 if ts > 10**12 else ts).replace(tzinfo=timezone.utc).isoformat()
-            elif ts is not None:
-                t_iso = str(ts)
-            else:
-                continue
-            open_v = r.get("open", r.get("o"))
-            high_v = r.get("high", r.get("h"))
-            low_v = r.get("low", r.get("l"))
-            close_v = r.get("close", r.get("c"))
-            vol_v = r.get("volume", r.get("v", 0.0))
-            out.append({
-                "t": t_iso,
-                "open": float(open_v if open_v is not None else 0.0),
-                "high": float(high_v if high_v is not None else 0.0),
-                "low": float(low_v if low_v is not None else 0.0),
-                "close": float(close_v if close_v is not None else 0.0),
-                "volume": float(vol_v if vol_v is not None else 0.0),
-            })
-
-    out.sort(key=lambda x: x["t"])
-    return out
+    return _candles_from_rows(data) if isinstance(data, list) else Candles.empty()
 
 def parse_indicator_value(construct_result: Any) -> Optional[float]:
     """Извлечение значения индикатора из результата"""
@@ -411,45 +428,78 @@ class TaapiBulkService:
         self.timeout = HTTP_TIMEOUT_SECONDS
         self.max_retries = MAX_RETRIES
     
-    async def get_klines_bulk(self, symbols: List[str], intervals: List[str]) -> Dict[str, Dict[str, List[Dict]]]:
-        """Получение свечных данных для нескольких символов и таймфреймов"""
+    async def _fetch_klines_batch(self, batch: List[Dict[str, Any]],
+                                  retries: int) -> List[Tuple[str, str, Candles]]:
+        """
+        Один bulk-батч свечей: construct'ы, не вернувшие свечей (ошибка POST или пустой ответ),
+        повторяются отдельно — до retries раз с удвоением паузы; удачные не запрашиваются снова.
+        """
+        parsed: List[Tuple[str, str, Candles]] = []
+        pending = batch
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(KLINES_BULK_RETRY_BACKOFF_MS / 1000 * 2 ** (attempt - 1))
+            try:
+                results = (await taapi_bulk(pending, return_exceptions=True)).get("results", [])
+            except Exception as e:
+                logger.warning(f"Klines bulk batch failed (attempt {attempt + 1}): {e}")
+                results = []
+            failed = []
+            for j, construct in enumerate(pending):
+                candles = parse_bulk_candles(results[j]) if j < len(results) else Candles.empty()
+                if not len(candles):
+                    failed.append(construct)
+                    continue
+                symbol = construct["symbol"].replace("/", "")
+                interval = construct["interval"]
+                window = RESULTS.get(interval, 1000)
+                parsed.append((symbol, interval, candle_store.absorb(symbol, interval, candles, window)))
+            pending = failed
+            if not pending:
+                break
+        if pending:
+            logger.error(f"Klines bulk: no candles after {retries + 1} attempts for "
+                         f"{[(c['symbol'], c['interval']) for c in pending]}")
+        return parsed
+
+    async def iter_klines_bulk(self, symbols: List[str], intervals: List[str],
+                               concurrency: int = KLINES_BULK_CONCURRENCY,
+                               batch_size: int = KLINES_BULK_BATCH_SIZE,
+                               retries: int = KLINES_BULK_RETRIES) -> AsyncIterator[Tuple[str, str, Candles]]:
+        """
+        Свечи (символ, интервал, Candles) по мере готовности батчей: одновременно выполняется
+        не больше concurrency батчей по batch_size construct'ов (лимит TAAPI на запрос).
+        """
         constructs = []
-        
+        # Bulk отдаёт не более 20 свечей на construct — запрашиваем только дельту к candle_store
         for symbol in symbols:
             for interval in intervals:
-                results = RESULTS.get(interval, 1000)
+                window = RESULTS.get(interval, 1000)
+                results = min(candle_store.delta_size(symbol, interval, window), 20)
                 constructs.append(construct_candles(symbol, interval, results))
-        
-        if not constructs:
-            return {}
-        
-        # Разбиваем на батчи по 10 запросов (ограничение Taapi.io)
-        batch_size = 10
-        all_results = {}
-        
-        for i in range(0, len(constructs), batch_size):
-            batch = constructs[i:i + batch_size]
-            try:
-                response = await taapi_bulk(batch)
-                results = response.get("results", [])
-                
-                # Обрабатываем результаты
-                for j, result in enumerate(results):
-                    if i + j < len(constructs):
-                        construct = constructs[i + j]
-                        symbol = construct["symbol"].replace("/", "")
-                        interval = construct["interval"]
-                        
-                        if symbol not in all_results:
-                            all_results[symbol] = {}
-                        
-                        candles = parse_bulk_candles(result)
-                        all_results[symbol][interval] = candles
-                        
-            except Exception as e:
-                print(f"Error in batch {i//batch_size + 1}: {e}")
-                continue
-        
+
+        sem = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(batch: List[Dict[str, Any]]) -> List[Tuple[str, str, Candles]]:
+            async with sem:
+                return await self._fetch_klines_batch(batch, retries)
+
+        step = max(1, batch_size)
+        tasks = [asyncio.ensure_future(run(constructs[i:i + step])) for i in range(0, len(constructs), step)]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                for item in await fut:
+                    yield item
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def get_klines_bulk(self, symbols: List[str], intervals: List[str]) -> Dict[str, Dict[str, Candles]]:
+        """Получение свечных данных для нескольких символов и таймфреймов"""
+        all_results: Dict[str, Dict[str, Candles]] = {}
+        async for symbol, interval, candles in self.iter_klines_bulk(symbols, intervals):
+            all_results.setdefault(symbol, {})[interval] = candles
         return all_results
     
     async def get_indicators_bulk(self, symbol: str, interval: str, indicators: List[str], 
@@ -524,10 +574,9 @@ class TaapiBulkService:
                 candles = parse_bulk_candles(results[0])
                 if len(candles) >= 2:
                     # Берем предыдущую свечу для расчета пивотов
-                    prev_candle = candles[-2]
-                    prev_high = float(prev_candle['high'])
-                    prev_low = float(prev_candle['low'])
-                    prev_close = float(prev_candle['close'])
+                    prev_high = float(candles.high[-2])
+                    prev_low = float(candles.low[-2])
+                    prev_close = float(candles.close[-2])
                     
                     return classic_pivots(prev_high, prev_low, prev_close)
             
@@ -610,209 +659,212 @@ class TaapiBulkService:
             print(f"Error getting EMA200 for {symbol} {interval}: {e}")
             return None
     
-    def analyze_level_confluence(self, level_price: float, current_price: float, 
-                               vwap: Optional[float], pivot_points: Optional[Dict], 
+    def analyze_level_confluence(self, level_price: float, current_price: float,
+                               vwap: Optional[float], pivot_points: Optional[Dict],
                                ema200: Optional[float], touches: int = 0) -> Dict[str, Any]:
         """Анализ конвергенции факторов для уровня"""
-        confluence = []
-        
-        # Проверяем близость к VWAP
-        if vwap and abs(level_price - vwap) / vwap < 0.01:  # В пределах 1% от VWAP
-            confluence.append("vwap")
-        
-        # Проверяем близость к пивотным точкам
-        if pivot_points:
-            for key, value in pivot_points.items():
-                if abs(level_price - value) / value < 0.005:  # В пределах 0.5% от пивотов
-                    confluence.append("pivot")
-                    break
-        
-        # Проверяем близость к EMA200
-        if ema200 and abs(level_price - ema200) / ema200 < 0.02:  # В пределах 2% от EMA200
-            confluence.append("ema200_near")
-        
-        # Проверяем круглые числа
-        if level_price > 1:
-            # Для цен > 1 проверяем круглые числа
-            rounded = round(level_price, -int(math.log10(level_price)) + 1)
-            if abs(level_price - rounded) / level_price < 0.01:
-                confluence.append("round")
-        else:
-            # Для цен < 1 проверяем круглые числа с точностью до 2 знаков
-            rounded = round(level_price, 2)
-            if abs(level_price - rounded) / level_price < 0.01:
-                confluence.append("round")
-        
-        # Добавляем количество касаний
-        if touches > 0:
-            confluence.append("touches")
-        
-        # Проверяем соответствие тренду (простая эвристика)
-        if level_price < current_price:
-            confluence.append("trend_ok")  # Уровень поддержки ниже текущей цены
-        
-        return {
-            "confluence": confluence,
-            "confluence_count": len(confluence),
-            "factors": {
-                "vwap_near": vwap and abs(level_price - vwap) / vwap < 0.01,
-                "pivot_near": pivot_points and any(abs(level_price - v) / v < 0.005 for v in pivot_points.values()),
-                "ema200_near": ema200 and abs(level_price - ema200) / ema200 < 0.02,
-                "round_number": "round" in confluence,
-                "touches": touches,
-                "trend_ok": "trend_ok" in confluence
-            }
-        }
-    
+        return analyze_level_confluence(level_price, current_price, vwap, pivot_points, ema200, touches)
+
+    async def _support_resistance_symbol(self, symbol: str, intervals: List[str]) -> Dict[str, Dict]:
+        """Уровни S/R одного символа: ТФ параллельно, расчёт — в пуле compute."""
+        klines = (await self.get_klines_bulk([symbol], intervals)).get(symbol.replace("/", ""), {})
+
+        async def one(interval: str, candles: Candles) -> Tuple[str, Dict[str, Any]]:
+            atr, ema200 = await asyncio.gather(self.get_atr(symbol, interval), self.get_ema200(symbol, interval))
+            return interval, await compute.run(support_resistance_levels, candles, atr, ema200)
+
+        pairs = await asyncio.gather(*(one(interval, candles) for interval, candles in klines.items() if candles))
+        return dict(pairs)
+
+    async def iter_support_resistance_bulk(self, symbols: List[str], intervals: List[str],
+                                           concurrency: int = BULK_LEVELS_CONCURRENCY
+                                           ) -> AsyncIterator[Tuple[str, Dict[str, Dict]]]:
+        """
+        Уровни S/R по символам в порядке готовности: (символ, {интервал: уровни}).
+        Одновременно считается не больше concurrency символов, запросы к TAAPI — в общем
+        бюджете rate_governor; свечи символа не копятся после того, как его результат отдан.
+        """
+        sem = asyncio.Semaphore(concurrency)
+
+        async def run(symbol: str) -> Tuple[str, Dict[str, Dict]]:
+            async with sem:
+                try:
+                    return symbol, await self._support_resistance_symbol(symbol, intervals)
+                except Exception as e:
+                    logger.error(f"Error getting S/R levels for {symbol}: {e}")
+                    return symbol, {}
+
+        tasks = [asyncio.ensure_future(run(symbol)) for symbol in symbols]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
     async def get_support_resistance_bulk(self, symbols: List[str], intervals: List[str]) -> Dict[str, Dict]:
         """Получение уровней поддержки и сопротивления для нескольких символов"""
-        # Сначала получаем свечные данные
-        klines_data = await self.get_klines_bulk(symbols, intervals)
-        
         results = {}
-        for symbol, interval_data in klines_data.items():
-            results[symbol] = {}
-            
-            for interval, candles in interval_data.items():
-                if not candles:
-                    continue
-                
-                # Простой алгоритм поиска уровней
-                highs = [float(c['high']) for c in candles]
-                lows = [float(c['low']) for c in candles]
-                
-                resistance_levels = self._find_peaks(highs, window=5)
-                support_levels = self._find_peaks(lows, window=5, find_min=True)
-                
-                # Рассчитываем VWAP
-                vwap = session_vwap(candles)
-                
-                # Рассчитываем пивотные точки
-                pivot_points = None
-                if len(candles) >= 2:
-                    prev_candle = candles[-2]
-                    prev_high = float(prev_candle['high'])
-                    prev_low = float(prev_candle['low'])
-                    prev_close = float(prev_candle['close'])
-                    pivot_points = classic_pivots(prev_high, prev_low, prev_close)
-                
-                # Рассчитываем свинг-точки
-                swing_data = None
-                if len(candles) >= 5:  # Минимум для свинг-точек
-                    highs_swing, lows_swing = swing_points(candles, left=2, right=2)
-                    high_prices = [h[1] for h in highs_swing]
-                    low_prices = [l[1] for l in lows_swing]
-                    
-                    # Кластеризуем с толерантностью 0.1%
-                    tolerance = float(candles[-1]['close']) * 0.001
-                    resistance_clusters = cluster_levels(high_prices, tolerance)
-                    support_clusters = cluster_levels(low_prices, tolerance)
-                    
-                    swing_data = {
-                        "swing_highs": highs_swing,
-                        "swing_lows": lows_swing,
-                        "resistance_clusters": resistance_clusters,
-                        "support_clusters": support_clusters
-                    }
-                
-                # Получаем ATR и EMA200 для анализа конвергенции
-                atr = await self.get_atr(symbol, interval)
-                ema200 = await self.get_ema200(symbol, interval)
-                current_price = float(candles[-1]['close'])
-                
-                # Анализируем конвергенцию для каждого уровня
-                enhanced_resistance_levels = []
-                for level in resistance_levels:
-                    confluence_analysis = self.analyze_level_confluence(
-                        level['price'], current_price, vwap, pivot_points, ema200, 
-                        int(level.get('strength', 1))
-                    )
-                    
-                    # Рассчитываем толерантность
-                    tick_size = current_price * 0.0001  # Примерный размер тика
-                    tolerance = compute_tolerance(level['price'], atr, tick_size)
-                    
-                    # Оцениваем уровень
-                    score = score_level(level['price'], confluence_analysis['confluence'], None, False)
-                    
-                    enhanced_resistance_levels.append({
-                        **level,
-                        "confluence": confluence_analysis,
-                        "tolerance": tolerance,
-                        "score": score
-                    })
-                
-                enhanced_support_levels = []
-                for level in support_levels:
-                    confluence_analysis = self.analyze_level_confluence(
-                        level['price'], current_price, vwap, pivot_points, ema200, 
-                        int(level.get('strength', 1))
-                    )
-                    
-                    # Рассчитываем толерантность
-                    tick_size = current_price * 0.0001  # Примерный размер тика
-                    tolerance = compute_tolerance(level['price'], atr, tick_size)
-                    
-                    # Оцениваем уровень
-                    score = score_level(level['price'], confluence_analysis['confluence'], None, False)
-                    
-                    enhanced_support_levels.append({
-                        **level,
-                        "confluence": confluence_analysis,
-                        "tolerance": tolerance,
-                        "score": score
-                    })
-                
-                results[symbol][interval] = {
-                    'support_levels': enhanced_support_levels,
-                    'resistance_levels': enhanced_resistance_levels,
-                    'current_price': current_price,
-                    'vwap': vwap,
-                    'pivot_points': pivot_points,
-                    'swing_points': swing_data,
-                    'atr': atr,
-                    'ema200': ema200,
-                    'timestamp': datetime.now().isoformat()
-                }
-        
+        # Символы без уровней остаются в ответе с {}, как и раньше
+        async for symbol, data in self.iter_support_resistance_bulk(symbols, intervals):
+            results[symbol.replace("/", "")] = data
         return results
-    
+
     def _find_peaks(self, data: List[float], window: int = 5, find_min: bool = False) -> List[Dict]:
-        """Поиск пиков в данных"""
-        peaks = []
-        
-        for i in range(window, len(data) - window):
-            if find_min:
-                # Поиск минимумов (поддержка)
-                if all(data[i] <= data[j] for j in range(i - window, i + window + 1) if j != i):
-                    peaks.append({
-                        'price': data[i],
-                        'index': i,
-                        'strength': self._calculate_level_strength(data, i, window)
-                    })
-            else:
-                # Поиск максимумов (сопротивление)
-                if all(data[i] >= data[j] for j in range(i - window, i + window + 1) if j != i):
-                    peaks.append({
-                        'price': data[i],
-                        'index': i,
-                        'strength': self._calculate_level_strength(data, i, window)
-                    })
-        
-        # Сортируем по силе уровня
-        peaks.sort(key=lambda x: x['strength'], reverse=True)
-        
-        return peaks[:5]  # Возвращаем топ-5 уровней
-    
-    def _calculate_level_strength(self, data: List[float], index: int, window: int) -> float:
-        """Расчет силы уровня"""
-        # Простой алгоритм: чем больше касаний уровня, тем он сильнее
-        level_price = data[index]
-        tolerance = level_price * 0.001  # 0.1% толерантность
-        
-        touches = 0
-        for i in range(len(data)):
-            if abs(data[i] - level_price) <= tolerance:
-                touches += 1
-        
-        return touches 
\ No newline at end of file
+        """Поиск пиков в данных (минимумы — поддержка, максимумы — сопротивление)"""
+        return find_peaks(data, window, find_min)
+
+
+def level_strengths(values: Any, idx: np.ndarray) -> np.ndarray:
+    """
+    Сила уровней values[idx] — число значений ряда в пределах 0.1% от уровня (касания).
+    Все уровни за один проход: сортировка ряда и бинарный поиск границ вместо O(n) на уровень.
+    """
+    arr = np.asarray(values, dtype=np.float64)
+    levels = arr[idx]
+    return count_within(np.sort(arr), levels, levels * 0.001)
+
+
+def find_peaks(data: Any, window: int = 5, find_min: bool = False) -> List[Dict]:
+    """Топ-5 свинг-точек ряда по силе (минимумы — поддержка, максимумы — сопротивление)."""
+    arr = np.asarray(data, dtype=np.float64)
+    idx = swing_indices(arr, window, window, find_min=find_min)
+    peaks = [
+        {'price': price, 'index': i, 'strength': strength}
+        for price, i, strength in zip(arr[idx].tolist(), idx.tolist(), level_strengths(arr, idx).tolist())
+    ]
+    # Сортируем по силе уровня
+    peaks.sort(key=lambda x: x['strength'], reverse=True)
+    return peaks[:5]
+
+
+def _enhance_levels(levels: List[Dict], current_price: float, vwap: Optional[float],
+                    pivot_points: Optional[Dict], ema200: Optional[float], atr: Optional[float]) -> List[Dict]:
+    """Конвергенция, толерантность и оценка для каждого уровня."""
+    enhanced = []
+    for level in levels:
+        confluence_analysis = analyze_level_confluence(
+            level['price'], current_price, vwap, pivot_points, ema200,
+            int(level.get('strength', 1))
+        )
+        # Рассчитываем толерантность
+        tick_size = current_price * 0.0001  # Примерный размер тика
+        tolerance = compute_tolerance(level['price'], atr, tick_size)
+        # Оцениваем уровень
+        score = score_level(level['price'], confluence_analysis['confluence'], None, False)
+        enhanced.append({
+            **level,
+            "confluence": confluence_analysis,
+            "tolerance": tolerance,
+            "score": score
+        })
+    return enhanced
+
+
+def support_resistance_levels(candles: Candles, atr: Optional[float], ema200: Optional[float]) -> Dict[str, Any]:
+    """
+    Уровни S/R по свечам одного символа и ТФ: пики high/low, VWAP, пивоты, свинги.
+    Чистая функция над массивами — выполняется в пуле compute.
+    """
+    # Простой алгоритм поиска уровней
+    resistance_levels = find_peaks(candles.high, window=5)
+    support_levels = find_peaks(candles.low, window=5, find_min=True)
+
+    # Рассчитываем VWAP
+    vwap = session_vwap(candles)
+
+    # Рассчитываем пивотные точки
+    pivot_points = None
+    if len(candles) >= 2:
+        prev_high = float(candles.high[-2])
+        prev_low = float(candles.low[-2])
+        prev_close = float(candles.close[-2])
+        pivot_points = classic_pivots(prev_high, prev_low, prev_close)
+
+    # Рассчитываем свинг-точки
+    swing_data = None
+    if len(candles) >= 5:  # Минимум для свинг-точек
+        highs_swing, lows_swing = swing_points(candles, left=2, right=2)
+        high_prices = [h[1] for h in highs_swing]
+        low_prices = [l[1] for l in lows_swing]
+
+        # Кластеризуем с толерантностью 0.1%
+        tolerance = float(candles.close[-1]) * 0.001
+        resistance_clusters = cluster_levels(high_prices, tolerance)
+        support_clusters = cluster_levels(low_prices, tolerance)
+
+        swing_data = {
+            "swing_highs": highs_swing,
+            "swing_lows": lows_swing,
+            "resistance_clusters": resistance_clusters,
+            "support_clusters": support_clusters
+        }
+
+    current_price = float(candles.close[-1])
+    return {
+        'support_levels': _enhance_levels(support_levels, current_price, vwap, pivot_points, ema200, atr),
+        'resistance_levels': _enhance_levels(resistance_levels, current_price, vwap, pivot_points, ema200, atr),
+        'current_price': current_price,
+        'vwap': vwap,
+        'pivot_points': pivot_points,
+        'swing_points': swing_data,
+        'atr': atr,
+        'ema200': ema200,
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def analyze_level_confluence(level_price: float, current_price: float,
+                             vwap: Optional[float], pivot_points: Optional[Dict],
+                             ema200: Optional[float], touches: int = 0) -> Dict[str, Any]:
+    """Анализ конвергенции факторов для уровня"""
+    confluence = []
+
+    # Проверяем близость к VWAP
+    if vwap and abs(level_price - vwap) / vwap < 0.01:  # В пределах 1% от VWAP
+        confluence.append("vwap")
+
+    # Проверяем близость к пивотным точкам
+    if pivot_points:
+        for key, value in pivot_points.items():
+            if abs(level_price - value) / value < 0.005:  # В пределах 0.5% от пивотов
+                confluence.append("pivot")
+                break
+
+    # Проверяем близость к EMA200
+    if ema200 and abs(level_price - ema200) / ema200 < 0.02:  # В пределах 2% от EMA200
+        confluence.append("ema200_near")
+
+    # Проверяем круглые числа
+    if level_price > 1:
+        # Для цен > 1 проверяем круглые числа
+        rounded = round(level_price, -int(math.log10(level_price)) + 1)
+        if abs(level_price - rounded) / level_price < 0.01:
+            confluence.append("round")
+    else:
+        # Для цен < 1 проверяем круглые числа с точностью до 2 знаков
+        rounded = round(level_price, 2)
+        if abs(level_price - rounded) / level_price < 0.01:
+            confluence.append("round")
+
+    # Добавляем количество касаний
+    if touches > 0:
+        confluence.append("touches")
+
+    # Проверяем соответствие тренду (простая эвристика)
+    if level_price < current_price:
+        confluence.append("trend_ok")  # Уровень поддержки ниже текущей цены
+
+    return {
+        "confluence": confluence,
+        "confluence_count": len(confluence),
+        "factors": {
+            "vwap_near": vwap and abs(level_price - vwap) / vwap < 0.01,
+            "pivot_near": pivot_points and any(abs(level_price - v) / v < 0.005 for v in pivot_points.values()),
+            "ema200_near": ema200 and abs(level_price - ema200) / ema200 < 0.02,
+            "round_number": "round" in confluence,
+            "touches": touches,
+            "trend_ok": "trend_ok" in confluence
+        }
+    }
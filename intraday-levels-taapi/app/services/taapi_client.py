@@ -1,11 +1,14 @@
 import os
 import json
-import asyncio
+import logging
 import math
-import httpx
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timezone
 from app.config import TAAPI_KEY, HTTP_TIMEOUT_SECONDS, MAX_RETRIES, TAAPI_BASE_URL
+from app.services.http_clients import http_clients
+from app.services.candles import Candles
+
+logger = logging.getLogger(__name__)
 
 def to_ta_symbol(sym: str) -> str:
     """Конвертирует символ в формат Taapi.io"""
@@ -30,6 +33,14 @@ def construct_indicator(indicator: str, symbol: str, interval: str, parameters:
         "parameters": parameters
     }
 
+def _rate_limited(response) -> bool:
+    """TAAPI сообщает rate limit в теле ответа со статусом 200."""
+    try:
+        data = response.json()
+    except ValueError:
+        return False
+    return isinstance(data, dict) and "error" in data and "rate limit" in str(data["error"]).lower()
+
 async def taapi_bulk(constructs: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Выполняет bulk запрос к Taapi.io API с retry логикой"""
     url = f"{TAAPI_BASE_URL}/bulk"
@@ -39,66 +50,26 @@ async def taapi_bulk(constructs: List[Dict[str, Any]]) -> Dict[str, Any]:
         "constructs": constructs
     }
     
-    for attempt in range(MAX_RETRIES):
-        try:
-            async with httpx.AsyncClient(timeout=HTTP_TIMEOUT_SECONDS) as client:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                # Проверяем на rate limit
-                if "error" in data and "rate limit" in data["error"].lower():
-                    if attempt < MAX_RETRIES - 1:
-                        wait_time = 2 ** attempt  # Экспоненциальная задержка
-                        print(f"Rate limit hit, waiting {wait_time}s...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                
-                return data
-                
-        except httpx.TimeoutException:
-            if attempt < MAX_RETRIES - 1:
-                wait_time = 2 ** attempt
-                print(f"Timeout, retrying in {wait_time}s...")
-                await asyncio.sleep(wait_time)
-                continue
-            else:
-                raise Exception(f"Timeout after {MAX_RETRIES} attempts")
-                
-        except Exception as e:
-            if attempt < MAX_RETRIES - 1:
-                wait_time = 2 ** attempt
-                print(f"Error: {e}, retrying in {wait_time}s...")
-                await asyncio.sleep(wait_time)
-                continue
-            else:
-                raise Exception(f"Failed after {MAX_RETRIES} attempts: {e}")
-    
-    raise Exception("Max retries exceeded")
+    # Повторы/бэкофф — общая политика пула (сетевые ошибки, 429, 5xx и rate limit в теле при 200)
+    response = await http_clients.post(url, json=payload, retry_if=_rate_limited)
+    data = response.json()
+    if _rate_limited(response):
+        logger.warning(f"TAAPI rate limit persisted after retries: {data.get('error')}")
+    return data
 
-def parse_bulk_candles(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+def parse_bulk_candles(data: Dict[str, Any]) -> Candles:
     """Парсит свечные данные из bulk ответа"""
     if not data or "result" not in data:
-        return []
+        return Candles.empty()
     
     result = data["result"]
     if not isinstance(result, list):
-        return []
-    
-    candles = []
-    for candle in result:
-        if isinstance(candle, dict) and all(k in candle for k in ["t", "o", "h", "l", "c", "v"]):
-            candles.append({
-                "t": candle["t"],
-                "o": float(candle["o"]),
-                "h": float(candle["h"]),
-                "l": float(candle["l"]),
-                "c": float(candle["c"]),
-                "v": float(candle["v"])
-            })
+        return Candles.empty()
     
-    return candles
+    return Candles.from_records(
+        candle for candle in result
+        if isinstance(candle, dict) and all(k in candle for k in ["t", "o", "h", "l", "c", "v"])
+    )
 
 def parse_indicator_value(data: Dict[str, Any]) -> Optional[float]:
     """Парсит значение индикатора из bulk ответа"""
@@ -1,7 +1,7 @@
 import httpx
 import asyncio
 import time
-from typing import List, Dict, Optional, Any
+from typing import AsyncIterator, List, Dict, Optional, Any, Tuple
 from datetime import datetime, timedelta
 import logging
 from app.config import (
@@ -15,7 +15,10 @@ from app.config import (
     RESULTS
 )
 from .cache import TTLCache
-from .taapi_bulk import TaapiBulkService, taapi_bulk, construct_candles, construct_indicator, parse_bulk_candles, parse_indicator_value, session_vwap, classic_pivots, swing_points, cluster_levels, compute_tolerance, score_level
+from .candles import Candles
+from .http_clients import http_clients
+from .executor import compute
+from .taapi_bulk import TaapiBulkService, find_peaks, support_resistance_levels, taapi_bulk, construct_candles, construct_indicator, parse_bulk_candles, parse_indicator_value, session_vwap, classic_pivots, swing_points, cluster_levels, compute_tolerance, score_level
 
 logger = logging.getLogger(__name__)
 
@@ -45,45 +48,28 @@ class TaapiService:
         # Добавляем API ключ
         params['secret'] = self.api_key
         
-        for attempt in range(self.max_retries):
-            try:
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.get(url, params=params)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        return data
-                    elif response.status_code == 429:
-                        # Rate limit - ждем и повторяем
-                        wait_time = 2 ** attempt
-                        logger.warning(f"Rate limit hit, waiting {wait_time}s")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        error_text = response.text
-                        logger.error(f"API error {response.status_code}: {error_text}")
-                        raise Exception(f"API error {response.status_code}: {error_text}")
-                        
-            except httpx.TimeoutException:
-                logger.warning(f"Timeout on attempt {attempt + 1}")
-                if attempt == self.max_retries - 1:
-                    raise Exception("Request timeout")
-                await asyncio.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"Request error: {e}")
-                if attempt == self.max_retries - 1:
-                    raise Exception(str(e))
-                await asyncio.sleep(1)
-        
-        raise Exception("Max retries exceeded")
+        # Пул соединений и повторы (429/5xx/таймауты) — общие, из http_clients
+        try:
+            response = await http_clients.get(url, params=params, timeout=self.timeout,
+                                              retries=self.max_retries, raise_for_status=False)
+        except httpx.TimeoutException:
+            raise Exception("Request timeout")
+        except Exception as e:
+            logger.error(f"Request error: {e}")
+            raise Exception(str(e))
+
+        if response.status_code == 200:
+            return response.json()
+        error_text = response.text
+        logger.error(f"API error {response.status_code}: {error_text}")
+        raise Exception(f"API error {response.status_code}: {error_text}")
     
     def _get_cache_key(self, symbol: str, interval: str, indicator: str, **kwargs) -> str:
         """Генерация ключа кэша"""
         params_str = "_".join([f"{k}_{v}" for k, v in sorted(kwargs.items())])
         return f"{symbol}_{interval}_{indicator}_{params_str}"
     
-    async def get_klines(self, symbol: str, interval: str, limit: int = 100) -> List[Dict]:
+    async def get_klines(self, symbol: str, interval: str, limit: int = 100) -> Candles:
         """Получение свечных данных (использует bulk API)"""
         cache_key = self._get_cache_key(symbol, interval, "klines", limit=limit)
         
@@ -106,11 +92,11 @@ class TaapiService:
                 self._cache.set(cache_key, data)
                 return data
             else:
-                return []
+                return Candles.empty()
                 
         except Exception as e:
             logger.error(f"Error getting klines for {symbol} {interval}: {e}")
-            return []
+            return Candles.empty()
     
     async def get_rsi(self, symbol: str, interval: str, period: int = 14) -> Dict:
         """Получение RSI (использует bulk API)"""
@@ -270,10 +256,9 @@ class TaapiService:
             
             if len(klines) >= 2:
                 # Берем предыдущую свечу для расчета пивотов
-                prev_candle = klines[-2]
-                prev_high = float(prev_candle['high'])
-                prev_low = float(prev_candle['low'])
-                prev_close = float(prev_candle['close'])
+                prev_high = float(klines.high[-2])
+                prev_low = float(klines.low[-2])
+                prev_close = float(klines.close[-2])
                 
                 pivot_data = classic_pivots(prev_high, prev_low, prev_close)
                 data = {
@@ -417,120 +402,29 @@ class TaapiService:
                 'timestamp': datetime.now().isoformat()
             }
         
-        # Простой алгоритм поиска уровней поддержки и сопротивления
-        highs = [float(k['high']) for k in klines]
-        lows = [float(k['low']) for k in klines]
-        
-        # Находим локальные максимумы и минимумы
-        resistance_levels = self._find_peaks(highs, window=5)
-        support_levels = self._find_peaks(lows, window=5, find_min=True)
-        
-        # Рассчитываем VWAP
-        vwap = session_vwap(klines)
-        
-        # Рассчитываем пивотные точки
-        pivot_points = None
-        if len(klines) >= 2:
-            prev_candle = klines[-2]
-            prev_high = float(prev_candle['high'])
-            prev_low = float(prev_candle['low'])
-            prev_close = float(prev_candle['close'])
-            pivot_points = classic_pivots(prev_high, prev_low, prev_close)
-        
-        # Рассчитываем свинг-точки
-        swing_data = None
-        if len(klines) >= 5:  # Минимум для свинг-точек
-            highs_swing, lows_swing = swing_points(klines, left=2, right=2)
-            high_prices = [h[1] for h in highs_swing]
-            low_prices = [l[1] for l in lows_swing]
-            
-            # Кластеризуем с толерантностью 0.1%
-            tolerance = float(klines[-1]['close']) * 0.001
-            resistance_clusters = cluster_levels(high_prices, tolerance)
-            support_clusters = cluster_levels(low_prices, tolerance)
-            
-            swing_data = {
-                "swing_highs": highs_swing,
-                "swing_lows": lows_swing,
-                "resistance_clusters": resistance_clusters,
-                "support_clusters": support_clusters
-            }
-        
-        # Получаем ATR и EMA200 для анализа конвергенции
-        atr_data = await self.get_atr(symbol, interval)
-        ema200_data = await self.get_ema200(symbol, interval)
+        # ATR и EMA200 для анализа конвергенции — параллельно; уровни считаются в пуле compute
+        atr_data, ema200_data = await asyncio.gather(self.get_atr(symbol, interval), self.get_ema200(symbol, interval))
         atr = atr_data.get("value") if atr_data else None
         ema200 = ema200_data.get("value") if ema200_data else None
-        current_price = float(klines[-1]['close'])
-        
-        # Анализируем конвергенцию для каждого уровня
-        enhanced_resistance_levels = []
-        for level in resistance_levels:
-            confluence_analysis = self.bulk_service.analyze_level_confluence(
-                level['price'], current_price, vwap, pivot_points, ema200, 
-                int(level.get('strength', 1))
-            )
-            
-            # Рассчитываем толерантность
-            tick_size = current_price * 0.0001  # Примерный размер тика
-            tolerance = compute_tolerance(level['price'], atr, tick_size)
-            
-            # Оцениваем уровень
-            score = score_level(level['price'], confluence_analysis['confluence'], None, False)
-            
-            enhanced_resistance_levels.append({
-                **level,
-                "confluence": confluence_analysis,
-                "tolerance": tolerance,
-                "score": score
-            })
-        
-        enhanced_support_levels = []
-        for level in support_levels:
-            confluence_analysis = self.bulk_service.analyze_level_confluence(
-                level['price'], current_price, vwap, pivot_points, ema200, 
-                int(level.get('strength', 1))
-            )
-            
-            # Рассчитываем толерантность
-            tick_size = current_price * 0.0001  # Примерный размер тика
-            tolerance = compute_tolerance(level['price'], atr, tick_size)
-            
-            # Оцениваем уровень
-            score = score_level(level['price'], confluence_analysis['confluence'], None, False)
-            
-            enhanced_support_levels.append({
-                **level,
-                "confluence": confluence_analysis,
-                "tolerance": tolerance,
-                "score": score
-            })
-        
-        result = {
-            'symbol': symbol,
-            'interval': interval,
-            'support_levels': enhanced_support_levels,
-            'resistance_levels': enhanced_resistance_levels,
-            'current_price': current_price,
-            'vwap': vwap,
-            'pivot_points': pivot_points,
-            'swing_points': swing_data,
-            'atr': atr,
-            'ema200': ema200,
-            'timestamp': datetime.now().isoformat()
-        }
+        levels = await compute.run(support_resistance_levels, klines, atr, ema200)
+        result = {'symbol': symbol, 'interval': interval, **levels}
         
         # Кэшируем результат
         self._cache.set(cache_key, result)
         
         return result
     
-    async def get_klines_bulk(self, symbols: List[str] = None, intervals: List[str] = None) -> Dict[str, Dict[str, List[Dict]]]:
+    async def get_klines_bulk(self, symbols: List[str] = None, intervals: List[str] = None) -> Dict[str, Dict[str, Candles]]:
         """Получение свечных данных для нескольких символов и таймфреймов"""
         symbols = symbols or SYMBOLS
         intervals = intervals or TF_LIST
         
         return await self.bulk_service.get_klines_bulk(symbols, intervals)
+
+    def iter_klines_bulk(self, symbols: List[str] = None,
+                         intervals: List[str] = None) -> AsyncIterator[Tuple[str, str, Candles]]:
+        """Свечи (символ, интервал, Candles) по мере готовности bulk-батчей"""
+        return self.bulk_service.iter_klines_bulk(symbols or SYMBOLS, intervals or TF_LIST)
     
     async def get_indicators_bulk(self, symbol: str, interval: str, indicators: List[str], 
                                 indicator_params: Dict[str, Dict] = None) -> Dict[str, Any]:
@@ -543,46 +437,15 @@ class TaapiService:
         intervals = intervals or TF_LIST
         
         return await self.bulk_service.get_support_resistance_bulk(symbols, intervals)
+
+    def iter_support_resistance_bulk(self, symbols: List[str] = None,
+                                     intervals: List[str] = None) -> AsyncIterator[Tuple[str, Dict[str, Dict]]]:
+        """Уровни поддержки и сопротивления по символам в порядке готовности"""
+        return self.bulk_service.iter_support_resistance_bulk(symbols or SYMBOLS, intervals or TF_LIST)
     
     def _find_peaks(self, data: List[float], window: int = 5, find_min: bool = False) -> List[Dict]:
-        """Поиск пиков в данных"""
-        peaks = []
-        
-        for i in range(window, len(data) - window):
-            if find_min:
-                # Поиск минимумов (поддержка)
-                if all(data[i] <= data[j] for j in range(i - window, i + window + 1) if j != i):
-                    peaks.append({
-                        'price': data[i],
-                        'index': i,
-                        'strength': self._calculate_level_strength(data, i, window)
-                    })
-            else:
-                # Поиск максимумов (сопротивление)
-                if all(data[i] >= data[j] for j in range(i - window, i + window + 1) if j != i):
-                    peaks.append({
-                        'price': data[i],
-                        'index': i,
-                        'strength': self._calculate_level_strength(data, i, window)
-                    })
-        
-        # Сортируем по силе уровня
-        peaks.sort(key=lambda x: x['strength'], reverse=True)
-        
-        return peaks[:5]  # Возвращаем топ-5 уровней
-    
-    def _calculate_level_strength(self, data: List[float], index: int, window: int) -> float:
-        """Расчет силы уровня"""
-        # Простой алгоритм: чем больше касаний уровня, тем он сильнее
-        level_price = data[index]
-        tolerance = level_price * 0.001  # 0.1% толерантность
-        
-        touches = 0
-        for i in range(len(data)):
-            if abs(data[i] - level_price) <= tolerance:
-                touches += 1
-        
-        return touches
+        """Поиск пиков в данных (минимумы — поддержка, максимумы — сопротивление)"""
+        return find_peaks(data, window, find_min)
     
     def clear_cache(self):
         """Очистка кэша"""
@@ -592,6 +455,10 @@ class TaapiService:
         """Получение статистики кэша"""
         return self._cache.get_stats()
     
+    def get_cache_keys(self, limit: int = 100) -> List[str]:
+        """Недавно использованные ключи кэша"""
+        return self._cache.keys(limit)
+    
     def delete_cache_key(self, key: str) -> bool:
         """Удаление конкретного ключа из кэша"""
         return self._cache.delete(key)
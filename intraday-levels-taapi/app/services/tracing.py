@@ -0,0 +1,157 @@
+"""
+Лёгкая трассировка запросов: спаны этапов, заголовок Server-Timing и гистограммы задержек.
+
+Запрос открывает Trace (request_trace()), этапы внутри отмечаются span("имя") — как в самом
+обработчике, так и в дочерних задачах asyncio (контекст наследуется). По завершении спана его
+длительность попадает в гистограмму этапа; Trace.server_timing() собирает заголовок
+Server-Timing, Trace.summary() — поле timings ответа. Вне запроса спаны ничего не стоят.
+
+trace_log() — структурированный (JSON) лог вместо print на горячем пути: пишется только
+для запросов, попавших в выборку TRACE_LOG_SAMPLE_RATE, чтобы лог не стоил дороже работы.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.config import TRACE_LOG_SAMPLE_RATE
+
+logger = logging.getLogger("app.trace")
+
+# Границы корзин гистограммы, мс (последняя корзина — всё, что больше)
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными корзинами: count/sum/max и оценка квантилей."""
+
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Верхняя граница корзины, в которую попадает квантиль q (для последней — max)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return float(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": {f"le_{b}": c for b, c in zip(BUCKETS_MS, self.counts)} | {"inf": self.counts[-1]},
+        }
+
+
+class Trace:
+    """Спаны одного запроса (имя, длительность мс) в порядке завершения."""
+
+    __slots__ = ("started", "spans", "sampled")
+
+    def __init__(self, sampled: bool = False):
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self.sampled = sampled
+
+    def summary(self) -> Dict[str, float]:
+        """Время по этапам (повторяющиеся спаны суммируются) и total, мс."""
+        out: Dict[str, float] = {}
+        for name, ms in self.spans:
+            out[name] = out.get(name, 0.0) + ms
+        out["total"] = (time.perf_counter() - self.started) * 1000
+        return {k: round(v, 3) for k, v in out.items()}
+
+    def server_timing(self) -> str:
+        # Имена метрик Server-Timing — токены: точки допустимы, пробелов нет
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.summary().items())
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+class Tracer:
+    """Гистограммы задержек по этапам для всех запросов процесса."""
+
+    def __init__(self):
+        self.stages: Dict[str, Histogram] = {}
+
+    def observe(self, name: str, ms: float) -> None:
+        hist = self.stages.get(name)
+        if hist is None:
+            hist = self.stages[name] = Histogram()
+        hist.observe(ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"buckets_ms": list(BUCKETS_MS),
+                "stages": {name: h.to_dict() for name, h in sorted(self.stages.items())}}
+
+    def reset(self) -> None:
+        self.stages.clear()
+
+
+tracer = Tracer()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def request_trace(name: str = "request") -> Iterator[Trace]:
+    """Открыть трассу запроса; её total попадает в гистограмму name."""
+    trace = Trace(sampled=random.random() < TRACE_LOG_SAMPLE_RATE)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        tracer.observe(name, (time.perf_counter() - trace.started) * 1000)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Отметить этап текущего запроса (без открытой трассы — ничего не делает)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        trace.spans.append((name, ms))
+        tracer.observe(name, ms)
+
+
+def trace_log(event: str, **fields: Any) -> None:
+    """Структурированная запись для запросов из выборки (вне запроса — по той же вероятности)."""
+    trace = _current.get()
+    sampled = trace.sampled if trace is not None else random.random() < TRACE_LOG_SAMPLE_RATE
+    if sampled:
+        logger.info(json.dumps({"event": event, **fields}, ensure_ascii=False, default=str))
@@ -1,9 +1,11 @@
+import numpy as np
+from app.services.candles import as_candles
+
 def session_vwap(ohlcv_rows):
-    """Расчет VWAP (Volume Weighted Average Price)"""
-    num, den = 0.0, 0.0
-    for r in ohlcv_rows:
-        p = (float(r['high']) + float(r['low']) + float(r['close'])) / 3.0
-        v = float(r['volume'])
-        num += p * v
-        den += v
-    return num/den if den > 0 else None 
\ No newline at end of file
+    """Расчет VWAP (Volume Weighted Average Price) по Candles или списку свечей"""
+    c = as_candles(ohlcv_rows)
+    den = float(c.volume.sum())
+    if den <= 0:
+        return None
+    p = (c.high + c.low + c.close) / 3.0
+    return float(np.dot(p, c.volume)) / den 
\ No newline at end of file
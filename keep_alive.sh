@@ -5,6 +5,9 @@
 
 echo "🔄 Запуск системы мониторинга торговой системы..."
 
+# Пакет `app` сервиса intraday-levels-taapi для userbot
+export PYTHONPATH="$(pwd)/intraday-levels-taapi${PYTHONPATH:+:$PYTHONPATH}"
+
 while true; do
     # Проверяем API сервер
     if ! curl -s http://localhost:8001/health > /dev/null 2>&1; then
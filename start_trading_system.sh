@@ -11,6 +11,9 @@ sleep 3
 # Устанавливаем свежесть сетапов из Setup Screener: 12 часов
 export SETUP_MAX_AGE_HOURS=12
 
+# Пакет `app` сервиса intraday-levels-taapi (регулятор запросов, потоковые индикаторы) для userbot
+export PYTHONPATH="$(cd "$(dirname "$0")" && pwd)/intraday-levels-taapi${PYTHONPATH:+:$PYTHONPATH}"
+
 # Выбор интерпретатора Python: приоритет venv (жёстко), иначе macOS=python, Ubuntu/Linux=python3
 ROOT_DIR="$(cd "$(dirname "$0")" && pwd)"
 VENV_DIR="$ROOT_DIR/venv"
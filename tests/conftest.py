@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Сервис intraday-levels-taapi импортируется как пакет `app` из своего каталога
+_SERVICE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "intraday-levels-taapi")
+if _SERVICE_DIR not in sys.path:
+    sys.path.insert(0, _SERVICE_DIR)
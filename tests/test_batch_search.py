@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import numpy as np
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import app.main_v2 as mv
+from app.services.candles import Candles
+
+
+def _pack(symbol, seed):
+    rng = np.random.default_rng(seed)
+    t0 = 1_735_689_600_000
+    klines = {}
+    for tf, step in (("5m", 300_000), ("15m", 900_000), ("30m", 1_800_000), ("1h", 3_600_000), ("4h", 14_400_000)):
+        n = 200
+        close = 100 + np.cumsum(rng.normal(0, 0.3, n))
+        t = t0 + np.arange(n) * step
+        klines[tf] = Candles.from_arrays(t, close, close + 0.5, close - 0.5, close, np.ones(n))
+    return {"symbol": symbol, "klines": klines, "indicators_30m": {"atr": 1.0, "ema200": 100.0},
+            "sources": {"indicators_30m": "taapi"}, "fetched_at": {}}
+
+
+def test_batch_streams_in_completion_order_with_per_item_errors(monkeypatch):
+    calls = []
+    delays = {"BTCUSDT": 0.3, "ETHUSDT": 0.0, "SOLUSDT": 0.05}
+
+    async def fake_fetch_pack(symbol, max_age=None):
+        calls.append(symbol)
+        await asyncio.sleep(delays[symbol])
+        if symbol == "SOLUSDT":
+            raise HTTPException(502, f"All data sources failed for {symbol}")
+        return _pack(symbol, len(calls))
+
+    async def blocked_filters(symbol):
+        return {"rsi12h": None, "ema200_12h": None}
+
+    monkeypatch.setattr(mv, "fetch_pack", fake_fetch_pack)
+    monkeypatch.setattr(mv, "get_filters_12h", blocked_filters)
+    monkeypatch.setattr(mv, "pack_ages", lambda pack: {})
+
+    items = [
+        {"symbol": "btcusdt", "context": "long"},
+        {"symbol": "ETHUSDT", "context": "short"},
+        {"symbol": "NOTALLOWED", "context": "long"},
+        {"symbol": "ETHUSDT", "context": "long", "origin_tf": "30m"},
+        {"symbol": "SOLUSDT", "context": "long"},
+    ]
+    resp = TestClient(mv.app).post("/levels/intraday-search/batch", json={"items": items})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+
+    assert sorted(line["index"] for line in lines) == list(range(len(items)))
+    # Каждый различный символ загружается один раз
+    assert sorted(calls) == ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+    order = [line["index"] for line in lines]
+    # Самый медленный символ — последним, ответы по быстрым приходят раньше
+    assert order[-1] == 0
+    by_index = {line["index"]: line for line in lines}
+    assert by_index[1]["status"] == 200 and by_index[1]["result"]["reason"] == "filters_12h_blocked"
+    # Сессия считалась в пуле compute — время видно в ответе
+    assert by_index[1]["result"]["compute"]["calls"] == 1
+    assert by_index[3]["status"] == 200 and by_index[3]["context"] == "long"
+    assert by_index[2]["status"] == 400
+    assert by_index[4]["status"] == 502 and "SOLUSDT" in by_index[4]["error"]
+
+
+def test_batch_rejects_oversized_requests(monkeypatch):
+    monkeypatch.setattr(mv, "BATCH_MAX_ITEMS", 2)
+    items = [{"symbol": "BTCUSDT", "context": "long"}] * 3
+    resp = TestClient(mv.app).post("/levels/intraday-search/batch", json={"items": items})
+    assert resp.status_code == 413
+
+
+def test_batch_endpoint_keeps_existing_routes():
+    routes = {(r.path, m) for r in mv.app.routes for m in getattr(r, "methods", ())}
+    for route in (("/health", "GET"), ("/ball_flip", "POST"), ("/levels/intraday-search", "POST"),
+                  ("/levels/intraday-search/batch", "POST"), ("/cursor/run", "POST")):
+        assert route in routes
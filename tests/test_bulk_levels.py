@@ -0,0 +1,103 @@
+import asyncio
+import importlib
+import json
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import app.services.taapi_service as taapi_service_module
+from app.services.candles import Candles
+from app.services.swings import swing_indices
+from app.services.taapi_bulk import TaapiBulkService, level_strengths, support_resistance_levels
+
+
+def _series(n, seed):
+    rng = np.random.default_rng(seed)
+    close = np.round(100 + np.cumsum(rng.normal(0, 0.3, n)), 1)  # плато и повторы цен
+    t = 1_735_689_600_000 + np.arange(n) * 3_600_000
+    return Candles.from_arrays(t, close, close + 0.2, close - 0.2, close, np.ones(n))
+
+
+def test_level_strengths_match_per_level_count():
+    c = _series(3000, 1)
+    for values in (c.high, c.low):
+        idx = swing_indices(values, 5, 5)
+        expected = [int(np.count_nonzero(np.abs(values - values[i]) <= values[i] * 0.001)) for i in idx]
+        assert level_strengths(values, idx).tolist() == expected
+
+
+def _fake_bulk_service(monkeypatch, delays):
+    calls = {"in_flight": 0, "max": 0}
+    svc = TaapiBulkService()
+
+    async def fake_klines(symbols, intervals):
+        symbol = symbols[0]
+        calls["in_flight"] += 1
+        calls["max"] = max(calls["max"], calls["in_flight"])
+        try:
+            await asyncio.sleep(delays[symbol])
+        finally:
+            calls["in_flight"] -= 1
+        return {symbol: {tf: _series(300, hash((symbol, tf)) % 100) for tf in intervals}}
+
+    async def fake_atr(symbol, interval, period=14):
+        await asyncio.sleep(0.01)
+        return 0.5
+
+    async def fake_ema(symbol, interval):
+        await asyncio.sleep(0.01)
+        return 100.0
+
+    monkeypatch.setattr(svc, "get_klines_bulk", fake_klines)
+    monkeypatch.setattr(svc, "get_atr", fake_atr)
+    monkeypatch.setattr(svc, "get_ema200", fake_ema)
+    return svc, calls
+
+
+def test_bulk_levels_stream_in_completion_order_with_bounded_concurrency(monkeypatch):
+    delays = {f"S{i}USDT": 0.05 for i in range(12)}
+    delays["S0USDT"] = 0.4
+    svc, calls = _fake_bulk_service(monkeypatch, delays)
+
+    async def scenario():
+        t0 = time.perf_counter()
+        arrivals = []
+        async for symbol, data in svc.iter_support_resistance_bulk(list(delays), ["1h", "4h"], concurrency=4):
+            arrivals.append((symbol, time.perf_counter() - t0, data))
+        return arrivals, time.perf_counter() - t0
+
+    arrivals, total = asyncio.run(scenario())
+    assert sorted(s for s, _, _ in arrivals) == sorted(delays)
+    # Медленный символ не задерживает остальные: первые ответы — сразу, он — последним
+    assert arrivals[0][1] < 0.15 and arrivals[-1][0] == "S0USDT"
+    assert calls["max"] == 4
+    # 12 символов по 4 одновременно — не последовательно (12 * 0.05 + 0.4)
+    assert total < 0.6
+    symbol, _, data = arrivals[0]
+    candles = _series(300, hash((symbol, "1h")) % 100)
+    expected = support_resistance_levels(candles, 0.5, 100.0)
+    assert {k: v for k, v in data["1h"].items() if k != "timestamp"} == \
+        {k: v for k, v in expected.items() if k != "timestamp"}
+
+
+def test_bulk_levels_endpoint_streams_ndjson(monkeypatch):
+    monkeypatch.setattr(taapi_service_module, "TAAPI_KEY", "test-key")
+    main = importlib.import_module("app.main")
+    delays = {"BTCUSDT": 0.1, "ETHUSDT": 0.0}
+    svc, _ = _fake_bulk_service(monkeypatch, delays)
+    monkeypatch.setattr(main.taapi_service, "bulk_service", svc)
+
+    client = TestClient(main.app)
+    params = {"symbols": "BTCUSDT,ETHUSDT", "intervals": "1h"}
+    resp = client.get("/bulk/levels", params={**params, "stream": "true"})
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["symbol"] for line in lines] == ["ETHUSDT", "BTCUSDT"]
+    assert set(lines[0]["data"]["1h"]) >= {"support_levels", "resistance_levels", "vwap", "atr"}
+
+    # По умолчанию — единый ответ; символ без уровней (свечи не получены) остаётся с {}
+    legacy = client.get("/bulk/levels", params={**params, "symbols": "BTCUSDT,ETHUSDT,NODATAUSDT"})
+    body = legacy.json()
+    assert body["success"] and set(body["data"]["data"]) == {"BTCUSDT", "ETHUSDT", "NODATAUSDT"}
+    assert body["data"]["data"]["NODATAUSDT"] == {}
@@ -0,0 +1,83 @@
+import asyncio
+
+from app.services.cache import TTLCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = TTLCache(ttl_seconds=60, max_entries=3, max_bytes=10**9)
+    for k in "abc":
+        cache.set(k, k)
+    assert cache.get("a") == "a"  # "a" становится недавно использованным
+    cache.set("d", "d")
+    assert cache.get("b") is None
+    assert cache.keys() == ["d", "a", "c"]
+
+    small = TTLCache(ttl_seconds=60, max_entries=100, max_bytes=3000)
+    for i in range(10):
+        small.set(f"k{i}", b"x" * 1000)
+    stats = small.get_stats()
+    assert stats["bytes"] <= 3000 and stats["size"] < 10
+    assert stats["evictions"] == 10 - stats["size"]
+    assert "keys" not in stats
+
+
+def test_expiry_is_amortised_and_counted():
+    clock = _Clock()
+    cache = TTLCache(ttl_seconds=10, max_entries=100, clock=clock)
+    cache.set("old", 1)
+    clock.now += 5
+    cache.set("new", 2)
+    clock.now += 6
+    assert cache.size() == 1
+    assert cache.get("new") == 2 and cache.get("old") is None
+    stats = cache.get_stats()
+    assert stats["expirations"] == 1
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_get_or_load_coalesces_concurrent_misses():
+    cache = TTLCache(ttl_seconds=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"pack": True}
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_load("pack:BTCUSDT", loader) for _ in range(20)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(r == {"pack": True} for r in results)
+    stats = cache.get_stats()
+    assert stats["loads"] == 1 and stats["coalesced"] == 19 and stats["inflight"] == 0
+
+    # Следующий вызов — попадание в кэш
+    asyncio.run(cache.get_or_load("pack:BTCUSDT", loader))
+    assert len(calls) == 1
+
+
+def test_get_or_load_propagates_errors_without_caching():
+    cache = TTLCache(ttl_seconds=60)
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_load("k", failing) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert cache.get("k") is None
+    assert cache.get_stats()["load_errors"] == 1
@@ -0,0 +1,65 @@
+import asyncio
+
+from app.services.candle_store import CandleStore, TF_MS
+from app.services.candles import Candles
+
+T0 = 1_735_689_600_000  # 2025-01-01T00:00:00Z
+STEP = TF_MS["5m"]
+
+
+def _bars(start_idx, count, close=1.0):
+    return Candles.from_records(
+        {"t": T0 + i * STEP, "open": 1.0, "high": 2.0, "low": 0.5, "close": close, "volume": 1.0}
+        for i in range(start_idx, start_idx + count)
+    )
+
+
+class _Upstream:
+    """Апстрим с последними `head` барами; последний бар — незакрытый."""
+
+    def __init__(self, head):
+        self.head = head
+        self.requests = []
+
+    async def fetch(self, n):
+        self.requests.append(n)
+        return _bars(self.head - n, n, close=float(self.head))
+
+
+def test_delta_refresh_merges_forming_bar_and_trims_window():
+    now = {"t": (T0 + 99 * STEP) / 1000 + 10}
+    store = CandleStore(clock=lambda: now["t"])
+    up = _Upstream(head=100)
+
+    first = asyncio.run(store.get("BTCUSDT", "5m", 50, up.fetch))
+    assert up.requests == [50]
+    assert len(first) == 50 and first.t[-1] == T0 + 99 * STEP
+
+    # Прошло 3 бара: запрашиваем 3 новых + перезапрос незакрытого
+    now["t"] += 3 * STEP / 1000
+    up.head = 103
+    second = asyncio.run(store.get("BTCUSDT", "5m", 50, up.fetch))
+    assert up.requests == [50, 4]
+    assert len(second) == 50
+    assert second.t[-1] == T0 + 102 * STEP
+    assert second.t.tolist() == [T0 + i * STEP for i in range(53, 103)]
+    assert second.close[-4] == 103.0  # бывший незакрытый бар заменён на месте
+    assert store.get_stats()["delta_fetches"] == 1
+
+
+def test_short_seed_triggers_full_load_and_gap_refetches():
+    now = {"t": (T0 + 99 * STEP) / 1000}
+    store = CandleStore(clock=lambda: now["t"])
+    up = _Upstream(head=100)
+
+    # Засеяно bulk'ом (20 баров) — для окна 50 нужна полная загрузка
+    store.absorb("BTCUSDT", "5m", _bars(80, 20), 50)
+    asyncio.run(store.get("BTCUSDT", "5m", 50, up.fetch))
+    assert up.requests == [50]
+
+    # Разрыв длиннее окна — снова полная загрузка
+    now["t"] += 80 * STEP / 1000
+    up.head = 180
+    out = asyncio.run(store.get("BTCUSDT", "5m", 50, up.fetch))
+    assert up.requests == [50, 50]
+    assert out.t[0] == T0 + 130 * STEP
@@ -0,0 +1,28 @@
+import numpy as np
+
+from app.services.candles import Candles, as_candles
+
+
+def _rows(n=5):
+    return [
+        {"t": f"2025-01-01T00:{i * 5:02d}:00+00:00", "open": 1.0 + i, "high": 2.0 + i, "low": 0.5 + i, "close": 1.5 + i, "volume": 10.0}
+        for i in range(n)
+    ]
+
+
+def test_records_round_trip_and_short_keys():
+    c = as_candles(_rows())
+    assert c.t.dtype == np.int64 and c.close.dtype == np.float64
+    assert c.to_records() == _rows()
+
+    short = Candles.from_records([{"t": 1_735_689_600, "o": 1, "h": 2, "l": 0.5, "c": 1.5, "v": 3}])
+    assert short.t[0] == 1_735_689_600_000 and short.close[0] == 1.5
+
+
+def test_slices_are_views_and_unsorted_input_is_ordered():
+    c = as_candles(list(reversed(_rows())))
+    assert c.t.tolist() == sorted(c.t.tolist())
+
+    tail = c.tail(2)
+    assert len(tail) == 2 and np.shares_memory(tail.close, c.close)
+    assert tail[-1]["close"] == c.last_close() == 5.5
@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import app.main_v2 as mv
+import app.services.circuit_breaker as cb
+from app.services.candles import Candles
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, Hedger
+
+
+def _candles(n=50):
+    close = 100 + np.arange(n, dtype=float)
+    t = 1_735_689_600_000 + np.arange(n) * 300_000
+    return Candles.from_arrays(t, close, close + 1, close - 1, close, np.ones(n))
+
+
+def test_breaker_opens_on_errors_and_slow_calls_then_probes_half_open():
+    clock = {"now": 0.0}
+    b = CircuitBreaker("taapi", window=10, min_calls=4, failure_rate=0.5, slow_call_ms=1000,
+                       open_seconds=30, half_open_probes=2, clock=lambda: clock["now"])
+    for ok, ms in [(True, 50), (True, 60), (False, 5), (True, 1500)]:
+        assert b.allow()
+        b.record(ok, ms)
+    # Ошибка и медленный вызов — половина окна
+    assert b.state == "open" and not b.allow()
+
+    async def upstream():
+        raise AssertionError("upstream must not be called while open")
+
+    try:
+        asyncio.run(b.run(upstream))
+    except CircuitOpenError:
+        pass
+    clock["now"] = 31
+    assert b.allow() and b.allow() and not b.allow()  # не больше двух проб
+    assert b.state == "half_open"
+    b.record(True, 40)
+    b.record(False, 40)
+    assert b.state == "open"
+
+    clock["now"] = 62
+    assert b.allow() and b.allow()
+    b.record(True, 40)
+    b.record(True, 45)
+    stats = b.get_stats()
+    assert stats["state"] == "closed" and stats["opened"] == 2 and stats["rejected"] >= 3
+
+
+def test_hedge_fires_after_p95_and_first_answer_wins(monkeypatch):
+    monkeypatch.setattr(cb, "HEDGE_MIN_DELAY_MS", 1)
+    taapi, binance = CircuitBreaker("taapi"), CircuitBreaker("binance")
+    for _ in range(20):
+        taapi.record(True, 30)  # p95 TAAPI ~30 мс
+    hedger = Hedger(taapi, binance, enabled=True)
+
+    def source(name, delay, error=None):
+        async def fn():
+            await asyncio.sleep(delay)
+            if error:
+                raise error
+            return name
+        return fn
+
+    async def scenario():
+        t0 = time.perf_counter()
+        slow = await hedger.call(source("taapi", 2.0), source("binance", 0.01))
+        elapsed = time.perf_counter() - t0
+        fast = await hedger.call(source("taapi", 0.001), source("binance", 0.01))
+        failed = await hedger.call(source("taapi", 0.001, RuntimeError("502")), source("binance", 0.0))
+        both = None
+        try:
+            await hedger.call(source("taapi", 0.2), source("binance", 0.0, RuntimeError("down")))
+        except RuntimeError as e:
+            both = e
+        return slow, elapsed, fast, failed, both
+
+    slow, elapsed, fast, failed, both = asyncio.run(scenario())
+    # Хедж через p95 TAAPI, Binance отвечает первым; TAAPI не ждём 2 с
+    assert slow == ("binance", False) and elapsed < 0.5
+    assert fast == ("taapi", True)
+    assert failed == ("binance", False)
+    # Запасной упал, основной отвечает — ждём основной
+    assert both is None
+    stats = hedger.get_stats()
+    assert stats["hedged"] == 2 and stats["fallback_wins"] == 1 and stats["primary_wins"] == 1
+    assert stats["fallback_after_error"] == 1 and stats["primary_only"] == 1
+    assert stats["fallback_win_rate"] == 0.5
+    # Проигравший TAAPI учтён как неудача
+    assert stats["breakers"]["taapi"]["failures"] == 2
+
+
+def test_open_breaker_sends_timeframes_straight_to_fallback(monkeypatch):
+    taapi, binance = CircuitBreaker("taapi", min_calls=2), CircuitBreaker("binance")
+    taapi.record(False, 20000)
+    taapi.record(False, 20000)
+    hedger = Hedger(taapi, binance)
+    taapi_calls, bulk_calls = [], []
+
+    async def fake_direct(symbol, tf, results):
+        taapi_calls.append(tf)
+        return _candles()
+
+    async def fake_binance(symbol, tf, limit):
+        return _candles()
+
+    async def fake_bulk(constructs):
+        bulk_calls.append(constructs)
+        return {"data": []}
+
+    monkeypatch.setattr(mv, "candles_hedger", hedger)
+    monkeypatch.setattr(mv, "taapi_breaker", taapi)
+    monkeypatch.setattr(mv, "get_candles_direct", fake_direct)
+    monkeypatch.setattr(mv, "taapi_bulk", fake_bulk)
+    monkeypatch.setattr(mv.binance_fallback, "get_candles", fake_binance)
+    monkeypatch.setattr(mv, "_upstream_sem", asyncio.Semaphore(4))
+
+    async def scenario():
+        return await mv._fetch_tf("BTCUSDT", "5m"), await mv._fetch_indicators_30m("BTCUSDT")
+
+    (candles, source), indicators = asyncio.run(scenario())
+    assert source == "binance_fallback" and len(candles) == 50
+    # TAAPI не вызывался: ни свечи, ни bulk индикаторов (их посчитают локально)
+    assert taapi_calls == [] and bulk_calls == [] and indicators is None
+
+    stats = TestClient(mv.app).get("/upstream/stats").json()
+    assert stats["breaker_bypass"] == 1
+    assert stats["breakers"]["taapi"]["state"] == "open"
+    assert stats["breakers"]["binance"]["calls"] == 1
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import app.main_v2 as mv
+from app.schemas import LevelSearchRequest
+from app.services.candle_store import TF_MS
+from app.services.candles import Candles
+from app.services.circuit_breaker import CircuitBreaker, Hedger
+from app.services.levels import degraded_score, find_best_level, skipped_checks
+
+
+def _series(tf, n=400):
+    close = 100 + np.sin(np.arange(n) / 7.0) * 2
+    t = 1_735_689_600_000 + np.arange(n) * TF_MS[tf]
+    t = t - t[-1] + 1_736_000_000_000 // TF_MS[tf] * TF_MS[tf]
+    return Candles.from_arrays(t, close, close + 0.4, close - 0.4, close, np.ones(n))
+
+
+@pytest.fixture
+def slow_upstream(monkeypatch):
+    """TAAPI отвечает мгновенно, кроме ТФ из delays; Binance — без ответа (хедж не спасает)."""
+    delays = {}
+    calls = []
+
+    async def fake_direct(symbol, tf, results):
+        calls.append(tf)
+        await asyncio.sleep(delays.get(tf, 0.0))
+        return _series(tf)
+
+    async def dead_fallback(symbol, tf, limit):
+        await asyncio.sleep(10)
+
+    async def passing_filters(symbol):
+        return {"rsi12h": 60.0, "ema200_12h": 1.0}
+
+    monkeypatch.setattr(mv, "get_candles_direct", fake_direct)
+    monkeypatch.setattr(mv.binance_fallback, "get_candles", dead_fallback)
+    monkeypatch.setattr(mv, "get_filters_12h", passing_filters)
+    monkeypatch.setattr(mv, "INDICATORS_SOURCE", "local")
+    monkeypatch.setattr(mv, "candles_hedger", Hedger(CircuitBreaker("taapi"), CircuitBreaker("binance"), enabled=False))
+    monkeypatch.setattr(mv, "_upstream_sem", asyncio.Semaphore(8))
+    mv.cache.clear()
+    yield delays, calls
+    mv.cache.clear()
+
+
+def test_deadline_returns_degraded_level_without_slow_timeframes(slow_upstream, monkeypatch):
+    delays, _ = slow_upstream
+    delays.update({"1h": 0.6, "4h": 0.6})
+    seen = {}
+
+    def spy_find_best_level(c5, c15, c30, c1h, c4h, *args, **kwargs):
+        seen.update(c1h=len(c1h), c4h=len(c4h))
+        res = find_best_level(c5, c15, c30, c1h, c4h, *args, **kwargs)
+        return res or {"price": float(c5.close[-1]), "score": 0.8, "confluence": ["pivot"],
+                       "rr": None, "tolerance": 0.1, "tick_size": 0.01}
+
+    monkeypatch.setattr(mv, "find_best_level", spy_find_best_level)
+
+    async def scenario():
+        req = LevelSearchRequest(symbol="BTCUSDT", context="long", deadline_ms=300)
+        t0 = time.perf_counter()
+        res = await mv.intraday_search(req)
+        elapsed = time.perf_counter() - t0
+        # Загрузка продолжается в фоне — следующий запрос получит полный пакет
+        await asyncio.sleep(0.5)
+        return res, elapsed, mv.cache.peek(mv._cache_key("BTCUSDT"))
+
+    res, elapsed, cached = asyncio.run(scenario())
+    assert elapsed < 0.45
+    assert res.degraded == {"missing_timeframes": ["1h", "4h"], "skipped_checks": ["touches_1h", "htf_swing"]}
+    assert seen == {"c1h": 0, "c4h": 0}
+    assert res.decision == "enter_long"
+    assert res.level["score"] == degraded_score(res.level["raw_score"], ["touches_1h", "htf_swing"])
+    assert res.level["score"] < res.level["raw_score"]
+    assert cached is not None and "missing" not in cached and len(cached["klines"]["4h"]) > 0
+
+
+def test_deadline_without_essential_timeframes_fails_fast(slow_upstream):
+    delays, _ = slow_upstream
+    delays["30m"] = 0.6
+
+    async def scenario():
+        req = LevelSearchRequest(symbol="BTCUSDT", context="long", deadline_ms=200)
+        t0 = time.perf_counter()
+        with pytest.raises(HTTPException) as err:
+            await mv.intraday_search(req)
+        return err.value, time.perf_counter() - t0
+
+    error, elapsed = asyncio.run(scenario())
+    assert error.status_code == 504 and elapsed < 0.35
+
+
+def test_fast_upstream_is_not_degraded(slow_upstream):
+    async def scenario():
+        return await mv.intraday_search(LevelSearchRequest(symbol="BTCUSDT", context="long", deadline_ms=2000))
+
+    res = asyncio.run(scenario())
+    assert res.degraded is None
+    assert res.level is None or "raw_score" not in res.level
+    assert skipped_checks(["4h"]) == [] and skipped_checks(["15m", "1h"]) == ["touches_15m", "touches_1h", "htf_swing"]
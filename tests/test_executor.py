@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import app.main_v2 as mv
+from app.services.candles import Candles
+from app.services.executor import ComputeExecutor, compute_scope
+
+
+def _candles(n, step_ms, seed):
+    rng = np.random.default_rng(seed)
+    close = np.round(100 + np.cumsum(rng.normal(0, 0.4, n)), 2)
+    t = 1_735_689_600_000 + np.arange(n) * step_ms
+    return Candles.from_arrays(t, close, close + 0.3, close - 0.3, close, np.ones(n))
+
+
+def test_thread_pool_keeps_event_loop_running():
+    async def scenario(executor):
+        release = threading.Event()
+
+        async def loop_side():
+            # Цикл должен крутиться, пока расчёт ждёт его сигнала
+            await asyncio.sleep(0.01)
+            release.set()
+
+        job, _ = await asyncio.gather(executor.run(release.wait, 0.5), loop_side())
+        return job
+
+    inline, threads = ComputeExecutor("inline"), ComputeExecutor("thread", workers=2)
+    try:
+        # Inline расчёт блокирует цикл: сигнал не приходит, ожидание истекает
+        assert asyncio.run(scenario(inline)) is False
+        assert asyncio.run(scenario(threads)) is True
+    finally:
+        threads.shutdown()
+
+
+def test_process_pool_runs_level_functions_on_candle_arrays():
+    k30 = _candles(200, 1_800_000, 7)
+    pool = ComputeExecutor("process", workers=1)
+    try:
+        async def scenario():
+            with compute_scope() as stats:
+                session = await pool.run(mv.build_session_info, k30, None)
+                with pytest.raises(HTTPException) as err:
+                    await pool.run(mv.build_session_info, k30.tail(3), None)
+            return session, stats, err.value
+
+        session, stats, error = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert session == mv.build_session_info(k30, None)
+    assert error.status_code == 503
+    assert stats["calls"] == 1 and stats["compute_ms"] > 0 and stats["queue_wait_ms"] >= 0
+    assert pool.get_stats()["calls"] == 1 and pool.get_stats()["errors"] == 1
+
+
+def test_queue_wait_is_reported_per_request():
+    pool = ComputeExecutor("thread", workers=1)
+
+    async def request():
+        with compute_scope() as stats:
+            await pool.run(time.sleep, 0.05)
+        return stats
+
+    async def scenario():
+        return await asyncio.gather(request(), request())
+
+    try:
+        first, second = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    # Один воркер: второй запрос ждёт в очереди, пока считается первый
+    waits = sorted([first["queue_wait_ms"], second["queue_wait_ms"]])
+    assert waits[1] >= 40
+    assert first["compute_ms"] >= 45 and second["compute_ms"] >= 45
+    assert pool.get_stats()["max_in_flight"] == 2
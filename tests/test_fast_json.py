@@ -0,0 +1,57 @@
+import gzip
+import importlib
+import json
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+import app.services.taapi_service as taapi_service_module
+from app.models import APIResponse
+from app.services.candles import Candles
+from app.services.fast_json import api_payload, candles_payload, dumps
+
+
+def _candles(n, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.3, n))
+    t = 1_735_689_600_000 + np.arange(n) * 300_000
+    return Candles.from_arrays(t, close, close + 0.5, close - 0.5, close, rng.uniform(1, 1000, n))
+
+
+def test_payload_matches_default_encoder_and_columnar_roundtrips():
+    c = _candles(300, 1)
+    assert candles_payload(c) == c.to_records()
+    legacy = json.dumps(jsonable_encoder(APIResponse(success=True, data={"data": c.to_records()})))
+    assert json.loads(dumps(api_payload(True, {"data": candles_payload(c)}))) == json.loads(legacy)
+
+    col = json.loads(dumps(candles_payload(c, "columnar")))
+    back = Candles.from_arrays(col["t"], col["open"], col["high"], col["low"], col["close"], col["volume"])
+    assert back.t.tolist() == c.t.tolist() and back.close.tolist() == c.close.tolist()
+    assert len(dumps(candles_payload(c, "columnar"))) < len(dumps(candles_payload(c))) * 0.8
+
+
+def test_bulk_klines_streams_columnar_ndjson_with_gzip(monkeypatch):
+    monkeypatch.setattr(taapi_service_module, "TAAPI_KEY", "test-key")
+    main = importlib.import_module("app.main")
+
+    class FakeBulk:
+        async def iter_klines_bulk(self, symbols, intervals):
+            for i, symbol in enumerate(symbols):
+                for tf in intervals:
+                    yield symbol, tf, _candles(500, i)
+
+    monkeypatch.setattr(main.taapi_service, "bulk_service", FakeBulk())
+    client = TestClient(main.app)
+    params = {"symbols": "BTCUSDT,ETHUSDT", "intervals": "1h,4h", "format": "columnar", "stream": "true"}
+    resp = client.get("/bulk/klines", params=params, headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [(x["symbol"], x["interval"]) for x in lines] == [("BTCUSDT", "1h"), ("BTCUSDT", "4h"),
+                                                            ("ETHUSDT", "1h"), ("ETHUSDT", "4h")]
+    assert lines[0]["candles"]["t"][:2] == [1_735_689_600_000, 1_735_689_900_000]
+
+    raw = client.get("/bulk/klines", params=params, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in raw.headers
+    assert len(gzip.compress(raw.content)) < len(raw.content)
@@ -0,0 +1,170 @@
+import asyncio
+import types
+
+import pytest
+
+import app.main_v2 as mv
+from app.services.cache import TTLCache
+from app.services.candles import Candles
+
+
+def _candles(n=3, base=100.0):
+    return Candles.from_records(
+        {"t": f"2025-01-01T00:{i:02d}:00+00:00", "open": base, "high": base + 1, "low": base - 1, "close": base, "volume": 1.0}
+        for i in range(n)
+    )
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    mv.cache.clear()
+    yield
+    mv.cache.clear()
+
+
+def test_fetch_pack_runs_timeframes_concurrently_with_per_tf_fallback(monkeypatch):
+    in_flight = {"now": 0, "max": 0}
+
+    async def fake_direct(symbol, tf, results):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        try:
+            await asyncio.sleep(0.01)
+            if tf == "4h":
+                raise RuntimeError("taapi down for 4h")
+            return _candles()
+        finally:
+            in_flight["now"] -= 1
+
+    fallback_calls = []
+
+    async def fake_fallback(symbol, tf, limit):
+        fallback_calls.append(tf)
+        return Candles.from_records(
+            [{"t": "2025-01-01T00:00:00+00:00", "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 10.0}]
+        )
+
+    async def fake_bulk(constructs):
+        return {"results": [{"value": float(i)} for i in range(len(constructs))]}
+
+    monkeypatch.setattr(mv, "get_candles_direct", fake_direct)
+    monkeypatch.setattr(mv.binance_fallback, "get_candles", fake_fallback)
+    monkeypatch.setattr(mv, "taapi_bulk", fake_bulk)
+    monkeypatch.setattr(mv, "_upstream_sem", asyncio.Semaphore(3))
+
+    pack = asyncio.run(mv.fetch_pack("BTCUSDT"))
+
+    assert fallback_calls == ["4h"]
+    assert 1 < in_flight["max"] <= 3
+    assert pack["source"] == "mixed"
+    assert pack["sources"]["4h"] == "binance_fallback"
+    assert pack["sources"]["5m"] == "taapi"
+    assert pack["klines"]["4h"][0]["close"] == 1.5
+    assert pack["klines"]["4h"][0]["t"].startswith("2025-01-01T00:00:00")
+    assert pack["indicators_30m"]["ema200"] == 3.0
+
+
+def test_stale_pack_served_while_refreshing_only_over_budget_tfs(monkeypatch):
+    clock = {"now": 1000.0}
+    calls = []
+
+    async def fake_direct(symbol, tf, results):
+        calls.append(tf)
+        await asyncio.sleep(0.01)
+        return _candles(base=clock["now"])
+
+    async def fake_bulk(constructs):
+        return {"results": [{"value": 1.0} for _ in constructs]}
+
+    monkeypatch.setattr(mv, "get_candles_direct", fake_direct)
+    monkeypatch.setattr(mv, "taapi_bulk", fake_bulk)
+    monkeypatch.setattr(mv, "time", types.SimpleNamespace(time=lambda: clock["now"]))
+    monkeypatch.setattr(mv, "cache", TTLCache(ttl_seconds=90, grace_seconds=300, clock=lambda: clock["now"]))
+    monkeypatch.setattr(mv, "MAX_AGE_SECONDS", {"5m": 150, "15m": 300, "30m": 600, "1h": 1200, "4h": 3600})
+
+    async def scenario():
+        first = await mv.fetch_pack("BTCUSDT")
+        assert sorted(calls) == sorted(mv.TF_LIST)
+        calls.clear()
+
+        # TTL истёк, но все ТФ в бюджете — пакет отдаётся сразу, обновление идёт в фоне
+        clock["now"] += 100
+        stale = await mv.fetch_pack("BTCUSDT")
+        assert stale is first and calls == []
+        assert mv.pack_ages(stale)["4h"] == 100
+        await asyncio.sleep(0.05)
+        # Перезапрошен только 5m (возраст больше половины бюджета)
+        assert calls == ["5m"]
+        fresh = mv.cache.get(mv._cache_key("BTCUSDT"))
+        assert mv.pack_ages(fresh) == {"5m": 0, "15m": 100, "30m": 100, "1h": 100, "4h": 100}
+        calls.clear()
+
+        # Вызывающий требует данные не старше 50с — синхронная перезагрузка старых ТФ
+        strict = await mv.fetch_pack("BTCUSDT", max_age=50)
+        assert sorted(calls) == ["15m", "1h", "30m", "4h"]
+        assert max(mv.pack_ages(strict).values()) <= 50
+
+        # Вне бюджета 5m (и вне grace) — обычная блокирующая загрузка
+        calls.clear()
+        clock["now"] += 200
+        await mv.fetch_pack("BTCUSDT")
+        assert "5m" in calls
+        assert mv.cache.get_stats()["stale_hits"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_local_indicators_skip_taapi_bulk(monkeypatch):
+    async def fake_direct(symbol, tf, results):
+        return _candles(n=60)
+
+    async def fail_bulk(constructs):
+        raise AssertionError("bulk must not be called")
+
+    monkeypatch.setattr(mv, "get_candles_direct", fake_direct)
+    monkeypatch.setattr(mv, "taapi_bulk", fail_bulk)
+    monkeypatch.setattr(mv, "INDICATORS_SOURCE", "local")
+
+    pack = asyncio.run(mv.fetch_pack("BTCUSDT"))
+    assert pack["sources"]["indicators_30m"] == "local"
+    assert pack["indicators_30m"]["ema20"] == 100.0
+    assert pack["indicators_30m"]["atr"] == 2.0
+    assert pack["indicators_30m"]["ema200"] is None
+
+
+def test_derived_timeframes_extend_history_from_base(monkeypatch):
+    import numpy as np
+
+    from app.services.candle_store import TF_MS
+    from app.services.resample import resample
+
+    t0 = 1_735_689_600_000
+    n = 2000
+    close = 100 + np.sin(np.arange(n) / 7.0)
+    base = Candles.from_arrays(t0 + np.arange(n) * TF_MS["5m"], close, close + 0.5, close - 0.5, close, np.ones(n))
+    now = {"bars": 1500}
+    calls = []
+
+    async def fake_direct(symbol, tf, results):
+        calls.append(tf)
+        visible = base[:now["bars"]]
+        return resample(visible, TF_MS["5m"], TF_MS[tf]).tail(results)
+
+    monkeypatch.setattr(mv, "get_candles_direct", fake_direct)
+    monkeypatch.setattr(mv, "INDICATORS_SOURCE", "local")
+    monkeypatch.setattr(mv, "DERIVE_TIMEFRAMES", ["15m", "30m", "1h", "4h"])
+
+    async def scenario():
+        first = await mv._load_pack("BTCUSDT")
+        assert sorted(calls) == ["15m", "1h", "30m", "4h", "5m"]
+        calls.clear()
+        now["bars"] += 30
+        second = await mv._load_pack("BTCUSDT", previous=first, refresh=["5m"])
+        assert calls == ["5m"]
+        for tf in ("15m", "30m", "1h", "4h"):
+            assert second["sources"][tf] == "derived"
+            fetched = await fake_direct("BTCUSDT", tf, mv.FETCH_BARS[tf])
+            assert list(second["klines"][tf].t) == list(fetched.t)
+            np.testing.assert_allclose(second["klines"][tf].close, fetched.close)
+
+    asyncio.run(scenario())
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.services.http_clients import HttpClientRegistry, http_clients
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fail_first = 0
+    rate_limited_first = 0
+
+    def do_GET(self):
+        if _StubHandler.fail_first > 0:
+            _StubHandler.fail_first -= 1
+            status, body = 503, b"busy"
+        elif _StubHandler.rate_limited_first > 0:
+            _StubHandler.rate_limited_first -= 1
+            status, body = 200, b'{"error": "Rate limit exceeded"}'
+        else:
+            status, body = 200, b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    _StubHandler.fail_first = 0
+    _StubHandler.rate_limited_first = 0
+
+
+def test_connections_are_reused_within_host_pool(stub_url):
+    registry = HttpClientRegistry(max_retries=1)
+
+    async def run():
+        for _ in range(5):
+            r = await registry.get(f"{stub_url}/candle")
+            assert r.json() == {"ok": True}
+        await registry.aclose()
+        return registry.get_stats()
+
+    stats = asyncio.run(run())
+    host = stats["hosts"][stub_url]
+    assert host["requests"] == 5
+    assert host["connections_opened"] == 1
+    assert host["connections_reused"] == 4
+    assert host["open"] is False
+
+
+def test_retry_policy_retries_5xx_then_succeeds(stub_url, monkeypatch):
+    monkeypatch.setattr("app.services.http_clients.backoff_delay", lambda attempt: 0)
+    _StubHandler.fail_first = 2
+    registry = HttpClientRegistry(max_retries=3)
+
+    async def run():
+        r = await registry.get(f"{stub_url}/bulk")
+        await registry.aclose()
+        return r
+
+    r = asyncio.run(run())
+    assert r.status_code == 200
+    assert registry.get_stats()["hosts"][stub_url]["retries"] == 2
+
+
+def test_retry_if_retries_errors_reported_in_body(stub_url, monkeypatch):
+    monkeypatch.setattr("app.services.http_clients.backoff_delay", lambda attempt: 0)
+    _StubHandler.rate_limited_first = 1
+    registry = HttpClientRegistry(max_retries=3)
+
+    async def run():
+        r = await registry.get(f"{stub_url}/bulk", retry_if=lambda resp: "error" in resp.json())
+        await registry.aclose()
+        return r
+
+    assert asyncio.run(run()).json() == {"ok": True}
+    assert registry.get_stats()["hosts"][stub_url]["retries"] == 1
+
+
+def test_lifespan_registry_is_current_and_closed_on_shutdown():
+    from app.main_v2 import lifespan
+
+    app = FastAPI(lifespan=lifespan)
+    with TestClient(app):
+        registry = app.state.http_clients
+        assert http_clients.registry is registry
+    assert http_clients._registry is None and registry._clients == {}
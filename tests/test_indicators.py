@@ -0,0 +1,198 @@
+"""
+Паритет локальных индикаторов с TA-Lib (на ней построен TAAPI).
+
+Эталон — построчные порты циклов из исходников TA-Lib (ta_EMA.c, ta_RSI.c, ta_ATR.c, ta_ADX.c,
+ta_MACD.c, ta_MFI.c): скалярный код с теми же затравками и порядком операций.
+"""
+import numpy as np
+import pytest
+
+from app.services import indicators as ind
+from app.services.candles import Candles
+
+
+def _series(n=600, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    spread = np.abs(rng.normal(0, 0.6, n)) + 0.05
+    high = close + spread * rng.random(n)
+    low = close - spread * rng.random(n)
+    vol = rng.uniform(10, 1000, n)
+    # Плоский участок: нулевые изменения, DM и TR
+    if n > 120:
+        close[100:120] = close[99]
+        high[100:120] = close[99]
+        low[100:120] = close[99]
+    return high, low, close, vol
+
+
+def _ref_ema(x, p, start=0):
+    k = 2.0 / (p + 1)
+    out = [np.nan] * len(x)
+    prev = sum(x[start:start + p]) / p
+    out[start + p - 1] = prev
+    for i in range(start + p, len(x)):
+        prev = (x[i] - prev) * k + prev
+        out[i] = prev
+    return np.array(out)
+
+
+def _ref_rsi(c, p):
+    out = [np.nan] * len(c)
+    g = l = 0.0
+    for i in range(1, p + 1):
+        d = c[i] - c[i - 1]
+        if d < 0:
+            l -= d
+        else:
+            g += d
+    g /= p; l /= p
+    out[p] = 0.0 if g + l == 0 else 100 * g / (g + l)
+    for i in range(p + 1, len(c)):
+        d = c[i] - c[i - 1]
+        g *= p - 1; l *= p - 1
+        if d < 0:
+            l -= d
+        else:
+            g += d
+        g /= p; l /= p
+        out[i] = 0.0 if g + l == 0 else 100 * g / (g + l)
+    return np.array(out)
+
+
+def _tr(h, l, c, i):
+    return max(h[i] - l[i], abs(h[i] - c[i - 1]), abs(l[i] - c[i - 1]))
+
+
+def _ref_atr(h, l, c, p):
+    out = [np.nan] * len(c)
+    prev = sum(_tr(h, l, c, i) for i in range(1, p + 1)) / p
+    out[p] = prev
+    for i in range(p + 1, len(c)):
+        prev = (prev * (p - 1) + _tr(h, l, c, i)) / p
+        out[i] = prev
+    return np.array(out)
+
+
+def _ref_dmi(h, l, c, p):
+    n = len(c)
+    pdi, mdi, adx = [np.nan] * n, [np.nan] * n, [np.nan] * n
+
+    def dm(i):
+        up, dn = h[i] - h[i - 1], l[i - 1] - l[i]
+        plus = up if (up > 0 and up > dn) else 0.0
+        minus = dn if (dn > 0 and dn > up) else 0.0
+        return plus, minus
+
+    sp = sm = st = 0.0
+    for i in range(1, p):
+        a, b = dm(i)
+        sp += a; sm += b; st += _tr(h, l, c, i)
+    sum_dx = 0.0
+    prev_adx = None
+    for i in range(p, n):
+        a, b = dm(i)
+        sp = sp - sp / p + a
+        sm = sm - sm / p + b
+        st = st - st / p + _tr(h, l, c, i)
+        dx = None
+        if st != 0:
+            pdi[i] = 100 * sp / st
+            mdi[i] = 100 * sm / st
+            s = pdi[i] + mdi[i]
+            if s != 0:
+                dx = 100 * abs(pdi[i] - mdi[i]) / s
+        if i < 2 * p - 1:
+            sum_dx += dx or 0.0
+        elif i == 2 * p - 1:
+            sum_dx += dx or 0.0
+            prev_adx = sum_dx / p
+            adx[i] = prev_adx
+        else:
+            if dx is not None:
+                prev_adx = (prev_adx * (p - 1) + dx) / p
+            adx[i] = prev_adx
+    return np.array(pdi), np.array(mdi), np.array(adx)
+
+
+def _ref_macd(c, fast, slow, sig):
+    slow_e = _ref_ema(c, slow)
+    fast_e = _ref_ema(c, fast, start=slow - fast)
+    line = fast_e - slow_e
+    start = slow - 1
+    signal = _ref_ema(line, sig, start=start)
+    line[:start + sig - 1] = np.nan
+    return line, signal, line - signal
+
+
+def _ref_mfi(h, l, c, v, p):
+    tp = (h + l + c) / 3
+    out = [np.nan] * len(c)
+    for i in range(p, len(c)):
+        pos = neg = 0.0
+        for j in range(i - p + 1, i + 1):
+            mf = tp[j] * v[j]
+            if tp[j] > tp[j - 1]:
+                pos += mf
+            elif tp[j] < tp[j - 1]:
+                neg += mf
+        out[i] = 0.0 if pos + neg < 1 else 100 * pos / (pos + neg)
+    return np.array(out)
+
+
+def _close(a, b):
+    np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+def test_moving_averages_and_oscillators_match_talib():
+    h, l, c, v = _series()
+    _close(ind.ema(c, 20), _ref_ema(c, 20))
+    _close(ind.ema(c, 200), _ref_ema(c, 200))
+    _close(ind.rsi(c, 14), _ref_rsi(c, 14))
+    _close(ind.atr(h, l, c, 14), _ref_atr(h, l, c, 14))
+    _close(ind.mfi(h, l, c, v, 14), _ref_mfi(h, l, c, v, 14))
+    for got, want in zip(ind.macd(c, 12, 26, 9), _ref_macd(c, 12, 26, 9)):
+        _close(got, want)
+
+
+def test_dmi_adx_match_talib_including_flat_stretch():
+    h, l, c, _ = _series()
+    for got, want in zip(ind.dmi(h, l, c, 14), _ref_dmi(h, l, c, 14)):
+        _close(got, want)
+    # Полностью плоский ряд: DI не определены, ADX остаётся на нулевой затравке
+    flat = np.full(60, 5.0)
+    _close(ind.adx(flat, flat, flat, 14), _ref_dmi(flat, flat, flat, 14)[2])
+    assert ind.adx(flat, flat, flat, 14)[-1] == 0.0
+
+
+def test_bbands_obv_and_short_series():
+    h, l, c, v = _series(n=60)
+    upper, middle, lower = ind.bbands(c, 20, 2)
+    window = c[-20:]
+    assert middle[-1] == pytest.approx(window.mean())
+    assert upper[-1] - middle[-1] == pytest.approx(2 * window.std(ddof=0))
+    assert np.isnan(middle[18]) and not np.isnan(middle[19])
+    o = ind.obv(c, v)
+    assert o[0] == v[0]
+    assert o[5] - o[4] == pytest.approx(np.sign(c[5] - c[4]) * v[5])
+    assert np.isnan(ind.ema(c[:10], 20)).all()
+    assert np.isnan(ind.macd(c[:30])[0]).all()
+
+
+def test_taapi_value_shapes_and_backtrack():
+    h, l, c, v = _series(n=300)
+    candles = Candles.from_arrays(np.arange(300) * 60_000, c, h, l, c, v)
+    assert ind.taapi_value("rsi", candles)["value"] == pytest.approx(_ref_rsi(c, 14)[-1])
+    prev = ind.taapi_value("rsi", candles, {"backtrack": 1})["value"]
+    assert prev == pytest.approx(_ref_rsi(c, 14)[-2])
+    m = ind.taapi_value("macd", candles, {"optInFastPeriod": 12, "optInSlowPeriod": 26, "optInSignalPeriod": 9})
+    assert set(m) == {"valueMACD", "valueMACDSignal", "valueMACDHist"}
+    assert set(ind.taapi_value("dmi", candles)) == {"adx", "pdi", "mdi"}
+    assert set(ind.taapi_value("bbands", candles)) == {"valueUpperBand", "valueMiddleBand", "valueLowerBand"}
+    assert ind.taapi_value("ema", candles, {"period": 400}) == {"value": None}
+    assert ind.taapi_value("supertrend", candles) is None
+
+    pack = ind.pack_indicators(candles)
+    assert pack["ema200"] == pytest.approx(_ref_ema(c, 200)[-1])
+    assert pack["adx"] == pytest.approx(_ref_dmi(h, l, c, 14)[2][-1])
+
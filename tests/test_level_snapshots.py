@@ -0,0 +1,286 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import app.main_v2 as mv
+from app.schemas import LevelSearchRequest
+from app.services.candle_store import TF_MS
+from app.services.candles import Candles
+from app.services.level_snapshots import LevelSnapshots, bar_key
+from app.services.levels import compute_candidates, level_swings
+
+T0 = 1_735_689_600_000
+
+
+def _series(tf, n=400, extra=0):
+    n += extra
+    close = 100 + np.sin(np.arange(n) / 7.0) * 2
+    t = T0 + np.arange(n) * TF_MS[tf]
+    return Candles.from_arrays(t, close, close + 0.4, close - 0.4, close, np.ones(n))
+
+
+def _pack(extra_5m=0, extra_1h=0):
+    extra = {"5m": extra_5m, "1h": extra_1h}
+    klines = {tf: _series(tf, extra=extra.get(tf, 0)) for tf in ("5m", "15m", "30m", "1h", "4h")}
+    return {"symbol": "BTCUSDT", "klines": klines, "indicators_30m": {"atr": 0.5, "ema200": 100.0},
+            "sources": {"indicators_30m": "taapi"}, "fetched_at": {}}
+
+
+def test_snapshot_rolls_over_on_bar_close_and_keeps_unaffected_values():
+    store = LevelSnapshots(max_symbols=2)
+    kl = {"5m": _series("5m", 10), "30m": _series("30m", 10)}
+    last_5m = T0 + 9 * TF_MS["5m"]
+    # Бар 5m ещё формируется — ключ по предыдущему закрытому
+    assert bar_key(kl, ["5m"], now_ms=last_5m + 1000)["5m"][0] == last_5m - TF_MS["5m"]
+    now = T0 + 10 * TF_MS["30m"]
+    calls = []
+
+    def counted(name, value):
+        async def fn():
+            calls.append(name)
+            await asyncio.sleep(0.01)
+            return value
+        return fn
+
+    async def failing():
+        calls.append("fail")
+        raise HTTPException(503, "Not enough data for pivots")
+
+    async def scenario():
+        snap = store.current("BTCUSDT", kl, ["5m", "30m"], now_ms=now)
+        # Одновременные запросы ждут один расчёт
+        a, b = await asyncio.gather(store.get_or_compute(snap, "session", ["30m"], counted("session", 1)),
+                                    store.get_or_compute(snap, "session", ["30m"], counted("session", 2)))
+        await store.get_or_compute(snap, "level", ["5m", "30m"], counted("level", 3))
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                await store.get_or_compute(snap, "pivots", ["30m"], failing)
+        # Закрылся бар 5m: сессия переезжает в новый снимок, уровень — считается заново
+        kl["5m"] = _series("5m", 11)
+        new = store.current("BTCUSDT", kl, ["5m", "30m"], now_ms=now)
+        c = await store.get_or_compute(new, "session", ["30m"], counted("session", 4))
+        d = await store.get_or_compute(new, "level", ["5m", "30m"], counted("level", 5))
+        return a, b, c, d, snap, new
+
+    a, b, c, d, snap, new = asyncio.run(scenario())
+    assert (a, b, c, d) == (1, 1, 1, 5) and new is not snap
+    assert calls == ["session", "level", "fail", "fail", "level"]
+    assert store.peek("BTCUSDT") is new and new.peek("session") == 1 and new.peek("pivots") is None
+    stats = store.get_stats()
+    assert stats["rebuilds"] == 1 and stats["carried"] == 1 and stats["errors"] == 2
+    # Содержимое снимка — только закрытые бары
+    forming = store.current("ETHUSDT", kl, ["5m", "30m"], now_ms=T0 + 10 * TF_MS["5m"] + 1000)
+    assert len(forming.closed(kl)["5m"]) == 10 and len(forming.closed(kl)["30m"]) == 1
+
+
+def test_snapshot_keeps_closed_bars_and_applies_live_price(monkeypatch):
+    now = 1_760_000_000_000 + 1000
+    swings_calls = []
+
+    def live_series(tf, last_close):
+        # Последний бар каждого ТФ ещё формируется
+        n = 400
+        t = now // TF_MS[tf] * TF_MS[tf] - np.arange(n)[::-1] * TF_MS[tf]
+        close = 100 + np.sin(np.arange(n) / 7.0) * 2
+        close[-1] = last_close
+        return Candles.from_arrays(t, close, close + 0.4, close - 0.4, close, np.ones(n))
+
+    def spy_swings(*args):
+        swings_calls.append(len(args[0]))
+        return level_swings(*args)
+
+    monkeypatch.setattr("app.services.level_snapshots.time.time", lambda: now / 1000)
+    monkeypatch.setattr(mv, "level_swings", spy_swings)
+    mv.level_snapshots.clear()
+    inds = {"atr": 0.5, "ema200": 100.0}
+
+    def snapshot(last_close):
+        kl = {tf: live_series(tf, last_close) for tf in ("5m", "15m", "30m", "1h", "4h")}
+        pack = {"symbol": "BTCUSDT", "klines": kl, "indicators_30m": inds}
+        return kl, asyncio.run(mv._snapshot_levels("BTCUSDT", pack))
+
+    results = [snapshot(100.0), snapshot(2000.0)]
+    # Свинги — один раз и без формирующегося бара, хотя его цена изменилась
+    assert swings_calls == [399]
+    for kl, body in results:
+        swings = level_swings(*(kl[tf][:-1] for tf in ("5m", "15m", "30m", "1h")))
+        expected = compute_candidates(kl["5m"], kl["15m"], kl["30m"], kl["1h"], kl["4h"], body["session_info"],
+                                      body["tick_size"], inds, "long", swings=swings)
+        assert body["candidates"]["long"] == expected
+        # Пивоты — из снимка, VWAP текущих суток — с формирующимся баром, как без снимка
+        assert body["session_info"] == mv.build_session_info(kl["30m"], None)
+    # Толерантность — по текущей цене: у уровня 97.6 появляется ema200_near
+    assert results[0][1]["candidates"] != results[1][1]["candidates"]
+    mv.level_snapshots.clear()
+
+
+
+def test_session_vwap_includes_forming_bar_at_start_of_day(monkeypatch):
+    # Первые 30 минут суток UTC: единственный бар текущих суток ещё формируется
+    day_start = 20371 * 86_400_000
+    now = day_start + 1000
+    n = 200
+    t = day_start - np.arange(n)[::-1] * TF_MS["30m"]
+    close = 100 + np.sin(np.arange(n) / 7.0) * 2
+    k30 = Candles.from_arrays(t, close, close + 0.4, close - 0.4, close, np.arange(1, n + 1, dtype=float))
+    kl = {"5m": k30, "30m": k30}
+    monkeypatch.setattr("app.services.level_snapshots.time.time", lambda: now / 1000)
+    mv.level_snapshots.clear()
+
+    async def scenario():
+        snap = mv.level_snapshots.current("BTCUSDT", kl, ["5m", "30m"])
+        return snap, await mv._session_info(snap, kl)
+
+    snap, session = asyncio.run(scenario())
+    assert snap.key["30m"][0] == day_start - TF_MS["30m"]
+    assert session == mv.build_session_info(k30, None)
+    assert session["vwap_session"] == pytest.approx(float(close[-1]))
+    mv.level_snapshots.clear()
+
+def test_search_reuses_snapshot_until_bar_close(monkeypatch):
+    packs = {"current": _pack()}
+    counts = {"session": 0, "swings": 0}
+    build_session_pivots = mv.build_session_pivots
+
+    async def fake_fetch_pack(symbol, max_age=None):
+        return packs["current"]
+
+    async def passing_filters(symbol):
+        return {"rsi12h": 60.0, "ema200_12h": 1.0}
+
+    def spy_session(k30, **kwargs):
+        counts["session"] += 1
+        return build_session_pivots(k30, **kwargs)
+
+    def spy_swings(*args):
+        counts["swings"] += 1
+        return level_swings(*args)
+
+    monkeypatch.setattr(mv, "fetch_pack", fake_fetch_pack)
+    monkeypatch.setattr(mv, "get_filters_12h", passing_filters)
+    monkeypatch.setattr(mv, "build_session_pivots", spy_session)
+    monkeypatch.setattr(mv, "level_swings", spy_swings)
+    monkeypatch.setattr(mv, "pack_ages", lambda pack: {})
+    mv.level_snapshots.clear()
+
+    async def search(side="long"):
+        return await mv.intraday_search(LevelSearchRequest(symbol="BTCUSDT", context=side))
+
+    first = asyncio.run(search())
+    second = asyncio.run(search())
+    assert counts == {"session": 1, "swings": 1}
+    assert second.level == first.level and second.orders == first.orders
+
+    # Новый закрытый бар 5m: свинги пересчитываются, сессия (30m) — нет
+    packs["current"] = _pack(extra_5m=1)
+    asyncio.run(search())
+    assert counts == {"session": 1, "swings": 2}
+
+    client = TestClient(mv.app)
+    body = client.get("/levels/snapshot/BTCUSDT").json()
+    kl = packs["current"]["klines"]
+    expected = compute_candidates(kl["5m"], kl["15m"], kl["30m"], kl["1h"], kl["4h"], body["session_info"],
+                                  body["tick_size"], {"atr": 0.5, "ema200": 100.0}, "short")
+    assert body["candidates"]["short"] == expected
+    assert body["bars"]["5m"]["t"] == int(kl["5m"].t[-1])
+    assert counts["swings"] == 2  # обе стороны — по свингам из снимка
+    stats = client.get("/snapshots/stats").json()
+    assert stats["symbols"] == 1 and stats["hits"] >= 3
+    mv.level_snapshots.clear()
+
+
+def test_search_memoizes_origin_indicators_and_rechecks_filters(monkeypatch):
+    packs = {"current": _pack()}
+    calls = {"filters": 0, "origin": 0}
+    filters = {"rsi12h": 60.0, "ema200_12h": 1.0}
+    origin_delay = {"s": 0.0}
+
+    async def fake_fetch_pack(symbol, max_age=None):
+        return packs["current"]
+
+    async def counted_filters(symbol):
+        calls["filters"] += 1
+        return dict(filters)
+
+    def counted_origin(candles):
+        # Локальный расчёт по закрытым барам 1h (в пуле compute)
+        calls["origin"] += 1
+        time.sleep(origin_delay["s"])
+        return {"atr": 0.6, "ema200": 100.0}
+
+    monkeypatch.setattr(mv, "fetch_pack", fake_fetch_pack)
+    monkeypatch.setattr(mv, "get_filters_12h", counted_filters)
+    monkeypatch.setattr(mv, "INDICATORS_SOURCE", "local")
+    monkeypatch.setattr(mv, "pack_indicators", counted_origin)
+    monkeypatch.setattr(mv, "pack_ages", lambda pack: {"5m": 1.0})
+    mv.level_snapshots.clear()
+    mv.level_snapshots._by_kind.clear()
+
+    def request(**kwargs):
+        return LevelSearchRequest(symbol="BTCUSDT", context="long", origin_tf="60m", **kwargs)
+
+    async def scenario():
+        first = await mv.intraday_search(request())
+        repeats = [await mv.intraday_search(request()) for _ in range(5)]
+        # Вердикт 12h поменялся внутри бара — ответ меняется сразу
+        filters["rsi12h"] = 40.0
+        blocked = await mv.intraday_search(request())
+        filters["rsi12h"] = 60.0
+        # Закрытие 5m не трогает индикаторы 60m, закрытие 1h — перезапрашивает
+        packs["current"] = _pack(extra_5m=1)
+        await mv.intraday_search(request())
+        before_1h = dict(calls)
+        # Одновременно с дедлайном и без: частичный ответ не достаётся второму запросу
+        packs["current"] = _pack(extra_5m=1, extra_1h=1)
+        origin_delay["s"] = 0.5
+        hurried, patient = await asyncio.gather(mv.intraday_search(request(deadline_ms=300)),
+                                                mv.intraday_search(request()))
+        after = await mv.intraday_search(request(deadline_ms=300))
+        return first, repeats, blocked, before_1h, hurried, patient, after
+
+    first, repeats, blocked, before_1h, hurried, patient, after = asyncio.run(scenario())
+    assert all(r.model_dump(exclude={"compute"}) == first.model_dump(exclude={"compute"}) for r in repeats)
+    assert first.reason != "filters_12h_blocked" and blocked.reason == "filters_12h_blocked"
+    assert before_1h == {"filters": 8, "origin": 1}
+    assert hurried.degraded == {"missing_timeframes": [], "skipped_checks": ["origin_indicators"]}
+    assert patient.degraded is None and after.degraded is None
+    assert calls["origin"] == 2
+    origin = mv.level_snapshots.get_stats()["by_kind"]["origin"]
+    assert origin["misses"] == 2 and origin["hits"] == 9
+    mv.level_snapshots.clear()
+
+
+def test_search_fetches_taapi_origin_indicators_every_request(monkeypatch):
+    calls = []
+
+    async def fake_fetch_pack(symbol, max_age=None):
+        return _pack()
+
+    async def passing_filters(symbol):
+        return {"rsi12h": 60.0, "ema200_12h": 1.0}
+
+    async def taapi_origin(symbol, origin_tf, candles=None):
+        # Значения TAAPI — по формирующемуся бару: запоминать их нельзя
+        calls.append(len(candles))
+        return {"atr": 0.6, "ema200": 100.0}
+
+    monkeypatch.setattr(mv, "fetch_pack", fake_fetch_pack)
+    monkeypatch.setattr(mv, "get_filters_12h", passing_filters)
+    monkeypatch.setattr(mv, "get_origin_indicators", taapi_origin)
+    monkeypatch.setattr(mv, "INDICATORS_SOURCE", "taapi")
+    monkeypatch.setattr(mv, "pack_ages", lambda pack: {})
+    mv.level_snapshots.clear()
+    mv.level_snapshots._by_kind.clear()
+
+    async def scenario():
+        for _ in range(3):
+            await mv.intraday_search(LevelSearchRequest(symbol="BTCUSDT", context="long", origin_tf="60m"))
+
+    asyncio.run(scenario())
+    assert calls == [400, 400, 400]
+    assert "origin" not in mv.level_snapshots.get_stats()["by_kind"]
+    mv.level_snapshots.clear()
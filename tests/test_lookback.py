@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import app.main_v2 as mv
+from app.services import lookback
+from app.services.candles import Candles
+from app.services.indicators import PACK_BARS, PACK_WARMUP, pack_indicators
+
+
+def _candles(n, step_ms=1_800_000, seed=1):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.5, n))
+    t = 1_735_689_600_000 + np.arange(n) * step_ms
+    return Candles.from_arrays(t, close, close + 1, close - 1, close, rng.uniform(1, 10, n))
+
+
+def test_fetch_size_is_max_declaration_plus_margin(monkeypatch):
+    monkeypatch.setattr(lookback, "_DECLARED", {})
+    lookback.declare_lookback("a", {"5m": 100, "30m": 50})
+    lookback.declare_lookback("b", {"30m": 20}, warmup=60)
+    sizes = lookback.required_bars(["5m", "30m", "4h"], margin=5, cap={"5m": 90})
+    assert sizes == {"5m": 90, "30m": 85, "4h": 5}
+    assert lookback.required_bars(["30m"], consumers=["a"]) == {"30m": 50}
+
+    klines = {"5m": _candles(40), "30m": _candles(300), "4h": _candles(3)}
+    assert lookback.bars_used(klines, ["a", "b"]) == {"5m": 40, "30m": 80}
+
+    # Потребитель всего ряда: ТФ запрашивается по верхней границе
+    lookback.declare_lookback("c", {"5m": lookback.WHOLE_SERIES})
+    assert lookback.required_bars(["5m", "30m"], margin=5, cap={"5m": 90, "30m": 500}) == {"5m": 90, "30m": 85}
+    assert lookback.bars_used(klines, ["a", "c"])["5m"] == 40
+    with pytest.raises(ValueError):
+        lookback.required_bars(["5m"])
+
+
+def test_pack_requests_shrink_to_declared_windows():
+    declared = lookback.declared()
+    assert {"levels", "session", "indicators_30m", "indicators_1h"} <= set(declared)
+    for tf, bars in mv.FETCH_BARS.items():
+        totals = [lb.total(tf) for lb in declared.values()]
+        need = mv.RESULTS[tf] if None in totals else min(max(totals) + mv.LOOKBACK_MARGIN_BARS, mv.RESULTS[tf])
+        assert bars == need
+    # Поиск уровней читает 5m..1h целиком — как раньше, по RESULTS_*; 4h не читается никем
+    assert all(mv.FETCH_BARS[tf] == mv.RESULTS[tf] for tf in ("5m", "15m", "30m", "1h"))
+    assert mv.FETCH_BARS["4h"] < mv.RESULTS["4h"]
+
+
+def test_consumers_ignore_history_beyond_their_window():
+    full = _candles(2000)
+    need = lookback.declared()["session"].total("30m")
+    assert mv.build_session_info(full, None) == mv.build_session_info(full.tail(need), None)
+    assert pack_indicators(full) == pack_indicators(full.tail(PACK_BARS + PACK_WARMUP))
@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime, timezone
+
+from app.services.prefetch import PrefetchScheduler
+
+TFS = ["5m", "15m", "30m", "1h", "4h"]
+
+
+def _ts(hh, mm, ss=0):
+    return datetime(2025, 1, 1, hh, mm, ss, tzinfo=timezone.utc).timestamp()
+
+
+class _FakeTime:
+    def __init__(self, now):
+        self.now = now
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+class _Upstream:
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    async def refresh(self, symbol, tfs):
+        self.calls.append((self.clock(), symbol, list(tfs)))
+
+
+def _scheduler(ft, up, **kw):
+    return PrefetchScheduler(up.refresh, timeframes=TFS, clock=ft.clock, sleep=ft.sleep, **kw)
+
+
+def test_next_close_picks_closing_timeframes():
+    ft = _FakeTime(_ts(12, 2))
+    sch = _scheduler(ft, _Upstream(ft.clock))
+    assert sch.next_close() == (_ts(12, 5), ["5m"])
+    assert sch.next_close(_ts(11, 58)) == (_ts(12, 0), TFS)
+    assert sch.next_close(_ts(12, 58)) == (_ts(13, 0), ["5m", "15m", "30m", "1h"])
+
+
+def test_tick_and_drain_respect_rps_budget_and_report_lag():
+    ft = _FakeTime(_ts(11, 58))
+    up = _Upstream(ft.clock)
+    sch = _scheduler(ft, up, symbols=["BTCUSDT", "ETHUSDT"], hot_size=2, rps=2.0, delay=3.0)
+    sch.touch("solusdt")
+
+    async def cycle():
+        await sch.tick()
+        assert ft.now == _ts(12, 0, 3)
+        stats = sch.get_stats()
+        assert stats["backlog"] == 3 and stats["backlog_requests"] == 15
+        assert stats["backlog_eta_s"] == 7.5
+        await sch.drain()
+
+    asyncio.run(cycle())
+
+    assert [c[1] for c in up.calls] == ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+    assert all(c[2] == TFS for c in up.calls)
+    # Не больше rps запросов в секунду: каждый символ — 5 запросов, т.е. 2.5с бюджета
+    starts = [c[0] for c in up.calls]
+    assert [round(b - a, 6) for a, b in zip(starts, starts[1:])] == [2.5, 2.5]
+    stats = sch.get_stats()
+    assert stats["backlog"] == 0 and stats["refreshed"] == 3 and stats["requests"] == 15
+    assert stats["max_lag_s"] == 5.0 and stats["last_lag_s"] == 5.0
+
+
+def test_pending_jobs_merge_and_hot_set_is_bounded():
+    ft = _FakeTime(_ts(12, 2))
+    up = _Upstream(ft.clock)
+    sch = _scheduler(ft, up, symbols=["BTCUSDT"], hot_size=2, rps=0)
+    for s in ("AUSDT", "BUSDT", "CUSDT", "BUSDT"):
+        sch.touch(s)
+    assert sch.hot_set() == ["BTCUSDT", "BUSDT", "CUSDT"]
+
+    sch.schedule(_ts(12, 5), ["5m"])
+    sch.schedule(_ts(12, 15), ["5m", "15m"])
+    assert sch.get_stats()["backlog"] == 3 and sch.stats["merged"] == 3
+    asyncio.run(sch.drain())
+    assert [(s, tfs) for _, s, tfs in up.calls] == [
+        ("BTCUSDT", ["5m", "15m"]), ("BUSDT", ["5m", "15m"]), ("CUSDT", ["5m", "15m"]),
+    ]
+
+
+def test_refresh_errors_are_counted_and_do_not_stop_the_queue():
+    ft = _FakeTime(_ts(12, 2))
+    seen = []
+
+    async def flaky(symbol, tfs):
+        seen.append(symbol)
+        if symbol == "AUSDT":
+            raise RuntimeError("upstream down")
+
+    sch = PrefetchScheduler(flaky, timeframes=TFS, symbols=["AUSDT", "BUSDT"], rps=0,
+                            clock=ft.clock, sleep=ft.sleep)
+    sch.schedule(_ts(12, 5), ["5m"])
+    asyncio.run(sch.drain())
+    assert seen == ["AUSDT", "BUSDT"]
+    assert sch.stats["errors"] == 1 and sch.stats["refreshed"] == 1
@@ -0,0 +1,147 @@
+import asyncio
+
+import httpx
+
+from app.services.http_clients import HttpClientRegistry
+from app.services.rate_governor import (
+    RateGovernor,
+    PRIORITY_BACKGROUND,
+    PRIORITY_SIGNAL,
+    priority_scope,
+    request_weight,
+)
+
+TAAPI = "https://api.taapi.io/bulk"
+KLINES = "https://fapi.binance.com/fapi/v1/klines"
+
+
+class _FakeTime:
+    def __init__(self):
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+def _response(status, headers=None):
+    return httpx.Response(status, headers=headers or {})
+
+
+def test_endpoint_weights():
+    assert request_weight("binance_futures", "GET", KLINES, {"limit": 50}) == 1
+    assert request_weight("binance_futures", "GET", KLINES, {"limit": 500}) == 5
+    assert request_weight("binance_futures", "GET", KLINES, {"limit": 1500}) == 10
+    body = {"secret": "k", "construct": [{}, {}, {}]}
+    assert request_weight("taapi", "POST", TAAPI, json=body) == 3
+    assert request_weight("taapi", "GET", "https://api.taapi.io/rsi") == 1
+
+
+def test_bucket_paces_requests_and_separates_keys():
+    ft = _FakeTime()
+    gov = RateGovernor({"taapi": (2, 1.0)}, clock=ft.clock, sleep=ft.sleep)
+
+    async def main():
+        times = []
+        for _ in range(4):
+            await gov.acquire("GET", "https://api.taapi.io/rsi", params={"secret": "a"})
+            times.append(ft.now)
+        # Другой ключ — свой bucket, ждать не нужно
+        await gov.acquire("GET", "https://api.taapi.io/rsi", params={"secret": "b"})
+        times.append(ft.now)
+        return times
+
+    assert asyncio.run(main()) == [0.0, 0.0, 0.5, 1.0, 1.0]
+    stats = gov.get_stats()
+    assert len(stats["buckets"]) == 2
+    assert all("a" != k.split(":")[1] for k in stats["buckets"])  # ключ не раскрывается
+    # Неизвестные хосты не регулируются
+    assert asyncio.run(gov.acquire("GET", "https://api.coingecko.com/x")) is None
+
+
+def test_signal_requests_jump_ahead_of_background():
+    ft = _FakeTime()
+    gov = RateGovernor({"binance_futures": (1, 1.0)}, clock=ft.clock, sleep=ft.sleep)
+    order = []
+
+    async def call(name, priority):
+        with priority_scope(priority):
+            await gov.acquire("GET", KLINES, params={"limit": 10})
+        order.append((name, ft.now))
+
+    async def main():
+        await gov.acquire("GET", KLINES, params={"limit": 10})  # опустошаем bucket
+        bg = [asyncio.create_task(call(f"bg{i}", PRIORITY_BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0)
+        sig = asyncio.create_task(call("signal", PRIORITY_SIGNAL))
+        await asyncio.gather(*bg, sig)
+
+    asyncio.run(main())
+    names = [n for n, _ in order]
+    assert names.index("signal") <= 1
+    assert [t for _, t in order] == [1.0, 2.0, 3.0, 4.0]
+    assert gov.get_stats()["requests_by_priority"]["background"] == 3
+
+
+def test_retry_after_and_used_weight_are_learned():
+    ft = _FakeTime()
+    gov = RateGovernor({"binance_futures": (100, 60.0)}, clock=ft.clock, sleep=ft.sleep)
+
+    async def main():
+        b = await gov.acquire("GET", KLINES, params={"limit": 10})
+        # Другие процессы уже израсходовали почти весь лимит окна
+        gov.observe(b, _response(200, {"X-MBX-USED-WEIGHT-1M": "99"}))
+        assert b.tokens <= 1.0
+        gov.observe(b, _response(429, {"Retry-After": "7"}))
+        assert b.scale == 0.5
+        await gov.acquire("GET", KLINES, params={"limit": 10})
+        assert ft.now >= 7.0
+        for _ in range(20):
+            gov.observe(b, _response(200))
+        assert b.scale == 1.0
+
+    asyncio.run(main())
+    assert gov.get_stats()["buckets"]["binance_futures:default"]["throttled"] == 1
+
+
+def test_spot_used_weight_does_not_throttle_futures():
+    ft = _FakeTime()
+    gov = RateGovernor({"binance_futures": (100, 60.0), "binance_spot": (100, 60.0)},
+                       clock=ft.clock, sleep=ft.sleep)
+
+    async def main():
+        spot = await gov.acquire("GET", "https://api.binance.com/api/v3/klines", params={"limit": 10})
+        gov.observe(spot, _response(200, {"X-MBX-USED-WEIGHT-1M": "100"}))
+        futures = await gov.acquire("GET", KLINES, params={"limit": 10})
+        return spot, futures
+
+    spot, futures = asyncio.run(main())
+    assert spot is not futures and ft.now == 0.0
+    assert set(gov.get_stats()["buckets"]) == {"binance_spot:default", "binance_futures:default"}
+
+
+def test_http_registry_waits_for_retry_after_instead_of_backoff():
+    ft = _FakeTime()
+    gov = RateGovernor({"taapi": (10, 1.0)}, clock=ft.clock, sleep=ft.sleep)
+    calls = []
+
+    def handler(request):
+        calls.append(ft.now)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "2"})
+        return httpx.Response(200, json={"ok": True})
+
+    reg = HttpClientRegistry(governor=gov, max_retries=3)
+
+    async def main():
+        reg._clients[reg._host_key(TAAPI)] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        reg._stats[reg._host_key(TAAPI)] = {"requests": 0, "connections_opened": 0, "retries": 0, "errors": 0}
+        r = await reg.post(TAAPI, json={"secret": "k", "construct": [{}]})
+        await reg.aclose()
+        return r
+
+    assert asyncio.run(main()).json() == {"ok": True}
+    assert calls == [0.0, 2.0]
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from app.services.candles import Candles
+from app.services.resample import Resampler, resample, splice
+
+M5 = 300_000
+TF = {"15m": 900_000, "30m": 1_800_000, "1h": 3_600_000, "4h": 14_400_000}
+T0 = 1_735_689_600_000  # 2025-01-01 00:00 UTC
+
+
+def _base(n, start=T0, seed=5):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.3, n))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + rng.random(n)
+    low = np.minimum(open_, close) - rng.random(n)
+    vol = rng.uniform(1, 50, n)
+    return Candles.from_arrays(start + np.arange(n) * M5, open_, high, low, close, vol)
+
+
+def _exchange_bars(base, target_ms):
+    """Эталон: бары старшего ТФ, как их отдаёт биржа (полные бакеты по open time)."""
+    out = {}
+    for i in range(len(base)):
+        key = int(base.t[i]) // target_ms * target_ms
+        o, h, l, c, v = base.open[i], base.high[i], base.low[i], base.close[i], base.volume[i]
+        if key not in out:
+            out[key] = [o, h, l, c, v]
+        else:
+            bar = out[key]
+            bar[1] = max(bar[1], h); bar[2] = min(bar[2], l); bar[3] = c; bar[4] += v
+    return out
+
+
+def _assert_matches(derived, fetched):
+    assert len(derived) > 0
+    for i in range(len(derived)):
+        want = fetched[int(derived.t[i])]
+        got = [derived.open[i], derived.high[i], derived.low[i], derived.close[i], derived.volume[i]]
+        np.testing.assert_allclose(got, want, rtol=1e-12)
+
+
+@pytest.mark.parametrize("tf", list(TF))
+def test_resample_matches_exchange_bars_and_drops_leading_partial(tf):
+    full = _base(3000)
+    fetched = _exchange_bars(full, TF[tf])
+    # Базовая история начинается внутри бакетов старших ТФ (07:25 UTC)
+    base = full[89:]
+    derived = resample(base, M5, TF[tf])
+    assert derived.t[0] % TF[tf] == 0 and derived.t[0] >= base.t[0]
+    _assert_matches(derived, fetched)
+    # Последний (формирующийся) бар — частичный, как у биржи на текущий момент
+    forming = base[:-3]
+    partial = resample(forming, M5, TF[tf])
+    last = int(partial.t[-1])
+    in_bucket = forming.t >= last
+    assert partial.close[-1] == forming.close[-1]
+    assert partial.volume[-1] == pytest.approx(forming.volume[in_bucket].sum())
+
+
+def test_resample_rejects_misaligned_target_and_handles_short_series():
+    with pytest.raises(ValueError):
+        resample(_base(10), M5, 7 * 60_000)
+    assert len(resample(_base(2, start=T0 + M5), M5, TF["4h"])) == 0
+    assert len(resample(Candles.empty(), M5, TF["1h"])) == 0
+
+
+def test_incremental_resampler_matches_batch():
+    base = _base(500, start=T0 + 7 * M5)
+    for tf, ms in TF.items():
+        r = Resampler(M5, ms, max_bars=1000)
+        closed = []
+        for i in range(len(base)):
+            bar = r.update({"t": int(base.t[i]), "open": base.open[i], "high": base.high[i],
+                            "low": base.low[i], "close": base.close[i], "volume": base.volume[i]})
+            if bar is not None:
+                closed.append(bar["t"])
+        batch = resample(base, M5, ms)
+        inc = r.candles()
+        np.testing.assert_array_equal(inc.t, batch.t)
+        np.testing.assert_allclose(inc.volume, batch.volume)
+        np.testing.assert_allclose(inc.high, batch.high)
+        # Закрытые бары отдаются по мере завершения бакета; последний бакет ещё формируется
+        assert closed == list(batch.t[:-1]) or closed == list(batch.t)
+        # Повторная подача последнего бара игнорируется
+        assert r.update({"t": int(base.t[-1]), "open": 1, "high": 1, "low": 1, "close": 1, "volume": 1}) is None
+
+
+def test_splice_extends_history_and_detects_gaps():
+    full = _base(3000)
+    history = resample(full[:2000], M5, TF["1h"])
+    derived = resample(full[1500:], M5, TF["1h"])
+    spliced = splice(history, derived, TF["1h"], max_bars=200)
+    reference = resample(full, M5, TF["1h"]).tail(200)
+    np.testing.assert_array_equal(spliced.t, reference.t)
+    np.testing.assert_allclose(spliced.close, reference.close)
+    np.testing.assert_allclose(spliced.volume, reference.volume)
+
+    old = resample(full[:500], M5, TF["1h"])
+    assert splice(old, derived, TF["1h"]) is None
+    assert splice(None, derived, TF["1h"]) is None
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.candles import Candles
+from app.services.swings import swing_indices
+from app.services.taapi_bulk import TaapiBulkService, swing_points
+from backtest_levels.levels_svet.zones import _swing_highs, _swing_lows
+
+
+# --- прежние циклические реализации (эталон) ---------------------------------
+
+def _loop_swing_points(hs, ls, left, right):
+    highs, lows = [], []
+    for i in range(left, len(hs) - right):
+        h = hs[i]
+        if all(h >= hs[j] for j in range(i - left, i + right + 1) if j != i):
+            highs.append((i, h))
+        l = ls[i]
+        if all(l <= ls[j] for j in range(i - left, i + right + 1) if j != i):
+            lows.append((i, l))
+    return highs, lows
+
+
+def _loop_strict(vals, find_min):
+    out = []
+    for i in range(2, len(vals) - 2):
+        nb = (vals[i - 2], vals[i - 1], vals[i + 1], vals[i + 2])
+        if all((vals[i] < v) if find_min else (vals[i] > v) for v in nb):
+            out.append(float(vals[i]))
+    return out
+
+
+def _series(n, seed, decimals=1):
+    rng = np.random.default_rng(seed)
+    # Округление даёт много равных соседей — проверка семантики ничьих
+    close = np.round(100 + np.cumsum(rng.normal(0, 0.5, n)), decimals)
+    high = close + np.round(rng.uniform(0, 1, n), decimals)
+    low = close - np.round(rng.uniform(0, 1, n), decimals)
+    t = 1_735_689_600_000 + np.arange(n) * 300_000
+    return Candles.from_arrays(t, close, high, low, close, np.ones(n))
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("left,right", [(2, 2), (1, 3), (5, 5), (0, 2), (3, 0)])
+def test_swing_points_matches_loop(seed, left, right):
+    c = _series(300, seed)
+    assert swing_points(c, left, right) == _loop_swing_points(c.high.tolist(), c.low.tolist(), left, right)
+
+
+def test_edges_nan_and_short_series():
+    c = _series(4, 0)
+    assert swing_points(c, 2, 2) == ([], [])
+    vals = [1.0, 2.0, np.nan, 2.0, 1.0, 3.0, 1.0, 0.5, 1.0]
+    assert swing_indices(vals, 1, 1).tolist() == [5]
+    assert swing_indices(vals, 1, 1, find_min=True).tolist() == [4, 7]
+    assert swing_indices([1.0, 1.0, 1.0], 1, 1).tolist() == [1]
+    assert swing_indices([1.0, 1.0, 1.0], 1, 1, strict=True).tolist() == []
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_zones_and_find_peaks_match_loop(seed):
+    c = _series(500, seed)
+    df = pd.DataFrame({"high": c.high, "low": c.low})
+    assert _swing_highs(df) == _loop_strict(c.high, find_min=False)
+    assert _swing_lows(df) == _loop_strict(c.low, find_min=True)
+
+    svc = TaapiBulkService()
+    data = c.low.tolist()
+    peaks = svc._find_peaks(data, window=5, find_min=True)
+    expected = [(i, p) for i, p in _loop_swing_points(data, data, 5, 5)[1]]
+    touches = {i: sum(abs(v - p) <= p * 0.001 for v in data) for i, p in expected}
+    expected.sort(key=lambda x: touches[x[0]], reverse=True)
+    assert [(p["index"], p["price"], p["strength"]) for p in peaks] == \
+        [(i, p, touches[i]) for i, p in expected[:5]]
+
+
+def test_levels_svet_imports_without_service_path():
+    # Бэктест не зависит от каталога сервиса в sys.path
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+    code = "import sys, backtest_levels.levels_svet.zones; assert 'app' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], cwd=root, env=env, check=True)
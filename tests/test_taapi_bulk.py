@@ -0,0 +1,122 @@
+import asyncio
+
+import app.services.taapi_bulk as tb
+from app.services.taapi_bulk import construct_candles, construct_indicator, plan_bulk
+
+
+def _cursor_constructs(symbol="BTCUSDT"):
+    cs = [construct_indicator(ind, symbol, "4h", {"period": 14})
+          for ind in ("adx", "plusdi", "minusdi", "macd", "atr", "obv", "mfi", "bbands")]
+    cs += [construct_indicator(ind, symbol, "12h", {"period": 14})
+           for ind in ("adx", "plusdi", "minusdi", "macd", "atr")]
+    cs.append(construct_candles(symbol, "4h", 200))
+    return cs
+
+
+def test_plan_merges_by_symbol_interval_and_respects_limits():
+    requests, owners = plan_bulk(_cursor_constructs(), max_indicators=20, max_constructs=1)
+    assert len(requests) == 2
+    assert [len(r[0]["indicators"]) for r in requests] == [9, 5]
+    assert sorted(i for ids in owners.values() for i in ids) == list(range(14))
+
+    requests, _ = plan_bulk(_cursor_constructs(), max_indicators=4, max_constructs=10)
+    assert len(requests) == 1
+    assert [len(c["indicators"]) for c in requests[0]] == [4, 4, 1, 4, 1]
+
+
+def test_plan_deduplicates_identical_indicators():
+    cs = [construct_indicator("ema", "ETHUSDT", "30m", {"period": 200})] * 2
+    requests, owners = plan_bulk(cs)
+    assert len(requests[0][0]["indicators"]) == 1
+    assert owners == {"c0": [0, 1]}
+
+
+def test_taapi_bulk_maps_ids_back_to_original_order(monkeypatch):
+    sent = []
+
+    class _Resp:
+        def __init__(self, payload):
+            self._payload = payload
+
+        def json(self):
+            return self._payload
+
+    async def fake_post(url, json=None, **kwargs):
+        sent.append(json)
+        constructs = json["construct"] if isinstance(json["construct"], list) else [json["construct"]]
+        # Ответ в обратном порядке — сопоставление должно идти по id, а не по позиции
+        data = [{"id": ind["id"], "indicator": ind["indicator"], "result": {"value": float(ind["id"][1:])}, "errors": []}
+                for c in constructs for ind in c["indicators"]]
+        return _Resp({"data": list(reversed(data))})
+
+    monkeypatch.setattr(tb, "TAAPI_KEY", "test")
+    monkeypatch.setattr(tb.http_clients, "post", fake_post)
+    constructs = _cursor_constructs() + [construct_indicator("atr", "ETHUSDT", "4h", {"period": 14})]
+    out = asyncio.run(tb.taapi_bulk(constructs))
+
+    assert len(sent) == 3
+    values = [tb.parse_indicator_value(r) for r in out["results"]]
+    assert values == [float(i) for i in range(len(constructs))]
+
+
+def _bulk_candles_result(construct, n=5):
+    t0 = 1_735_689_600_000
+    rows = [{"timestamp": t0 + i * 60_000, "open": 1.0 + i, "high": 2.0 + i, "low": 0.5 + i,
+             "close": 1.5 + i, "volume": 10.0} for i in range(n)]
+    return {"data": [{"id": "c0", "indicator": "candles", "result": rows, "errors": []}]}
+
+
+def test_klines_bulk_runs_batches_concurrently_and_retries_only_failed(monkeypatch):
+    calls = []
+    state = {"in_flight": 0, "max": 0}
+    flaky = {("ETH/USDT", "1h")}
+
+    async def fake_bulk(constructs, return_exceptions=False):
+        calls.append([(c["symbol"], c["interval"]) for c in constructs])
+        state["in_flight"] += 1
+        state["max"] = max(state["max"], state["in_flight"])
+        try:
+            # Батч с BTC медленнее остальных
+            await asyncio.sleep(0.3 if any(c["symbol"] == "BTC/USDT" for c in constructs) else 0.05)
+        finally:
+            state["in_flight"] -= 1
+        results = []
+        for c in constructs:
+            key = (c["symbol"], c["interval"])
+            if key in flaky:
+                flaky.discard(key)  # первая попытка — без данных
+                results.append({"data": []})
+            else:
+                results.append(_bulk_candles_result(c))
+        return {"results": results}
+
+    monkeypatch.setattr(tb, "taapi_bulk", fake_bulk)
+    monkeypatch.setattr(tb, "candle_store", tb.candle_store.__class__())
+    monkeypatch.setattr(tb, "KLINES_BULK_RETRY_BACKOFF_MS", 1)
+    symbols = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT"]
+    svc = tb.TaapiBulkService()
+
+    async def scenario():
+        out = []
+        async for symbol, interval, candles in svc.iter_klines_bulk(symbols, ["1h", "4h"], concurrency=3, batch_size=2):
+            out.append((symbol, interval, len(candles)))
+        return out
+
+    out = asyncio.run(scenario())
+    assert sorted((s, i) for s, i, _ in out) == sorted((s, i) for s in symbols for i in ("1h", "4h"))
+    assert all(n == 5 for _, _, n in out)
+    # 4 батча, не больше 3 одновременно; медленный BTC-батч отдаётся последним
+    assert state["max"] == 3 and out[-1][0] == "BTCUSDT"
+    # Повторён только construct без свечей, а не весь батч
+    assert calls.count([("ETH/USDT", "1h")]) == 1 and len(calls) == 5
+
+
+def test_parse_bulk_candles_builds_arrays_from_rows():
+    rows = [{"timestamp": 1_735_689_660, "o": 2, "h": 3, "l": 1, "c": "2.5", "v": None},
+            {"time": "2025-01-01T00:00:00Z", "o": 1, "h": 2, "l": 0.5, "c": 1.5, "v": 3},
+            {"o": 9}]
+    for payload in ({"data": rows}, {"data": [{"indicator": "candles", "result": rows}]}):
+        c = tb.parse_bulk_candles(payload)
+        assert c.t.tolist() == [1_735_689_600_000, 1_735_689_660_000]
+        assert c.close.tolist() == [1.5, 2.5] and c.volume.tolist() == [3.0, 0.0]
+        assert c.high.dtype.name == "float64" and c.t.dtype.name == "int64"
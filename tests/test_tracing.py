@@ -0,0 +1,80 @@
+import asyncio
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import app.main_v2 as mv
+from app.services.candle_store import TF_MS
+from app.services.candles import Candles
+from app.services.tracing import Histogram, request_trace, span, tracer
+
+
+def test_histogram_quantiles_and_trace_summary():
+    h = Histogram()
+    for ms in [0.5] * 90 + [30] * 9 + [20000]:
+        h.observe(ms)
+    d = h.to_dict()
+    assert d["count"] == 100 and d["p50_ms"] == 1.0 and d["p95_ms"] == 50.0
+    assert d["p99_ms"] == 50.0 and d["max_ms"] == 20000 and d["buckets"]["inf"] == 1
+
+    async def scenario():
+        with request_trace("test") as trace:
+            async def child(tf):
+                with span(f"fetch.{tf}"):
+                    await asyncio.sleep(0.01)
+            await asyncio.gather(child("5m"), child("1h"))
+            with span("session"):
+                pass
+            with span("session"):
+                pass
+        return trace
+
+    trace = asyncio.run(scenario())
+    summary = trace.summary()
+    # Спаны дочерних задач попадают в трассу запроса, повторы суммируются
+    assert summary["fetch.5m"] >= 9 and summary["fetch.1h"] >= 9
+    assert [name for name, _ in trace.spans].count("session") == 2
+    assert summary["total"] >= summary["fetch.5m"]
+    assert "fetch.5m;dur=" in trace.server_timing()
+
+
+def test_intraday_search_reports_server_timing_and_histograms(monkeypatch):
+    async def fake_direct(symbol, tf, results):
+        await asyncio.sleep(0.02 if tf == "1h" else 0.0)
+        n = max(results, 200)
+        close = 100 + np.sin(np.arange(n) / 5.0)
+        t = 1_735_689_600_000 + np.arange(n) * TF_MS[tf]
+        return Candles.from_arrays(t, close, close + 0.5, close - 0.5, close, np.ones(n))
+
+    async def blocked_filters(symbol):
+        return {"rsi12h": None, "ema200_12h": None}
+
+    monkeypatch.setattr(mv, "get_candles_direct", fake_direct)
+    monkeypatch.setattr(mv, "get_filters_12h", blocked_filters)
+    monkeypatch.setattr(mv, "INDICATORS_SOURCE", "local")
+    monkeypatch.setattr(mv, "_upstream_sem", asyncio.Semaphore(8))
+    mv.cache.clear()
+    tracer.reset()
+
+    client = TestClient(mv.app)
+    body = {"symbol": "BTCUSDT", "context": "long", "debug": True}
+    resp = client.post("/levels/intraday-search", json=body)
+    assert resp.status_code == 200
+    header = dict(part.split(";dur=") for part in resp.headers["Server-Timing"].split(", "))
+    for stage in ("cache", "fetch.5m", "fetch.1h", "session", "filters_12h", "total"):
+        assert stage in header
+    assert float(header["fetch.1h"]) >= 15
+    assert float(header["cache"]) >= float(header["fetch.1h"])
+    timings = resp.json()["timings"]
+    assert timings["cache"] >= 15 and "session" in timings
+
+    # Без debug поле не заполняется, заголовок — есть
+    resp = client.post("/levels/intraday-search", json={**body, "debug": False})
+    assert resp.json()["timings"] is None and "Server-Timing" in resp.headers
+
+    stages = client.get("/metrics/latency").json()["stages"]
+    assert stages["/levels/intraday-search"]["count"] == 2
+    assert stages["fetch.1h"]["count"] == 1  # второй запрос — из кэша
+    assert stages["cache"]["count"] == 2
+    mv.cache.clear()
+
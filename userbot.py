@@ -17,6 +17,13 @@ from signal_webhook.payload import build_payload, build_close_payload
 from signal_webhook.sender import send_payload
 from levels_repo import upsert_levels, get_latest_levels, import_levels_from_log
 
+# Общий HTTP-пул с регулятором частоты из сервиса intraday-levels-taapi;
+# пакет `app` сервиса — в PYTHONPATH
+try:
+    from app.services.http_clients import http_clients
+except Exception:  # без сервиса — прямые запросы без регулятора
+    http_clients = None
+
 # Конфигурация
 load_dotenv()
 api_id = 29129135
@@ -1012,16 +1019,18 @@ async def _get_rsi_1h_taapi(symbol_usdt: str) -> float:
         return None
     try:
         import httpx
-        ta_symbol = _to_taapi_symbol(symbol_usdt)
-        url = (
-            "https://api.taapi.io/rsi?"
-            f"secret={TAAPI_KEY}&exchange=binance&symbol={ta_symbol}&interval=1h"
-        )
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            r = await client.get(url)
-            r.raise_for_status()
-            jd = r.json()
-            return float(jd.get("value")) if jd and jd.get("value") is not None else None
+        url = "https://api.taapi.io/rsi"
+        params = {"secret": TAAPI_KEY, "exchange": "binance",
+                  "symbol": _to_taapi_symbol(symbol_usdt), "interval": "1h"}
+        if http_clients is not None:
+            # Общий пул: регулятор TAAPI (acquire/observe) и политика повторов на каждую попытку
+            r = await http_clients.get(url, params=params, timeout=15.0)
+        else:
+            async with httpx.AsyncClient(timeout=15.0) as client:
+                r = await client.get(url, params=params)
+                r.raise_for_status()
+        jd = r.json()
+        return float(jd.get("value")) if jd and jd.get("value") is not None else None
     except Exception:
         return None
 
@@ -1281,6 +1290,70 @@ def _calculate_order_volumes(first_price: float, last_price: float, sl_price: fl
         print(f"[DEBUG] Ошибка расчета объемов: {e}")
         return [0] * 5
 
+# Закрытые бары 12h по символам (окно EMA200); переживают рестарты через STREAM_STATE_FILE
+STREAM_STATE_FILE = os.environ.get("STREAM_STATE_FILE", "stream_state.json")
+_12H_MS = 12 * 3600 * 1000
+_EMA200_WINDOW = 200
+_closes_12h: dict | None = None
+
+def _closes_12h_states() -> dict:
+    """symbol -> {"last_t": open time последнего закрытого бара, "closes": до 199 закрытых close}."""
+    global _closes_12h
+    if _closes_12h is None:
+        _closes_12h = {}
+        try:
+            with open(STREAM_STATE_FILE, "r", encoding="utf-8") as f:
+                _closes_12h = json.load(f).get("closes_12h", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[DEBUG] Не удалось загрузить состояние индикаторов: {e}")
+    return _closes_12h
+
+def _save_closes_12h_states() -> None:
+    try:
+        tmp = STREAM_STATE_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"closes_12h": _closes_12h_states()}, f)
+        os.replace(tmp, STREAM_STATE_FILE)
+    except Exception as e:
+        print(f"[DEBUG] Не удалось сохранить состояние индикаторов: {e}")
+
+async def _closes_12h_window(client, symbol_usdt: str):
+    """Close последних 200 баров 12h (последний — формирующийся), как в запросе limit=200.
+    Закрытые бары хранятся между вызовами: с Binance догружаются только новые."""
+    states = _closes_12h_states()
+    state = states.get(symbol_usdt)
+    limit = _EMA200_WINDOW
+    if state is not None:
+        missing = (int(datetime.now().timestamp() * 1000) - state["last_t"]) // _12H_MS + 2
+        if missing < _EMA200_WINDOW:
+            limit = max(2, int(missing))
+        else:
+            state = None  # слишком большой разрыв — берём окно целиком
+    r = await client.get("https://api.binance.com/api/v3/klines",
+                         params={"symbol": symbol_usdt, "interval": "12h", "limit": limit})
+    if r.status_code != 200:
+        return None
+    klines = r.json()
+    if not klines:
+        return None
+    closes = list(state["closes"]) if state is not None else []
+    last_t = state["last_t"] if state is not None else None
+    absorbed = False
+    for k in klines[:-1]:
+        if last_t is not None and int(k[0]) <= last_t:
+            continue
+        closes.append(float(k[4]))
+        last_t = int(k[0])
+        absorbed = True
+    closes = closes[-(_EMA200_WINDOW - 1):]
+    # Файл переписывается только когда закрылся новый бар 12h
+    if absorbed:
+        states[symbol_usdt] = {"last_t": last_t, "closes": closes}
+        _save_closes_12h_states()
+    return closes + [float(klines[-1][4])]
+
 async def _get_rsi_ema_12h(symbol_usdt: str):
     """Получает RSI 12h через Taapi и EMA200 12h локально по Binance API"""
     try:
@@ -1311,21 +1384,15 @@ async def _get_rsi_ema_12h(symbol_usdt: str):
                     pass
                 
             # EMA200 12h
-            ema_url = f"https://api.binance.com/api/v3/klines?symbol={symbol_usdt}&interval=12h&limit=200"
-            ema_response = await client.get(ema_url)
-            
-            if ema_response.status_code == 200:
-                klines = ema_response.json()
-                if len(klines) >= 200:
-                    # Простой расчет EMA200
-                    closes = [float(k[4]) for k in klines[-200:]]
-                    multiplier = 2 / (200 + 1)
-                    ema = closes[0]  # Начальное значение
-                    
-                    for close in closes[1:]:
-                        ema = (close * multiplier) + (ema * (1 - multiplier))
-                else:
-                    ema = None
+            closes = await _closes_12h_window(client, symbol_usdt)
+            if closes is not None and len(closes) >= 200:
+                # Простой расчет EMA200
+                closes = closes[-200:]
+                multiplier = 2 / (200 + 1)
+                ema = closes[0]  # Начальное значение
+
+                for close in closes[1:]:
+                    ema = (close * multiplier) + (ema * (1 - multiplier))
             else:
                 ema = None
                 